@@ -0,0 +1,154 @@
+import argparse
+import contextlib
+import fnmatch
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Optional
+
+from .batch import BatchDenoiser, stream_denoise_file
+
+def find_inputs(paths, pattern: str = '*.wav'):
+    """(input path, path relative to its root) of every file under ``paths`` matching ``pattern``
+
+    ``paths`` may mix directories, which are searched recursively, files,
+    and text files listing one path per line when prefixed with ``@``.
+    Files found in a directory are relative to that directory; files given
+    directly or listed are relative to the common directory of all of them,
+    so ``day1/call.wav`` and ``day2/call.wav`` keep apart.
+    """
+    inputs = []
+    for path in paths:
+        if path.startswith('@'):
+            with open(path[1:]) as f:
+                listed = [line.strip() for line in f if line.strip()]
+            inputs.extend((item, None) for item in listed)
+        elif os.path.isdir(path):
+            for directory, subdirectories, files in os.walk(path):
+                subdirectories.sort()
+                for name in sorted(files):
+                    if fnmatch.fnmatch(name.lower(), pattern.lower()):
+                        full = os.path.join(directory, name)
+                        inputs.append((full, os.path.relpath(full, path)))
+        else:
+            inputs.append((path, None))
+
+    loose = [os.path.abspath(path) for path, relative in inputs if relative is None]
+    if loose:
+        root = os.path.commonpath([os.path.dirname(path) for path in loose])
+        inputs = [(path, os.path.relpath(os.path.abspath(path), root) if relative is None else relative)
+                  for path, relative in inputs]
+    return inputs
+
+def is_finished(input_path: str, output_path: str):
+    """Whether ``output_path`` was completed after ``input_path`` last changed
+
+    Outputs only appear once fully written, so an existing output newer than
+    its input is a finished file from an earlier, possibly interrupted, run.
+    """
+    return (os.path.exists(output_path) and
+            os.path.getmtime(output_path) >= os.path.getmtime(input_path))
+
+def _denoise_job(input_path: str, output_path: str, denoiser: BatchDenoiser, block_size: int):
+    """Denoise one file in a worker process with its own noise state"""
+    try:
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        with contextlib.redirect_stdout(io.StringIO()):  # Keep per-file learning messages out of the log
+            audio_seconds, wall_seconds = stream_denoise_file(input_path, output_path, denoiser, block_size)
+        return {'input': input_path, 'audio_seconds': audio_seconds, 'wall_seconds': wall_seconds}
+    except Exception as e:
+        return {'input': input_path, 'error': f"{type(e).__name__}: {e}"}
+
+def denoise_archive(inputs, output_dir: str, denoiser: Optional[BatchDenoiser] = None,
+                    workers: Optional[int] = None, block_size: int = 1 << 16, overwrite: bool = False):
+    """Denoise ``(input, relative path)`` pairs into ``output_dir`` across a process pool
+
+    Every file is streamed in blocks and learns its own noise profile.
+    Finished outputs are skipped unless ``overwrite`` is set, so an
+    interrupted run picks up where it stopped. Raises ValueError before
+    starting if two inputs would be written to the same output. Returns a summary with the
+    throughput in audio seconds per wall second per worker.
+    """
+    denoiser = denoiser or BatchDenoiser()
+    jobs = []
+    sources = {}  # Output path to the input written there
+    for path, relative in inputs:
+        output = os.path.join(output_dir, relative)
+        key = os.path.normcase(os.path.abspath(output))
+        if key in sources:
+            if os.path.abspath(sources[key]) != os.path.abspath(path):
+                raise ValueError(f"{sources[key]} and {path} would both be written to {output}")
+            continue  # The same file given twice
+        sources[key] = path
+        jobs.append((path, output))
+    pending = [(path, output) for path, output in jobs if overwrite or not is_finished(path, output)]
+    skipped = len(jobs) - len(pending)
+    if skipped:
+        print(f"Skipping {skipped} finished file(s)")
+    workers = max(1, min(workers or os.cpu_count() or 1, len(pending)))
+
+    audio_seconds = 0.0
+    busy_seconds = 0.0
+    failed = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_denoise_job, path, output, denoiser, block_size) for path, output in pending]
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                result = future.result()
+                if 'error' in result:
+                    failed.append(result)
+                    print(f"[{done}/{len(pending)}] Failed {result['input']}: {result['error']}")
+                    continue
+                audio_seconds += result['audio_seconds']
+                busy_seconds += result['wall_seconds']
+                print(f"[{done}/{len(pending)}] {result['input']}: {result['audio_seconds']:.1f} s in "
+                      f"{result['wall_seconds']:.2f} s")
+        except KeyboardInterrupt:
+            # Finished outputs are complete, so the next run resumes from them
+            for future in futures:
+                future.cancel()
+            raise
+    wall_seconds = time.perf_counter() - start
+
+    return {
+        'files': len(pending) - len(failed),
+        'skipped': skipped,
+        'failed': failed,
+        'workers': workers,
+        'audio_seconds': audio_seconds,
+        'wall_seconds': wall_seconds,
+        'speed_per_worker': audio_seconds / max(wall_seconds * workers, 1e-9),
+        'utilization': busy_seconds / max(wall_seconds * workers, 1e-9),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Denoise every WAV file of a directory tree or file list in parallel")
+    parser.add_argument("inputs", nargs='+', help="directories, WAV files or @lists of files")
+    parser.add_argument("--output-dir", required=True, help="directory the denoised files are written to")
+    parser.add_argument("--pattern", default='*.wav', help="file name pattern searched for in directories")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--block-size", type=int, default=1 << 16, help="samples read and denoised at a time")
+    parser.add_argument("--chunk-size", type=int, default=1024, help="FFT frame size in samples")
+    parser.add_argument("--hop-size", type=int, default=None, help="frame hop in samples (default: chunk size / 2)")
+    parser.add_argument("--no-normalize", action="store_true", help="keep the output level instead of peak normalizing")
+    parser.add_argument("--overwrite", action="store_true", help="denoise files whose output is already finished")
+    args = parser.parse_args(argv)
+
+    inputs = find_inputs(args.inputs, args.pattern)
+    if not inputs:
+        print("No input files found")
+        return
+
+    denoiser = BatchDenoiser(chunk_size=args.chunk_size, hop_size=args.hop_size, normalize=not args.no_normalize)
+    try:
+        summary = denoise_archive(inputs, args.output_dir, denoiser, args.workers, args.block_size, args.overwrite)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Denoised {summary['files']} file(s), {summary['audio_seconds']:.1f} s of audio in "
+          f"{summary['wall_seconds']:.1f} s on {summary['workers']} worker(s): "
+          f"{summary['speed_per_worker']:.1f}x real time per worker, "
+          f"{100 * summary['utilization']:.0f}% busy")
+    if summary['failed']:
+        print(f"{len(summary['failed'])} file(s) failed")
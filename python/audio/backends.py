@@ -0,0 +1,262 @@
+import threading
+import time
+import weakref
+from typing import Callable, Optional
+
+import numpy as np
+
+class SoundDeviceBackend:
+    """Stream backend for real audio hardware through sounddevice
+
+    sounddevice loads the PortAudio library when imported, so the import
+    is deferred until the first device query or stream.
+    """
+
+    def __init__(self):
+        self._sd = None
+        self._streams = weakref.WeakSet()  # Streams that may still be open
+        self._lock = threading.Lock()  # Keeps rescans and stream creation apart
+
+    @property
+    def sd(self):
+        """The sounddevice module, imported on first use"""
+        if self._sd is None:
+            import sounddevice
+            self._sd = sounddevice
+        return self._sd
+
+    def query_devices(self, device=None):
+        """Device list, or the info dict of one device"""
+        with self._lock:
+            return self.sd.query_devices(device)
+
+    def query_hostapis(self):
+        """Info dicts of the host APIs, indexed by a device's ``hostapi``"""
+        with self._lock:
+            return self.sd.query_hostapis()
+
+    def check_settings(self, device, kind: str, channels: int, samplerate: int):
+        """Whether the device opens with these settings in the 'input' or 'output' direction"""
+        check = self.sd.check_input_settings if kind == 'input' else self.sd.check_output_settings
+        try:
+            with self._lock:
+                check(device=device, channels=channels, samplerate=samplerate)
+        except Exception:
+            return False
+        return True
+
+    def rescan(self):
+        """Reinitialize PortAudio so devices plugged in since are listed
+
+        PortAudio fixes its device list when initialized. Reinitializing
+        would end any open stream, so this returns False without doing so
+        while one is open. sounddevice only offers reinitialization through
+        private functions; without them the list stays as PortAudio has it.
+        """
+        with self._lock:
+            if any(not stream.closed for stream in self._streams):
+                return False
+            sd = self.sd
+            if hasattr(sd, '_terminate') and hasattr(sd, '_initialize'):
+                sd._terminate()
+                sd._initialize()
+            return True
+
+    def open_stream(self, device, channels, samplerate: int, blocksize: int, callback):
+        """Create a duplex stream; use it as a context manager"""
+        with self._lock:
+            stream = self.sd.Stream(device=device, channels=channels, samplerate=samplerate,
+                                    blocksize=blocksize, callback=callback)
+            self._streams.add(stream)
+        return stream
+
+    def sleep(self, milliseconds: int):
+        """Wait while the stream runs"""
+        self.sd.sleep(milliseconds)
+
+class StreamTime:
+    """Buffer timestamps passed to the callback, like sounddevice's time struct"""
+
+    def __init__(self, current: float, adc: float, dac: float):
+        self.currentTime = current
+        self.inputBufferAdcTime = adc
+        self.outputBufferDacTime = dac
+
+class VirtualStream:
+    """Stand-in for ``sounddevice.Stream`` that plays an array into the callback
+
+    A thread feeds consecutive blocks of ``audio``, from sample ``start`` on,
+    to the callback as ``indata`` and records every ``outdata`` block into
+    ``output``, either paced in real time or as fast as the callback
+    returns. A fast stream calls ``pace``, when given, before every block
+    but its first, so it can wait for whatever consumes the blocks, e.g.
+    a processing thread behind the callback. Like a duplex device, each
+    output block is heard one block plus ``device_latency`` after its input
+    was captured, and is recorded at that position. The stream stops by
+    itself once the input is exhausted.
+    """
+
+    def __init__(self, audio, channels, samplerate: int, blocksize: int, callback,
+                 realtime: bool = True, device_latency: float = 0.0, start: int = 0, output=None,
+                 exhausted: Optional[threading.Event] = None, pace: Optional[Callable[[], object]] = None):
+        self.audio = audio
+        self.input_channels, self.output_channels = channels
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.callback = callback
+        self.realtime = realtime
+        self.pace = pace
+        self.latency = (device_latency / 2, device_latency / 2)
+        self.position = start  # Next sample of ``audio`` to play
+        self.blocks = (len(audio) - start) // blocksize
+        self._output_offset = blocksize + int(round(device_latency * samplerate))
+        if output is None:
+            output = np.zeros((len(audio) + self._output_offset, self.output_channels), dtype=np.float32)
+        self.output = output
+        self.late_blocks = 0  # Callbacks that overran their real-time slot
+        self.active = False
+        self.finished = threading.Event()
+        self.exhausted = exhausted or threading.Event()  # Set once every input block was played
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """Start calling back on the stream thread"""
+        self.active = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop after the current block and wait for the stream thread"""
+        self.active = False
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def wait(self, timeout: Optional[float] = None):
+        """Block until all input has been played or the stream was stopped"""
+        return self.finished.wait(timeout)
+
+    def _run(self):
+        """Deliver every input block to the callback"""
+        block_duration = self.blocksize / self.samplerate
+        indata = np.zeros((self.blocksize, self.input_channels), dtype=np.float32)
+        outdata = np.zeros((self.blocksize, self.output_channels), dtype=np.float32)
+        start = time.perf_counter()
+        try:
+            self._play(indata, outdata, start, block_duration)
+        finally:
+            self.active = False
+            self.finished.set()
+
+    def _play(self, indata, outdata, start: float, block_duration: float):
+        """Callback loop of the stream thread"""
+        for index in range(self.blocks):
+            if not self.active:
+                return
+            if index and not self.realtime and self.pace is not None:
+                self.pace()
+            block = self.audio[self.position:self.position + self.blocksize]
+            indata[:] = block[:, :self.input_channels]
+            adc = start + index * block_duration
+            self.callback(indata, outdata, self.blocksize,
+                          StreamTime(time.perf_counter(), adc - self.latency[0],
+                                     adc + block_duration + self.latency[1]), None)
+            position = self.position + self._output_offset
+            self.output[position:position + self.blocksize, :self.output_channels] = outdata
+            self.position += self.blocksize
+
+            if self.realtime:
+                remaining = start + (index + 1) * block_duration - time.perf_counter()
+                if remaining > 0:
+                    time.sleep(remaining)
+                else:
+                    self.late_blocks += 1
+        self.exhausted.set()
+
+class VirtualBackend:
+    """Stream backend that plays a recording instead of using sound hardware
+
+    Exposes one virtual input and one virtual output device. ``audio`` is a
+    (samples, channels) float array. It is played once across all streams:
+    a stream opened after another one, e.g. when the processor reopens it
+    to change the block size, carries on where the last one stopped. The
+    processed output is recorded at the matching positions of ``output``,
+    which has ``output_channels`` columns, by default as many as ``audio``.
+    Streams that are not real time pass ``pace`` on to every stream.
+    """
+
+    INPUT_NAME = 'Virtual Input'
+    OUTPUT_NAME = 'Virtual Output'
+
+    def __init__(self, audio, realtime: bool = True, device_latency: float = 0.0,
+                 output_channels: Optional[int] = None, pace: Optional[Callable[[], object]] = None):
+        self.audio = np.asarray(audio, dtype=np.float32).reshape(len(audio), -1)
+        self.output_channels = output_channels or self.audio.shape[1]
+        self.realtime = realtime
+        self.pace = pace  # Called before every fast block but a stream's first
+        self.device_latency = device_latency  # Simulated converter latency in seconds
+        self.stream = None
+        self._played = threading.Event()
+        self.rewind()
+
+    @property
+    def position(self):
+        """Samples of the recording played so far"""
+        return self.stream.position if self.stream is not None else self._position
+
+    @property
+    def late_blocks(self):
+        """Callbacks of all streams that overran their real-time slot"""
+        return self._late_blocks + (self.stream.late_blocks if self.stream is not None else 0)
+
+    def rewind(self):
+        """Play the recording from the start again with the next stream"""
+        self.stream = None
+        self.output = np.zeros((len(self.audio), self.output_channels), dtype=np.float32)
+        self._position = 0
+        self._late_blocks = 0
+        self._played.clear()
+
+    def query_devices(self, device=None):
+        """Device list, or the info dict of one device"""
+        devices = [
+            {'name': self.INPUT_NAME, 'index': 0, 'max_input_channels': self.audio.shape[1],
+             'max_output_channels': 0},
+            {'name': self.OUTPUT_NAME, 'index': 1, 'max_input_channels': 0,
+             'max_output_channels': self.output_channels},
+        ]
+        if device is None:
+            return devices
+        if isinstance(device, str):
+            return next(info for info in devices if info['name'] == device)
+        return devices[device]
+
+    def open_stream(self, device, channels, samplerate: int, blocksize: int, callback):
+        """Create a virtual duplex stream that continues the recording; use it as a context manager"""
+        if self.stream is not None:
+            self._position = self.stream.position
+            self._late_blocks += self.stream.late_blocks
+        # Room for this stream's output delay past the end of the recording
+        length = len(self.audio) + blocksize + int(round(self.device_latency * samplerate))
+        if len(self.output) < length:
+            self.output = np.concatenate((self.output, np.zeros((length - len(self.output), self.output_channels),
+                                                                dtype=np.float32)))
+        self.stream = VirtualStream(self.audio, channels, samplerate, blocksize, callback,
+                                    realtime=self.realtime, device_latency=self.device_latency,
+                                    start=self._position, output=self.output, exhausted=self._played,
+                                    pace=self.pace)
+        return self.stream
+
+    def sleep(self, milliseconds: int):
+        """Wait while the stream runs"""
+        time.sleep(milliseconds / 1000)
+
+    def wait(self, timeout: Optional[float] = None):
+        """Block until the whole recording has been played, by however many streams"""
+        return self._played.wait(timeout)
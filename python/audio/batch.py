@@ -0,0 +1,315 @@
+import argparse
+import itertools
+import os
+import time
+from typing import Optional
+
+import numpy as np
+from scipy.io import wavfile
+
+from .stft import StreamingSTFT, analysis_window, synthesis_window, frame_signal, overlap_add
+from .suppressor import NoiseSuppressor
+from .wavio import WavReader, WavWriter
+
+class BatchDenoiser:
+    """Offline spectral gating over whole recordings
+
+    The recording is framed into a 2-D matrix and the FFT, gating, median
+    smoothing and inverse FFT run over ``block_frames`` frames per NumPy
+    call. Gating uses the same ``NoiseSuppressor`` rules as the live path;
+    the slow noise-profile update is applied once per block of frames.
+    """
+
+    def __init__(self,
+                 chunk_size: int = 1024,
+                 hop_size: Optional[int] = None,
+                 block_frames: int = 64,
+                 normalize: bool = True,
+                 parameters: Optional[dict] = None):
+        self.chunk_size = chunk_size
+        self.hop_size = hop_size or chunk_size // 2
+        self.block_frames = block_frames
+        self.normalize = normalize
+        self.parameters = parameters or {}  # NoiseSuppressor attribute overrides
+
+        self.window = analysis_window(chunk_size)
+        self.synthesis_window = synthesis_window(self.window, self.hop_size)
+
+    def create_suppressor(self, sample_rate: int, channels: int = 1):
+        """Create a fresh noise suppressor with per-channel state"""
+        suppressor = NoiseSuppressor(sample_rate=sample_rate, channels=channels, chunk_size=self.chunk_size,
+                                     hop_size=self.hop_size)
+        for name, value in self.parameters.items():
+            setattr(suppressor, name, value)
+        suppressor._init_ac_bins()
+        return suppressor
+
+    def process(self, audio, sample_rate: int):
+        """Denoise a (samples,) or (samples, channels) array and return float32 audio"""
+        audio = np.asarray(audio, dtype=np.float32)
+        suppressor = self.create_suppressor(sample_rate, audio.reshape(len(audio), -1).shape[1])
+        dehummed = suppressor.hum_filter.process(audio) if suppressor.hum_removal else audio
+        channels = dehummed.reshape(len(audio), -1).T
+        processed = self._process_channels(channels, suppressor)
+        processed = processed.T.reshape(audio.shape)
+
+        if self.normalize:
+            processed /= np.max(np.abs(processed)) + 1e-6
+        return processed
+
+    def process_stream(self, blocks, sample_rate: int, channels: int = 1):
+        """Denoise an iterable of (samples, channels) blocks and yield float32 output blocks
+
+        The output blocks line up with the input and add up to its length,
+        but their sizes differ from the input blocks. Frames are gated
+        ``block_frames`` at a time exactly as in ``process``, so memory stays
+        bounded by the block sizes. The output is not normalized.
+        """
+        suppressor = self.create_suppressor(sample_rate, channels)
+        stft = StreamingSTFT(self.chunk_size, self.hop_size, channels)
+        gate = lambda spec: self._gate(spec, suppressor)
+        step = self.block_frames * self.hop_size
+        pending = np.zeros((0, channels))
+        skip = stft.latency  # Output samples that come before the first input sample
+        remaining = 0  # Input samples whose output has not been yielded yet
+
+        def trim(processed):
+            nonlocal skip, remaining
+            dropped = min(skip, len(processed))
+            skip -= dropped
+            processed = processed[dropped:dropped + remaining]
+            remaining -= len(processed)
+            return processed.astype(np.float32)
+
+        for block in blocks:
+            block = np.asarray(block).reshape(len(block), -1)
+            if suppressor.hum_removal:
+                block = suppressor.hum_filter.process(block)
+            remaining += len(block)
+            pending = np.concatenate((pending, block))
+            ready = len(pending) // step * step
+            if ready:
+                processed = trim(stft.process_batch(pending[:ready], gate))
+                pending = pending[ready:]
+                if len(processed):
+                    yield processed
+
+        # Flush the rest of the input and the STFT latency with whole hops of silence
+        length = -(-(len(pending) + stft.latency) // self.hop_size) * self.hop_size
+        tail = np.zeros((length, channels))
+        tail[:len(pending)] = pending
+        processed = trim(stft.process_batch(tail, gate))
+        if len(processed):
+            yield processed
+
+    def _gate(self, spec, suppressor):
+        """Gate a (frames, channels, bins) block of spectra in time order"""
+        magnitude = np.abs(spec)
+        energy = np.mean(magnitude ** 2, axis=-1)
+        gain = np.empty_like(magnitude)
+
+        # A tracked profile changes with every frame, each is gated against its own
+        if suppressor.noise_estimator == 'tracking':
+            profiles, stds = np.empty_like(magnitude), np.empty_like(magnitude)
+            for i, frame in enumerate(magnitude):
+                if not suppressor.freeze_noise_profile:
+                    suppressor.track_noise(frame)
+                profiles[i] = suppressor.noise_profile
+                stds[i] = suppressor.noise_std
+            return spec * suppressor.compute_gain(magnitude, energy, profiles, stds)
+
+        # Frames inside the learning phase are gated against the profile
+        # as it stood after each of them was learned
+        learned = 0
+        profiles, stds = [], []
+        while learned < len(spec) and suppressor.learning_noise:
+            suppressor.learn_noise(magnitude[learned])
+            if not suppressor.learning_noise:
+                break
+            profiles.append(suppressor.noise_profile)
+            stds.append(suppressor.noise_std)
+            learned += 1
+        if learned:
+            gain[:learned] = suppressor.compute_gain(
+                magnitude[:learned], energy[:learned],
+                np.stack(profiles), np.stack(stds), suppress_ac=False)
+
+        # The remaining frames share the current profile, which is then
+        # adapted from their gated magnitudes in one step
+        if learned < len(spec):
+            gain[learned:] = suppressor.compute_gain(magnitude[learned:], energy[learned:])
+            if not suppressor.freeze_noise_profile:
+                suppressor.adapt_noise_profile(magnitude[learned:] * gain[learned:])
+        return spec * gain
+
+    def _process_channels(self, audio, suppressor):
+        """Run the spectral gating over every frame of a (channels, samples) signal"""
+        frames = frame_signal(audio, self.chunk_size, self.hop_size)
+        num_frames = frames.shape[1]
+        output = np.zeros((len(audio), (num_frames - 1) * self.hop_size + self.chunk_size))
+
+        for first in range(0, num_frames, self.block_frames):
+            # (frames, channels, samples) so every stage runs across all channels at once
+            block = frames[:, first:first + self.block_frames].transpose(1, 0, 2) * self.window
+            spec = self._gate(np.fft.rfft(block, axis=-1), suppressor)
+            processed = np.fft.irfft(spec, n=self.chunk_size, axis=-1)
+            overlap_add((processed * self.synthesis_window).transpose(1, 0, 2), self.hop_size, output, first)
+
+        lead = self.chunk_size - self.hop_size
+        return output[:, lead:lead + audio.shape[-1]].astype(np.float32)
+
+def to_float(data):
+    """Convert WAV samples to float32 in [-1, 1]"""
+    dtype = data.dtype
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        data = (data.astype(np.float32) - (info.max + info.min + 1) / 2) / ((info.max - info.min + 1) / 2)
+    return data.astype(np.float32)
+
+def from_float(audio, dtype):
+    """Convert float samples in [-1, 1] to the given WAV sample type"""
+    dtype = np.dtype(dtype)
+    audio = np.clip(audio, -1.0, 1.0)
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        half = (info.max - info.min + 1) / 2
+        audio = np.clip(np.round(audio * half + (info.max + info.min + 1) / 2), info.min, info.max)
+    return audio.astype(dtype)
+
+def read_wav(path: str):
+    """Read a WAV file as float32 samples in [-1, 1]"""
+    sample_rate, data = wavfile.read(path)
+    return to_float(data), sample_rate, data.dtype
+
+def write_wav(path: str, audio, sample_rate: int, dtype=np.int16):
+    """Write float samples in [-1, 1] to a WAV file with the given sample type"""
+    wavfile.write(path, sample_rate, from_float(audio, dtype))
+
+def denoise_file(input_path: str, output_path: str, denoiser: Optional[BatchDenoiser] = None):
+    """Denoise a WAV file and return (audio seconds, wall seconds)"""
+    denoiser = denoiser or BatchDenoiser()
+    audio, sample_rate, dtype = read_wav(input_path)
+
+    start = time.perf_counter()
+    processed = denoiser.process(audio, sample_rate)
+    elapsed = time.perf_counter() - start
+
+    write_wav(output_path, processed, sample_rate, dtype)
+    return len(audio) / sample_rate, elapsed
+
+def _partial_path(output_path: str, suffix: str = ''):
+    """Hidden temporary file next to ``output_path`` that is renamed to it once complete"""
+    directory, name = os.path.split(output_path)
+    return os.path.join(directory, f".{name}{suffix}.partial")
+
+def stream_denoise_file(input_path: str, output_path: str, denoiser: Optional[BatchDenoiser] = None,
+                        block_size: int = 1 << 16):
+    """Denoise a WAV file in blocks of ``block_size`` samples and return (audio seconds, wall seconds)
+
+    The input and output are memory mapped, so memory stays flat for
+    recordings of any length. The output appears at ``output_path`` only
+    once it is complete. With normalization a second pass rescales a
+    float32 intermediate file.
+    """
+    denoiser = denoiser or BatchDenoiser()
+    partial = _partial_path(output_path)
+    unscaled = _partial_path(output_path, '.unscaled')
+
+    start = time.perf_counter()
+    try:
+        with WavReader(input_path) as reader:
+            peak = 0.0
+            with WavWriter(unscaled if denoiser.normalize else partial, reader.sample_rate, reader.channels,
+                           reader.frames, 'float32' if denoiser.normalize else reader.sample_format) as writer:
+                blocks = reader.blocks(block_size)
+                for processed in denoiser.process_stream(blocks, reader.sample_rate, reader.channels):
+                    peak = max(peak, float(np.max(np.abs(processed))))
+                    writer.write(processed)
+
+            if denoiser.normalize:
+                scale = 1 / (peak + 1e-6)
+                with WavReader(unscaled) as scaled, \
+                        WavWriter(partial, reader.sample_rate, reader.channels, reader.frames,
+                                  reader.sample_format) as writer:
+                    for block in scaled.blocks(block_size):
+                        writer.write(block * scale)
+                os.remove(unscaled)
+        os.replace(partial, output_path)
+    finally:
+        for path in (unscaled, partial):
+            if os.path.exists(path):
+                os.remove(path)
+    return reader.duration, time.perf_counter() - start
+
+def suppress_file(input_path: str, output_path: str, suppressor: Optional[NoiseSuppressor] = None,
+                  chunk_size: int = 1024):
+    """Run the live path's ``_apply_noise_suppression`` over a WAV file and return (audio seconds, wall seconds)
+
+    The file is fed in memory-mapped ``chunk_size`` blocks exactly as the
+    audio device would deliver them, so the output is what the live path
+    plays, with its algorithmic latency removed. Memory stays flat for
+    recordings of any length and the output only appears once complete.
+    """
+    partial = _partial_path(output_path)
+    start = time.perf_counter()
+    try:
+        with WavReader(input_path) as reader:
+            if suppressor is None:
+                suppressor = NoiseSuppressor(reader.sample_rate, reader.channels, chunk_size)
+            chunk_size = suppressor.chunk_size
+            out = np.empty((chunk_size, reader.channels))
+            skip = int(round(suppressor.algorithmic_latency * reader.sample_rate))
+            silence = np.zeros((chunk_size, reader.channels), dtype=np.float32)
+            blocks = itertools.chain(reader.blocks(chunk_size, pad=True),
+                                     itertools.repeat(silence, -(-skip // chunk_size)))
+
+            with WavWriter(partial, reader.sample_rate, reader.channels, reader.frames,
+                           reader.sample_format) as writer:
+                for block in blocks:
+                    processed = suppressor._apply_noise_suppression(block, out)
+                    dropped = min(skip, chunk_size)
+                    skip -= dropped
+                    writer.write(processed[dropped:dropped + writer.frames - writer.position])
+        os.replace(partial, output_path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return reader.duration, time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Denoise a recorded WAV file offline")
+    parser.add_argument("input", help="input WAV file")
+    parser.add_argument("output", help="output WAV file")
+    parser.add_argument("--chunk-size", type=int, default=1024, help="FFT frame size in samples")
+    parser.add_argument("--hop-size", type=int, default=None, help="frame hop in samples (default: chunk size / 2)")
+    parser.add_argument("--block-frames", type=int, default=64, help="frames processed per vectorized call")
+    parser.add_argument("--noise-threshold", type=float, default=None)
+    parser.add_argument("--voice-threshold", type=float, default=None)
+    parser.add_argument("--link-channels", action="store_true", help="apply one gain to all channels")
+    parser.add_argument("--no-normalize", action="store_true", help="keep the output level instead of peak normalizing")
+    parser.add_argument("--block-size", type=int, default=1 << 16, help="samples read and denoised at a time")
+    parser.add_argument("--live", action="store_true",
+                        help="run the live processing path block by block instead of the batch denoiser")
+    args = parser.parse_args(argv)
+
+    parameters = {}
+    if args.noise_threshold is not None:
+        parameters['noise_threshold'] = args.noise_threshold
+    if args.voice_threshold is not None:
+        parameters['voice_threshold'] = args.voice_threshold
+    if args.link_channels:
+        parameters['link_channels'] = True
+
+    denoiser = BatchDenoiser(chunk_size=args.chunk_size,
+                             hop_size=args.hop_size,
+                             block_frames=args.block_frames,
+                             normalize=not args.no_normalize,
+                             parameters=parameters)
+    if args.live:
+        with WavReader(args.input) as reader:
+            suppressor = denoiser.create_suppressor(reader.sample_rate, reader.channels)
+        duration, elapsed = suppress_file(args.input, args.output, suppressor)
+    else:
+        duration, elapsed = stream_denoise_file(args.input, args.output, denoiser, args.block_size)
+    print(f"Processed {duration:.1f} s of audio in {elapsed:.2f} s "
+          f"({duration / max(elapsed, 1e-9):.1f}x real time)")
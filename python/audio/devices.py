@@ -0,0 +1,171 @@
+import threading
+from typing import Optional
+
+# Rates probed when a device's supported sample rates are first asked for
+COMMON_SAMPLE_RATES = (8000, 11025, 16000, 22050, 32000, 44100, 48000, 88200, 96000)
+
+class DeviceIndex:
+    """One enumeration of the devices of a stream backend, indexed for lookups
+
+    Built once per enumeration and never modified, so readers on any
+    thread can keep using an index while a newer one replaces it.
+    """
+
+    def __init__(self, devices, host_apis=()):
+        self.devices = []
+        self.by_index = {}
+        self.by_name = {}  # Name to every device of that name, in enumeration order
+        self.by_host_api = {}  # Host API name to its devices
+        for position, info in enumerate(devices):
+            info = dict(info)
+            info.setdefault('index', position)
+            hostapi = info.get('hostapi')
+            if hostapi is not None and hostapi < len(host_apis):
+                info['hostapi_name'] = host_apis[hostapi]['name']
+            self.devices.append(info)
+            self.by_index[info['index']] = info
+            self.by_name.setdefault(info['name'], []).append(info)
+            self.by_host_api.setdefault(info.get('hostapi_name'), []).append(info)
+        self.inputs = [info for info in self.devices if info.get('max_input_channels', 0) > 0]
+        self.outputs = [info for info in self.devices if info.get('max_output_channels', 0) > 0]
+        # Identifies the set of devices regardless of when it was enumerated
+        self.signature = tuple((info['name'], info.get('hostapi'), info.get('max_input_channels', 0),
+                                info.get('max_output_channels', 0)) for info in self.devices)
+
+    def find(self, device, kind: Optional[str] = None):
+        """Info dict of a device given by index or name, or None
+
+        With ``kind`` 'input' or 'output' only devices with channels in
+        that direction match, so a name shared by a microphone and a
+        speaker resolves to the right one.
+        """
+        if isinstance(device, str):
+            for info in self.by_name.get(device, ()):
+                if kind is None or info.get(f'max_{kind}_channels', 0) > 0:
+                    return info
+            return None
+        return self.by_index.get(device)
+
+class DeviceRegistry:
+    """Cached device list of a stream backend that follows hot-plugging
+
+    The backend is enumerated once and every lookup is answered from the
+    resulting ``DeviceIndex``. Supported sample rates are probed once per
+    device, direction and channel count. PortAudio only sees new devices
+    after being reinitialized, which is slow with many devices and holds up
+    opening a stream meanwhile, so backends that can rescan are rescanned on
+    demand with ``refresh``, e.g. when a device list is opened. A background
+    thread also does so every ``poll_interval`` seconds as a fallback. A new
+    index is swapped in when the set of devices changed; ``version`` counts
+    those changes.
+    """
+
+    def __init__(self, backend, poll_interval: float = 60.0):
+        self.backend = backend
+        self.poll_interval = poll_interval
+        self.version = 0
+        self._index = None
+        self._sample_rates = {}  # (name, kind, channels) to supported rates
+        self._listeners = []
+        self._lock = threading.Lock()  # Serializes enumerations
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def index(self):
+        """Current device index, enumerating the backend on first use"""
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._enumerate()
+                index = self._index
+        return index
+
+    @property
+    def devices(self):
+        """All devices as info dicts"""
+        return self.index.devices
+
+    def find(self, device, kind: Optional[str] = None):
+        """Info dict of a device given by index or name, or None"""
+        return self.index.find(device, kind)
+
+    def host_apis(self):
+        """Host API names with their devices"""
+        return {name: list(devices) for name, devices in self.index.by_host_api.items()}
+
+    def _enumerate(self):
+        """Query the backend for a fresh ``DeviceIndex``"""
+        query_hostapis = getattr(self.backend, 'query_hostapis', None)
+        host_apis = query_hostapis() if query_hostapis is not None else ()
+        return DeviceIndex(self.backend.query_devices(), host_apis)
+
+    def refresh(self):
+        """Enumerate the devices again, returning True if they changed
+
+        Does nothing while the backend cannot rescan, e.g. with a stream
+        open, since reinitializing PortAudio would end it.
+        """
+        rescan = getattr(self.backend, 'rescan', None)
+        with self._lock:
+            if rescan is not None and not rescan():
+                return False
+            index = self._enumerate()
+            if self._index is not None and index.signature == self._index.signature:
+                self._index = index  # Indices may still have been renumbered
+                return False
+            self._index = index
+            self._sample_rates.clear()
+            self.version += 1
+        for listener in list(self._listeners):
+            listener(self)
+        return True
+
+    def add_listener(self, callback):
+        """Call ``callback(registry)`` from the refresh thread whenever the devices change"""
+        self._listeners.append(callback)
+
+    def supported_sample_rates(self, device, kind: str = 'input', channels: int = 1):
+        """Common sample rates the device accepts, probed once and cached
+
+        Backends without ``check_settings`` are taken to accept every rate.
+        """
+        info = self.find(device, kind)
+        if info is None:
+            return ()
+        channels = min(channels, info.get(f'max_{kind}_channels', 0))
+        key = (info['name'], kind, channels)
+        rates = self._sample_rates.get(key)
+        if rates is None:
+            check = getattr(self.backend, 'check_settings', None)
+            if check is None:
+                rates = COMMON_SAMPLE_RATES
+            else:
+                rates = tuple(rate for rate in COMMON_SAMPLE_RATES
+                              if check(info['index'], kind, channels, rate))
+            self._sample_rates[key] = rates
+        return rates
+
+    def start(self):
+        """Watch for devices being plugged in or removed, if the backend can rescan"""
+        if self._thread is not None or not hasattr(self.backend, 'rescan'):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """End the background refresh"""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _watch(self):
+        """Refresh loop of the background thread"""
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error refreshing audio devices: {e}")
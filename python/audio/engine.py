@@ -0,0 +1,571 @@
+import argparse
+import ast
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Client, Listener
+from typing import Optional
+
+import numpy as np
+
+from .processor import AudioProcessor
+
+ENGINE_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'engine.py')
+
+# AudioProcessor methods clients may call in the engine
+ENGINE_METHODS = ('get_available_devices', 'refresh_devices', 'get_supported_sample_rates',
+                  'set_devices', 'start_stream', 'stop_processing', 'reconfigure',
+                  'initialize_model', 'set_backend', 'enable_instrumentation', 'set_adaptive_quality',
+                  'reset_noise_profile', 'get_latency', 'get_instrumentation', 'get_quality',
+                  'get_buffer_stats', 'get_backend_stats', 'start_recording', 'stop_recording',
+                  'get_recording_stats')
+
+# AudioProcessor settings clients may change at any time with ``set``. The
+# block size and sample rate only change through reconfigure(), and the
+# channels with the devices, which rebuild the buffers and noise state to match.
+ENGINE_SETTINGS = ('noise_threshold', 'voice_threshold', 'output_volume', 'filter_enabled', 'feedback_enabled',
+                   'smoothing_factor', 'ac_suppression_factor', 'min_noise_floor', 'non_voice_gain',
+                   'noise_learning_rate', 'max_noise_samples', 'freeze_noise_profile', 'noise_estimator',
+                   'noise_tracking_window', 'hum_removal', 'gain_smoothing', 'median_kernel_size',
+                   'gain_attack_time', 'gain_release_time', 'gain_update_interval', 'link_channels',
+                   'vad_enabled', 'vad_on_ratio', 'vad_off_ratio', 'vad_hangover', 'max_latency_blocks')
+
+# Shared ring header: layout, then the producer's and the consumer's fields
+DEPTH, FRAMES, CHANNELS, WRITE_INDEX, OVERRUNS, READ_INDEX, UNDERRUNS, LAST_TAG = range(8)
+HEADER_SIZE = 8
+
+# Returned by EngineClient.try_call while another command holds the connection
+ENGINE_BUSY = object()
+
+class EngineError(RuntimeError):
+    """A command failed in the engine process or the engine is gone"""
+
+class SharedBlockRing:
+    """Single-producer/single-consumer ring of float32 audio blocks in shared memory
+
+    Works like BlockRingBuffer, but the blocks, tags and indices live in one
+    shared memory segment, so the producer and the consumer can be in
+    different processes. The producer only writes the write index and the
+    consumer the read index, each after copying its block. Writing into a
+    full ring drops the block; reading from an empty one leaves ``out``
+    untouched. The creating side unlinks the segment on ``close``.
+    """
+
+    def __init__(self, depth: int = 8, frames: int = 1024, channels: int = 1, name: Optional[str] = None):
+        if name is None:
+            size = 8 * (HEADER_SIZE + depth) + 4 * depth * frames * channels
+            self._memory = shared_memory.SharedMemory(create=True, size=size)
+            header = np.ndarray(HEADER_SIZE, dtype=np.int64, buffer=self._memory.buf)
+            header[:] = 0
+            header[[DEPTH, FRAMES, CHANNELS, LAST_TAG]] = depth, frames, channels, -1
+        else:
+            self._memory = shared_memory.SharedMemory(name=name)
+            if os.name == 'posix':
+                # Only the creator may unlink the segment, not this process's tracker on exit
+                resource_tracker.unregister(self._memory._name, 'shared_memory')
+            header = np.ndarray(HEADER_SIZE, dtype=np.int64, buffer=self._memory.buf)
+            depth, frames, channels = (int(value) for value in header[[DEPTH, FRAMES, CHANNELS]])
+        self.owner = name is None
+        self.name = self._memory.name
+        self.depth = depth
+        self.frames = frames
+        self.channels = channels
+        self._header = header
+        self._tags = np.ndarray(depth, dtype=np.int64, buffer=self._memory.buf, offset=8 * HEADER_SIZE)
+        self._blocks = np.ndarray((depth, frames, channels), dtype=np.float32, buffer=self._memory.buf,
+                                  offset=8 * (HEADER_SIZE + depth))
+
+    def __len__(self):
+        """Number of blocks waiting to be read"""
+        return int(self._header[WRITE_INDEX] - self._header[READ_INDEX])
+
+    @property
+    def last_tag(self):
+        """Tag of the block read last, -1 before the first read"""
+        return int(self._header[LAST_TAG])
+
+    def write(self, block, tag: int = 0):
+        """Copy a block into the ring; returns False and counts an overrun when full"""
+        index = self._header[WRITE_INDEX]
+        if index - self._header[READ_INDEX] >= self.depth:
+            self._header[OVERRUNS] += 1
+            return False
+        slot = index % self.depth
+        np.copyto(self._blocks[slot], block.reshape(self.frames, -1))
+        self._tags[slot] = tag
+        self._header[WRITE_INDEX] = index + 1
+        return True
+
+    def read(self, out):
+        """Copy the oldest block into ``out``; returns False and counts an underrun when empty"""
+        index = self._header[READ_INDEX]
+        if index == self._header[WRITE_INDEX]:
+            self._header[UNDERRUNS] += 1
+            return False
+        slot = index % self.depth
+        np.copyto(out, self._blocks[slot])
+        self._header[LAST_TAG] = self._tags[slot]
+        self._header[READ_INDEX] = index + 1
+        return True
+
+    def stats(self):
+        """Snapshot of the fill level and event counters"""
+        return {
+            'depth': self.depth,
+            'fill': len(self),
+            'writes': int(self._header[WRITE_INDEX]),
+            'reads': int(self._header[READ_INDEX]),
+            'overruns': int(self._header[OVERRUNS]),
+            'underruns': int(self._header[UNDERRUNS]),
+        }
+
+    def close(self):
+        """Release the mapping, and the segment itself on the creating side"""
+        if self._memory is None:
+            return
+        # Views into the segment must be gone before it can be unmapped
+        self._header = self._tags = self._blocks = None
+        self._memory.close()
+        if self.owner:
+            self._memory.unlink()
+        self._memory = None
+
+class SharedMemoryStream:
+    """Stand-in for ``sounddevice.Stream`` that runs the callback on blocks from another process
+
+    A thread waits for blocks in ``input_ring``, hands each to the callback
+    as ``indata`` and writes ``outdata`` to ``output_ring``, so the pace is
+    set by whoever produces the input.
+    """
+
+    def __init__(self, input_ring: SharedBlockRing, output_ring: SharedBlockRing, channels,
+                 samplerate: int, blocksize: int, callback):
+        self.input_ring = input_ring
+        self.output_ring = output_ring
+        self.input_channels, self.output_channels = channels
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.callback = callback
+        self.latency = (0.0, 0.0)
+        self.active = False
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """Start calling back on the stream thread"""
+        self.active = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop after the current block and wait for the stream thread"""
+        self.active = False
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self):
+        """Deliver every block that arrives to the callback"""
+        poll_interval = self.blocksize / self.samplerate / 8
+        indata = np.zeros((self.blocksize, self.input_channels), dtype=np.float32)
+        outdata = np.zeros((self.blocksize, self.output_channels), dtype=np.float32)
+        while self.active:
+            if not len(self.input_ring):
+                time.sleep(poll_interval)
+                continue
+            self.input_ring.read(indata)
+            self.callback(indata, outdata, self.blocksize, None, None)
+            self.output_ring.write(outdata, self.input_ring.last_tag)
+
+class SharedMemoryBackend:
+    """Stream backend that exchanges audio with another process through shared rings
+
+    Exposes one input and one output device; the client writes captured
+    blocks to the ring named ``input_name`` and reads the processed ones
+    from ``output_name``.
+    """
+
+    INPUT_NAME = 'Shared Memory Input'
+    OUTPUT_NAME = 'Shared Memory Output'
+
+    def __init__(self, input_name: str, output_name: str):
+        self.input_ring = SharedBlockRing(name=input_name)
+        self.output_ring = SharedBlockRing(name=output_name)
+
+    def query_devices(self, device=None):
+        """Device list, or the info dict of one device"""
+        devices = [
+            {'name': self.INPUT_NAME, 'index': 0,
+             'max_input_channels': self.input_ring.channels, 'max_output_channels': 0},
+            {'name': self.OUTPUT_NAME, 'index': 1,
+             'max_input_channels': 0, 'max_output_channels': self.output_ring.channels},
+        ]
+        if device is None:
+            return devices
+        if isinstance(device, str):
+            return next(info for info in devices if info['name'] == device)
+        return devices[device]
+
+    def check_blocksize(self, blocksize: int):
+        """Whether streams can use this block size; the rings keep the one they were created with"""
+        return blocksize == self.input_ring.frames
+
+    def open_stream(self, device, channels, samplerate: int, blocksize: int, callback):
+        """Create a shared memory duplex stream; use it as a context manager"""
+        if not self.check_blocksize(blocksize):
+            raise ValueError(f"Shared rings hold {self.input_ring.frames} frame blocks, not {blocksize}")
+        return SharedMemoryStream(self.input_ring, self.output_ring, channels, samplerate, blocksize, callback)
+
+    def sleep(self, milliseconds: int):
+        """Wait while the stream runs"""
+        time.sleep(milliseconds / 1000)
+
+    def close(self):
+        """Detach from the rings"""
+        self.input_ring.close()
+        self.output_ring.close()
+
+def engine_status(processor: AudioProcessor):
+    """Everything a client shows about a running engine, in one reply
+
+    Times are reported as durations, since the perf_counter of another
+    process has a different origin.
+    """
+    backend = processor.backend
+    first_block_after = None  # Seconds from the return of start_stream to the first processed block
+    if backend.first_block_at is not None and processor.stream_started_at is not None:
+        first_block_after = backend.first_block_at - processor.stream_started_at
+    return {
+        'running': processor.is_running,
+        'stream_mode': processor.stream_mode,
+        'sample_rate': processor.sample_rate,
+        'chunk_size': processor.chunk_size,
+        'reconfiguring': processor.reconfiguring,
+        'latency': processor.get_latency(),
+        'instrumentation': processor.get_instrumentation(),
+        'backend': {'name': backend.name, 'label': backend.label, 'cost': backend.stats(),
+                    'first_block_after': first_block_after},
+        'backends': list(processor.backends),
+        'quality': processor.get_quality(),
+        'learning_noise': processor.learning_noise,
+        'filter_enabled': processor.filter_enabled,
+        'feedback_enabled': processor.feedback_enabled,
+        'output_volume': processor.output_volume,
+        'devices_version': processor.devices_version,
+        'recording': processor.get_recording_stats(),
+    }
+
+def apply_settings(processor: AudioProcessor, settings: dict):
+    """Set runtime tunables such as thresholds, volume and toggles, see ENGINE_SETTINGS"""
+    for name in settings:
+        if name not in ENGINE_SETTINGS:
+            raise ValueError(f"Unknown setting: {name}")
+    for name, value in settings.items():
+        setattr(processor, name, value)
+
+def execute(processor: AudioProcessor, command: str, args, kwargs):
+    """Run one client command on the engine's processor"""
+    if command == 'status':
+        return engine_status(processor)
+    if command == 'set':
+        return apply_settings(processor, kwargs)
+    if command == 'get':
+        return {name: getattr(processor, name) for name in args if not name.startswith('_')}
+    if command not in ENGINE_METHODS:
+        raise ValueError(f"Unknown command: {command}")
+    return getattr(processor, command)(*args, **kwargs)
+
+def serve(connection, options: dict, audio_rings=None):
+    """Answer ``(command, args, kwargs)`` requests until shut down or the client goes away
+
+    Replies are ``('ok', result)`` or ``('error', message)``. The audio
+    stream and processing threads keep running between requests.
+    """
+    processor = AudioProcessor(**options)
+    if audio_rings is not None:
+        processor.stream_backend = SharedMemoryBackend(*audio_rings)
+    processor.initialize_model()
+    connection.send(('ok', None))
+    try:
+        while True:
+            try:
+                command, args, kwargs = connection.recv()
+            except EOFError:
+                break
+            if command == 'shutdown':
+                break
+            try:
+                reply = ('ok', execute(processor, command, args, kwargs))
+            except Exception as e:
+                reply = ('error', f"{type(e).__name__}: {e}")
+            connection.send(reply)
+    finally:
+        if processor.is_running:
+            processor.stop_processing()
+        processor.stop_recording()
+        if audio_rings is not None:
+            processor.stream_backend.close()
+        connection.close()
+
+def run_client_engine():
+    """Engine process started by EngineClient: take the key on stdin, announce the address, serve one client"""
+    authkey = bytes.fromhex(sys.stdin.readline().strip())
+    with Listener(authkey=authkey) as listener:
+        print(listener.address, flush=True)
+        # Later output goes to stderr, the client stops reading stdout after the address
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+        connection = listener.accept()
+    options, audio_rings = connection.recv()
+    serve(connection, options, audio_rings)
+
+class EngineClient:
+    """Runs the AudioProcessor in a separate engine process and controls it over a local connection
+
+    The engine owns the audio stream and the processing threads, so nothing
+    the client does, e.g. a busy GUI event loop, can hold them up. Commands
+    are forwarded one at a time and block until the engine replies; the
+    first one also waits for the engine to start. ``try_call`` skips a
+    command instead of waiting behind another. ``options`` are passed to
+    the AudioProcessor constructor.
+
+    With ``shared_audio`` the engine does not open a sound device but takes
+    blocks written with ``write`` from a shared memory ring and puts the
+    processed ones in another for ``read``; select the
+    ``SharedMemoryBackend`` devices to stream them.
+    """
+
+    def __init__(self, shared_audio: bool = False, ring_depth: int = 8, **options):
+        self.options = options
+        self.input_ring = None
+        self.output_ring = None
+        if shared_audio:
+            frames = options.get('chunk_size', 1024)
+            channels = options.get('channels', 1)
+            self.input_ring = SharedBlockRing(ring_depth, frames, channels)
+            self.output_ring = SharedBlockRing(ring_depth, frames, channels)
+        self.process = None
+        self._connection = None
+        self._authkey = secrets.token_bytes(32)
+        self._lost = False  # Set once the engine stopped answering
+        self._lock = threading.Lock()  # Commands may come from several threads
+
+    @property
+    def ready(self):
+        """Whether the engine has started and answers commands"""
+        return self._connection is not None
+
+    @property
+    def alive(self):
+        """Whether the engine process is running and still answers"""
+        return self.process is not None and not self._lost and self.process.poll() is None
+
+    def start(self):
+        """Launch the engine process without waiting for it"""
+        self.process = subprocess.Popen([sys.executable, ENGINE_SCRIPT, '--client'],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        self.process.stdin.write(self._authkey.hex() + '\n')
+        self.process.stdin.close()
+
+    def _connect(self):
+        """Wait for the engine to listen, connect and send it the processor options"""
+        if self.process is None:
+            self.start()
+        address = self.process.stdout.readline().strip()
+        self.process.stdout.close()
+        if not address:
+            self._lost = True
+            raise EngineError(f"Audio engine exited with code {self.process.wait()}")
+        connection = Client(address, authkey=self._authkey)
+        rings = None if self.input_ring is None else (self.input_ring.name, self.output_ring.name)
+        connection.send((self.options, rings))
+        self._receive(connection)
+        self._connection = connection
+
+    def _receive(self, connection):
+        """Result of the reply to the last command"""
+        try:
+            status, result = connection.recv()
+        except (EOFError, OSError):
+            self._lost = True
+            raise EngineError("Audio engine stopped") from None
+        if status == 'error':
+            raise EngineError(result)
+        return result
+
+    def call(self, command: str, *args, **kwargs):
+        """Run ``command`` in the engine and return its result"""
+        with self._lock:
+            if self._connection is None:
+                self._connect()
+            return self._send(command, args, kwargs)
+
+    def try_call(self, command: str, *args, **kwargs):
+        """Like ``call``, but return ENGINE_BUSY at once instead of waiting
+
+        That is while another thread's command, e.g. a device rescan, has
+        not been answered yet, or while the engine is still starting. Meant
+        for polling from a thread that must not block, such as a GUI's.
+        """
+        if self._connection is None or not self._lock.acquire(blocking=False):
+            return ENGINE_BUSY
+        try:
+            if self._connection is None:
+                return ENGINE_BUSY
+            return self._send(command, args, kwargs)
+        finally:
+            self._lock.release()
+
+    def _send(self, command: str, args, kwargs):
+        """Send a command and wait for its result; the lock must be held"""
+        try:
+            self._connection.send((command, args, kwargs))
+        except OSError:
+            self._lost = True
+            raise EngineError("Audio engine stopped") from None
+        return self._receive(self._connection)
+
+    def status(self):
+        """Stream, latency, load, backend and quality state of the engine"""
+        return self.call('status')
+
+    def set(self, **settings):
+        """Change processor settings, e.g. ``set(noise_threshold=0.4, filter_enabled=False)``"""
+        return self.call('set', **settings)
+
+    def get(self, *names):
+        """Current values of processor attributes by name"""
+        return self.call('get', *names)
+
+    def get_available_devices(self):
+        return self.call('get_available_devices')
+
+    def refresh_devices(self):
+        return self.call('refresh_devices')
+
+    def get_supported_sample_rates(self, device_name: str, kind: str = 'input'):
+        return self.call('get_supported_sample_rates', device_name, kind)
+
+    def set_devices(self, input_device_name: str, output_device_name: str):
+        return self.call('set_devices', input_device_name, output_device_name)
+
+    def start_stream(self, mode: Optional[str] = None):
+        return self.call('start_stream', mode)
+
+    def stop_processing(self):
+        return self.call('stop_processing')
+
+    def reconfigure(self, sample_rate: Optional[int] = None, chunk_size: Optional[int] = None):
+        return self.call('reconfigure', sample_rate, chunk_size)
+
+    def start_recording(self, directory: str, **options):
+        return self.call('start_recording', directory, **options)
+
+    def stop_recording(self):
+        return self.call('stop_recording')
+
+    def initialize_model(self, backend: str = 'spectral_gating', **options):
+        return self.call('initialize_model', backend, **options)
+
+    def set_backend(self, name: str):
+        return self.call('set_backend', name)
+
+    def enable_instrumentation(self, enabled: bool = True):
+        return self.call('enable_instrumentation', enabled)
+
+    def write(self, block, tag: int = 0):
+        """Hand a captured (frames, channels) block to the engine; False if its ring is full"""
+        return self.input_ring.write(block, tag)
+
+    def read(self, out):
+        """Copy the oldest processed block into ``out``; False if none is ready"""
+        return self.output_ring.read(out)
+
+    def close(self, timeout: float = 5.0):
+        """Stop the stream, shut the engine down and release the shared rings"""
+        with self._lock:
+            if self._connection is not None:
+                try:
+                    self._connection.send(('shutdown', (), {}))
+                except OSError:
+                    pass
+                self._connection.close()
+                self._connection = None
+            if self.process is not None:
+                try:
+                    self.process.wait(timeout)
+                except subprocess.TimeoutExpired:
+                    self.process.kill()
+                    self.process.wait()
+                self.process = None
+            for ring in (self.input_ring, self.output_ring):
+                if ring is not None:
+                    ring.close()
+
+def parse_setting(item: str):
+    """``name=value`` as a (name, value) pair, the value read as a Python literal when possible"""
+    name, _, value = item.partition('=')
+    try:
+        return name, ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return name, value
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the audio engine without a GUI")
+    parser.add_argument("--input-device", help="input device name")
+    parser.add_argument("--output-device", help="output device name")
+    parser.add_argument("--list-devices", action='store_true', help="list the audio devices and exit")
+    parser.add_argument("--mode", default='threaded', choices=AudioProcessor.STREAM_MODES)
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    parser.add_argument("--chunk-size", type=int, default=1024)
+    parser.add_argument("--channels", type=int, default=1)
+    parser.add_argument("--set", dest="settings", action='append', default=[], metavar="NAME=VALUE",
+                        help="override an AudioProcessor setting, e.g. --set noise_threshold=0.5")
+    parser.add_argument("--record", metavar="DIR", help="record the input and output to WAV files in DIR")
+    parser.add_argument("--status-interval", type=float, default=5.0, help="seconds between status lines")
+    parser.add_argument("--client", action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.client:
+        run_client_engine()
+        return
+
+    processor = AudioProcessor(sample_rate=args.sample_rate, chunk_size=args.chunk_size, channels=args.channels)
+    if args.list_devices:
+        for device in processor.get_available_devices():
+            host_api = f", {device['hostapi_name']}" if 'hostapi_name' in device else ""
+            print(f"{device['name']} ({device['max_input_channels']} in, "
+                  f"{device['max_output_channels']} out{host_api})")
+        return
+    if not args.input_device or not args.output_device:
+        parser.error("--input-device and --output-device are required")
+    apply_settings(processor, dict(parse_setting(item) for item in args.settings))
+    processor.initialize_model()
+    processor.enable_instrumentation(True)
+    if not processor.set_devices(args.input_device, args.output_device):
+        parser.error("input or output device not found, see --list-devices")
+
+    if args.record:
+        processor.start_recording(args.record)
+    processor.start_stream(args.mode)
+    try:
+        while processor.is_running:
+            time.sleep(args.status_interval)
+            latency = processor.get_latency()
+            stats = processor.get_instrumentation()
+            print(f"{latency['round_trip_ms']:.0f} ms latency, {stats['block']['mean_ms']:.1f} ms/block "
+                  f"({stats['load']:.0%}), {stats['deadline_misses']} missed, {stats['underruns']} underruns, "
+                  f"quality {processor.get_quality()['name']}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        processor.stop_processing()
+        processor.stop_recording()
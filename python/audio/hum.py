@@ -0,0 +1,186 @@
+import numpy as np
+
+MAINS_FREQUENCIES = (50.0, 60.0)
+
+def notch_sections(frequencies, bandwidth: float, sample_rate: int):
+    """(n, 6) second-order notch sections at ``frequencies`` with a -3 dB ``bandwidth`` in Hz
+
+    Same design as ``scipy.signal.iirnotch`` for every frequency at once.
+    """
+    w0 = 2 * np.pi * np.asarray(frequencies, dtype=float) / sample_rate
+    gain = 1 / (1 + np.tan(np.pi * bandwidth / sample_rate))
+    sos = np.empty((len(w0), 6))
+    sos[:, 0] = gain
+    sos[:, 1] = -2 * gain * np.cos(w0)
+    sos[:, 2] = gain
+    sos[:, 3] = 1
+    sos[:, 4] = sos[:, 1]
+    sos[:, 5] = 2 * gain - 1
+    return sos
+
+class HumFilter:
+    """Removes mains hum with a cascade of notches at its fundamental and harmonics
+
+    Every ``detect_interval`` seconds the spectrum of the last interval of
+    audio is searched for 50 and 60 Hz harmonic series. Harmonics standing
+    ``threshold`` times above the spectrum around them get a notch, once the
+    fundamental or at least two harmonics do, and the
+    fundamental is re-estimated near its last value to follow the drift of
+    the mains frequency. Filter state carries across blocks and all
+    channels are filtered in one call. Until hum is found blocks pass
+    through untouched.
+    """
+
+    def __init__(self,
+                 sample_rate: int,
+                 channels: int,
+                 harmonics: int = 8,
+                 bandwidth: float = 2.0,
+                 detect_interval: float = 1.0,
+                 threshold: float = 30.0):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        # Harmonics above Nyquist are dropped
+        self.harmonics = min(harmonics, int((sample_rate / 2 - 10) / (1.03 * max(MAINS_FREQUENCIES))))
+        self.bandwidth = bandwidth  # Notch width in Hz, the same for every harmonic
+        self.threshold = threshold  # Power of a harmonic over its surroundings to be notched
+        self._history = np.zeros(int(sample_rate * detect_interval))  # Mono audio of the current interval
+        top = 1.03 * max(MAINS_FREQUENCIES) * self.harmonics + 10
+        self._decimation = max(int(sample_rate / (8 * top)), 1)  # Detection runs at about 8x the top harmonic
+        self._sosfilt = None
+        self.reset()
+
+    def reset(self):
+        """Forget the detected hum and the filter state"""
+        self.fundamental = None  # Tracked mains frequency in Hz, None without hum
+        self.notched = np.zeros(0, dtype=int)  # Harmonic numbers with a notch
+        self._sos = None
+        self._zi = None
+        self._filled = 0  # Samples of the current detection interval seen so far
+
+    def process(self, audio, out=None):
+        """Remove the hum from a (frames,) or (frames, channels) block, returning the filtered block
+
+        Blocks are split where a detection interval ends, so the result does
+        not depend on how the audio is divided into blocks.
+        """
+        audio = np.asarray(audio)
+        block = audio.reshape(len(audio), -1)
+        result = None if out is None else out.reshape(block.shape)
+        start = 0
+        while start < len(block):
+            stop = min(len(block), start + len(self._history) - self._filled)
+            piece = block[start:stop]
+            if self._sos is not None:
+                if self._sosfilt is None:
+                    from scipy.signal import sosfilt
+                    self._sosfilt = sosfilt
+                if result is None:
+                    result = np.empty(block.shape)
+                    result[:start] = block[:start]
+                result[start:stop], self._zi = self._sosfilt(self._sos, piece, axis=0, zi=self._zi)
+            elif result is not None:
+                result[start:stop] = piece
+            self._push(piece)
+            start = stop
+
+        if result is None:
+            return audio
+        return out if out is not None else result.reshape(audio.shape)
+
+    def _push(self, piece):
+        """Append the channel mean of ``piece`` to the detection interval, detecting when it is full"""
+        target = self._history[self._filled:self._filled + len(piece)]
+        if piece.shape[1] == 1:
+            target[:] = piece[:, 0]
+        else:
+            np.mean(piece, axis=-1, out=target)
+        self._filled += len(piece)
+        if self._filled == len(self._history):
+            self._filled = 0
+            self._detect(self._history)
+
+    def _detect(self, history):
+        """Find the hum fundamental and its audible harmonics in ``history`` and redesign the notches"""
+        # Only the lowest few hundred Hz matter, so average groups of samples down first
+        history = history[:len(history) // self._decimation * self._decimation]
+        decimated = history.reshape(-1, self._decimation).mean(axis=-1)
+        power = np.abs(np.fft.rfft(decimated * np.hanning(len(decimated)))) ** 2 + 1e-20
+        resolution = self.sample_rate / len(history)
+
+        # Search the nominal frequencies until hum is found, then only around it
+        # and with a lower threshold so a tracked hum is not dropped on and off
+        if self.fundamental is None:
+            candidates = [(frequency, 0.03 * frequency) for frequency in MAINS_FREQUENCIES]
+            threshold = self.threshold
+        else:
+            candidates = [(self.fundamental, 0.5)]
+            threshold = self.threshold / 3
+        best = None
+        for nominal, span in candidates:
+            frequencies, prominences = self._harmonics(power, resolution, nominal, span)
+            audible = prominences > threshold
+            # A lone high harmonic is more likely a chance peak than hum
+            if not audible[0] and audible.sum() < 2:
+                continue
+            numbers = np.flatnonzero(audible) + 1
+            weights = prominences[audible]
+            score = np.sum(np.log(weights))
+            if best is None or score > best[0]:
+                # Each audible harmonic estimates the fundamental, the clearest ones count most
+                fundamental = float(np.sum(frequencies[audible] / numbers * weights) / weights.sum())
+                best = (score, fundamental, numbers)
+
+        if best is None:
+            if self.fundamental is not None:
+                self.fundamental = None
+                self.notched = np.zeros(0, dtype=int)
+                self._sos = None
+                self._zi = None
+            return
+        _, fundamental, numbers = best
+        if self.fundamental is not None:
+            fundamental = 0.5 * (self.fundamental + fundamental)
+        self._design(fundamental, numbers)
+
+    def _harmonics(self, power, resolution, nominal, span):
+        """Peak frequency and prominence of each harmonic of a fundamental within ``nominal`` ± ``span`` Hz"""
+        numbers = np.arange(1, self.harmonics + 1)
+        low = np.maximum((numbers * (nominal - span) / resolution).astype(int), 1)
+        high = np.ceil(numbers * (nominal + span) / resolution).astype(int) + 1
+        offsets = np.arange(high[-1] - low[-1])
+        search = np.minimum(low[:, np.newaxis] + offsets, len(power) - 1)
+        candidates = np.where(search < high[:, np.newaxis], power[search], 0)
+        peak = search[numbers - 1, np.argmax(candidates, axis=-1)]
+
+        # Parabolic interpolation of the log power places the peak between bins
+        a, b, c = np.log(power[np.minimum(peak[:, np.newaxis] + [-1, 0, 1], len(power) - 1)]).T
+        denominator = a - 2 * b + c
+        offset = np.where(denominator < 0, 0.5 * (a - c) / np.where(denominator < 0, denominator, -1), 0)
+        frequencies = (peak + np.clip(offset, -0.5, 0.5)) * resolution
+
+        # Compare against the median of the spectrum within 10 Hz, leaving out the peak itself
+        reach = max(int(10 / resolution), 4)
+        around = np.r_[-reach:-2, 3:reach + 1]
+        neighbours = power[np.clip(peak[:, np.newaxis] + around, 1, len(power) - 1)]
+        return frequencies, power[peak] / np.median(neighbours, axis=-1)
+
+    def _design(self, fundamental, numbers):
+        """Set notches at ``numbers`` times ``fundamental``, keeping the state of harmonics still notched"""
+        zi = np.zeros((len(numbers), 2, self.channels))
+        if self._zi is not None:
+            for i, number in enumerate(numbers):
+                previous = np.flatnonzero(self.notched == number)
+                if len(previous):
+                    zi[i] = self._zi[previous[0]]
+        self.fundamental = fundamental
+        self.notched = numbers
+        self._sos = notch_sections(numbers * fundamental, self.bandwidth, self.sample_rate)
+        self._zi = zi
+
+    def stats(self):
+        """Tracked fundamental and the notched harmonic frequencies"""
+        return {
+            'fundamental': self.fundamental,
+            'harmonics': (self.notched * self.fundamental).tolist() if self.fundamental is not None else [],
+        }
@@ -0,0 +1,139 @@
+import math
+import time
+
+import numpy as np
+
+# Hot-path stages, in the order a block passes through them
+STAGES = ('hum', 'vad', 'window', 'fft', 'magnitude', 'noise_profile', 'gain', 'smoothing', 'ifft', 'normalize')
+(HUM, VAD, WINDOW, FFT, MAGNITUDE, NOISE_PROFILE, GAIN, SMOOTHING, IFFT, NORMALIZE) = range(len(STAGES))
+
+class LatencyHistogram:
+    """Fixed-size histogram of durations with logarithmic bins from 1 us to 10 s"""
+
+    MIN_SECONDS = 1e-6
+    DECADES = 7
+    BINS_PER_DECADE = 20
+
+    def __init__(self):
+        self.counts = np.zeros(self.DECADES * self.BINS_PER_DECADE + 1, dtype=np.int64)
+        self.reset()
+
+    def reset(self):
+        """Clear all recorded durations"""
+        self.counts.fill(0)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        """Add one duration"""
+        if seconds > self.MIN_SECONDS:
+            index = int(math.log10(seconds / self.MIN_SECONDS) * self.BINS_PER_DECADE) + 1
+            if index >= len(self.counts):
+                index = len(self.counts) - 1
+        else:
+            index = 0
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q: float):
+        """Upper edge of the bin holding the q-th percentile, in seconds"""
+        if not self.count:
+            return 0.0
+        index = int(np.searchsorted(np.cumsum(self.counts), self.count * q / 100))
+        return min(self.MIN_SECONDS * 10 ** (index / self.BINS_PER_DECADE), self.max)
+
+    def summary(self):
+        """Count, mean, p50, p99 and max in milliseconds"""
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'p50_ms': self.percentile(50) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'max_ms': self.max * 1000,
+        }
+
+class Instrumentation:
+    """Per-stage timing and stream event counters for the live hot path
+
+    A block is bracketed by ``begin_block`` and ``end_block``; in between,
+    ``mark(stage)`` charges the time since the previous mark to ``stage``.
+    Stages may be marked several times per block (once per STFT frame) and
+    are recorded as their per-block totals. When instrumentation is off the
+    hot path holds ``None`` instead of an instance and skips every call.
+    """
+
+    MAX_QUEUE_DEPTH = 64
+
+    def __init__(self, block_budget: float):
+        self.block_budget = block_budget  # Real-time budget of one block in seconds
+        self.stages = [LatencyHistogram() for _ in STAGES]
+        self.block = LatencyHistogram()
+        self.queue_depths = np.zeros(self.MAX_QUEUE_DEPTH + 1, dtype=np.int64)
+        self._stage_totals = [0.0] * len(STAGES)
+        self.reset()
+
+    def reset(self):
+        """Clear all histograms and counters"""
+        for histogram in self.stages:
+            histogram.reset()
+        self.block.reset()
+        self.queue_depths.fill(0)
+        self.queue_depth = 0
+        self.deadline_misses = 0
+        self.underruns = 0
+        self.overruns = 0
+        self.fallback_raw = 0
+        self._block_start = self._last = time.perf_counter()
+
+    def begin_block(self):
+        """Start timing a block"""
+        totals = self._stage_totals
+        for i in range(len(totals)):
+            totals[i] = 0.0
+        self._block_start = self._last = time.perf_counter()
+
+    def mark(self, stage: int):
+        """Charge the time since the previous mark to ``stage``"""
+        now = time.perf_counter()
+        self._stage_totals[stage] += now - self._last
+        self._last = now
+
+    def end_block(self):
+        """Record the stage totals and the whole block duration"""
+        elapsed = time.perf_counter() - self._block_start
+        for histogram, total in zip(self.stages, self._stage_totals):
+            if total:
+                histogram.record(total)
+        self.block.record(elapsed)
+        if elapsed > self.block_budget:
+            self.deadline_misses += 1
+
+    def record_queue_depth(self, depth: int):
+        """Record how many blocks were waiting for the processing thread"""
+        self.queue_depth = depth
+        self.queue_depths[min(depth, self.MAX_QUEUE_DEPTH)] += 1
+
+    def snapshot(self):
+        """Summaries of every histogram and counter"""
+        depths = self.queue_depths.copy()
+        observed = int(depths.sum())
+        block = self.block.summary()
+        return {
+            'budget_ms': self.block_budget * 1000,
+            'block': block,
+            'load': block['mean_ms'] / (self.block_budget * 1000),
+            'stages': {name: histogram.summary() for name, histogram in zip(STAGES, self.stages)},
+            'deadline_misses': self.deadline_misses,
+            'queue_depth': {
+                'last': self.queue_depth,
+                'mean': float(np.dot(depths, np.arange(len(depths))) / observed) if observed else 0.0,
+                'max': int(np.flatnonzero(depths)[-1]) if observed else 0,
+            },
+            'underruns': self.underruns,
+            'overruns': self.overruns,
+            'fallback_raw': self.fallback_raw,
+        }
@@ -0,0 +1,149 @@
+import time
+from typing import Optional
+
+import numpy as np
+
+from .instrumentation import LatencyHistogram
+from .stft import StreamingSTFT
+
+class SuppressionBackend:
+    """Denoising engine run by AudioProcessor on blocks of audio
+
+    ``process`` denoises a (samples, channels) array holding one or more
+    consecutive blocks. The worker thread hands a backend up to
+    ``max_batch_blocks`` pending blocks at once when it falls behind.
+    """
+
+    name = None
+    label = None
+    max_batch_blocks = 1
+
+    def __init__(self, chunk_size: int):
+        self.chunk_size = chunk_size
+        self.cost = LatencyHistogram()  # Processing time per block
+        self.batches = 0
+        self.blocks = 0
+        self.first_block_at = None  # perf_counter time the first block was done
+        self.last_block_cost = 0.0  # Seconds per block of the latest call
+
+    @property
+    def latency(self):
+        """Delay the backend adds between input and output in seconds"""
+        return 0.0
+
+    def set_channels(self, channels: int):
+        """Resize any per-channel state"""
+
+    def reset(self):
+        """Forget any state learned from the signal"""
+
+    def process(self, audio, out=None):
+        """Denoise ``audio`` and record the cost per block"""
+        start = time.perf_counter()
+        processed = self._process(audio, out)
+        blocks = max(len(audio) // self.chunk_size, 1)
+        per_block = (time.perf_counter() - start) / blocks
+        for _ in range(blocks):
+            self.cost.record(per_block)
+        self.last_block_cost = per_block
+        self.batches += 1
+        self.blocks += blocks
+        if self.first_block_at is None:
+            self.first_block_at = time.perf_counter()
+        return processed
+
+    def _process(self, audio, out):
+        raise NotImplementedError
+
+    def stats(self):
+        """Per-block cost summary and batching counters"""
+        summary = self.cost.summary()
+        summary['name'] = self.name
+        summary['batches'] = self.batches
+        summary['mean_batch_blocks'] = self.blocks / self.batches if self.batches else 0.0
+        return summary
+
+class SpectralGatingBackend(SuppressionBackend):
+    """The processor's own spectral gating"""
+
+    name = 'spectral_gating'
+    label = 'Spectral gating'
+
+    def __init__(self, suppressor):
+        super().__init__(suppressor.chunk_size)
+        self.suppressor = suppressor
+
+    @property
+    def latency(self):
+        return self.suppressor.algorithmic_latency
+
+    def reset(self):
+        self.suppressor.reset_noise_profile()
+
+    def _process(self, audio, out):
+        return self.suppressor._apply_noise_suppression(audio, out)
+
+class MaskModelBackend(SuppressionBackend):
+    """Learned spectral mask from a TorchScript model, run on the CPU
+
+    The model maps a (frames, bins) float32 tensor of STFT magnitudes with
+    ``bins = chunk_size // 2 + 1`` to a mask of the same shape in [0, 1].
+    Frames of every batched block and channel go through one inference
+    call. torch is only imported when this backend is created.
+    """
+
+    name = 'neural_mask'
+    label = 'Neural mask (TorchScript)'
+
+    def __init__(self,
+                 model_path: str,
+                 sample_rate: int = 44100,
+                 chunk_size: int = 1024,
+                 hop_size: Optional[int] = None,
+                 channels: int = 1,
+                 num_threads: int = 1,
+                 max_batch_blocks: int = 4,
+                 warmup_runs: int = 3):
+        import torch
+
+        super().__init__(chunk_size)
+        self._torch = torch
+        self.model_path = model_path
+        self.sample_rate = sample_rate
+        self.hop_size = hop_size or chunk_size // 2
+        self.max_batch_blocks = max_batch_blocks
+
+        # Keep inference to a fixed number of threads next to the audio threads
+        torch.set_num_threads(num_threads)
+        self.model = torch.jit.load(model_path, map_location='cpu')
+        self.model.eval()
+        self.set_channels(channels)
+        self._warm_up(warmup_runs)
+
+    @property
+    def latency(self):
+        return self.stft.latency / self.sample_rate
+
+    def set_channels(self, channels: int):
+        self.stft = StreamingSTFT(self.chunk_size, self.hop_size, channels)
+
+    def reset(self):
+        self.stft.reset()
+
+    def _warm_up(self, runs: int):
+        """Run the model on silence so the first real block does not pay for JIT optimization"""
+        frames = self.max_batch_blocks * self.chunk_size // self.hop_size * self.stft.channels
+        silence = self._torch.zeros((frames, self.chunk_size // 2 + 1))
+        with self._torch.inference_mode():
+            for _ in range(runs):
+                self.model(silence)
+
+    def _process(self, audio, out):
+        return self.stft.process_batch(audio, self._apply_mask, out)
+
+    def _apply_mask(self, spectra):
+        """Multiply (frames, channels, bins) spectra by the model's mask"""
+        magnitude = np.abs(spectra).astype(np.float32).reshape(-1, spectra.shape[-1])
+        with self._torch.inference_mode():
+            mask = self.model(self._torch.from_numpy(magnitude)).numpy()
+        return spectra * np.clip(mask, 0.0, 1.0).reshape(spectra.shape)
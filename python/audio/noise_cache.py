@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Optional
+
+import numpy as np
+
+def default_cache_directory():
+    """Per-user cache directory for learned noise profiles"""
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'AINoiseCancellation', 'noise_profiles')
+
+class NoiseProfileCache:
+    """On-disk cache of learned noise profiles
+
+    Profiles are keyed by input device name, sample rate and chunk size and
+    stored one per ``.npz`` file, written atomically. A loaded profile is
+    given a confidence that halves every ``half_life`` seconds since it was
+    saved; profiles older than ``max_age`` are ignored and deleted, and only
+    the ``max_entries`` most recently used profiles are kept.
+    """
+
+    VERSION = 1
+
+    def __init__(self,
+                 directory: Optional[str] = None,
+                 max_entries: int = 32,
+                 max_age: float = 30 * 24 * 3600,
+                 half_life: float = 24 * 3600):
+        self.directory = directory or default_cache_directory()
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.half_life = half_life
+
+    def _path(self, device_name: str, sample_rate: int, chunk_size: int):
+        """File holding the profile for one device configuration"""
+        key = f"{device_name}|{sample_rate}|{chunk_size}".encode('utf-8')
+        return os.path.join(self.directory, hashlib.sha1(key).hexdigest()[:16] + '.npz')
+
+    def save(self, device_name: str, sample_rate: int, chunk_size: int, noise_profile, noise_std):
+        """Store a learned profile, replacing any previous one for the same key"""
+        metadata = {
+            'version': self.VERSION,
+            'device': device_name,
+            'sample_rate': sample_rate,
+            'chunk_size': chunk_size,
+            'saved_at': time.time(),
+        }
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    np.savez(f, noise_profile=noise_profile, noise_std=noise_std,
+                             metadata=np.array(json.dumps(metadata)))
+                os.replace(temp_path, self._path(device_name, sample_rate, chunk_size))
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+            self.evict()
+            return True
+        except OSError as e:
+            print(f"Could not save noise profile: {e}")
+            return False
+
+    def load(self, device_name: str, sample_rate: int, chunk_size: int):
+        """Return (noise_profile, noise_std, confidence) or None if no usable profile exists
+
+        Confidence is 1.0 for a profile saved just now and decays towards 0
+        as the profile gets older.
+        """
+        path = self._path(device_name, sample_rate, chunk_size)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                metadata = json.loads(str(data['metadata']))
+                noise_profile = data['noise_profile']
+                noise_std = data['noise_std']
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Discarding unreadable noise profile: {e}")
+            self._remove(path)
+            return None
+
+        bins = chunk_size // 2 + 1
+        valid = (metadata.get('version') == self.VERSION and
+                 metadata.get('device') == device_name and
+                 metadata.get('sample_rate') == sample_rate and
+                 metadata.get('chunk_size') == chunk_size and
+                 noise_profile.shape[-1] == bins and noise_std.shape == noise_profile.shape and
+                 np.all(np.isfinite(noise_profile)) and np.all(np.isfinite(noise_std)) and
+                 np.all(noise_profile >= 0) and np.all(noise_std >= 0))
+        age = time.time() - metadata.get('saved_at', 0)
+        if not valid or age > self.max_age:
+            self._remove(path)
+            return None
+
+        # Mark as recently used for eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        confidence = 0.5 ** (max(age, 0) / self.half_life)
+        return noise_profile, noise_std, confidence
+
+    def evict(self):
+        """Delete expired profiles and all but the most recently used ``max_entries``"""
+        try:
+            entries = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                       if name.endswith('.npz')]
+            entries.sort(key=os.path.getmtime, reverse=True)
+        except OSError:
+            return
+        now = time.time()
+        for index, path in enumerate(entries):
+            try:
+                expired = now - os.path.getmtime(path) > self.max_age
+            except OSError:
+                continue
+            if index >= self.max_entries or expired:
+                self._remove(path)
+
+    def clear(self):
+        """Delete every cached profile"""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if name.endswith('.npz'):
+                self._remove(os.path.join(self.directory, name))
+
+    def _remove(self, path: str):
+        """Delete a cache file, ignoring files that are already gone"""
+        try:
+            os.remove(path)
+        except OSError:
+            pass
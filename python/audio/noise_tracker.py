@@ -0,0 +1,117 @@
+import numpy as np
+
+# The gate was tuned on the learned profile, the mean noise magnitude times
+# 1.5 and the RMS deviation of magnitudes from it. For Rayleigh distributed
+# noise magnitudes with power P these are 1.5 * sqrt(pi / 4) * sqrt(P) and
+# sqrt((4 - pi) / 4 + 0.25 * pi / 4) * sqrt(P).
+PROFILE_SCALE = 1.5 * np.sqrt(np.pi / 4)
+STD_SCALE = np.sqrt((4 - np.pi) / 4 + 0.25 * np.pi / 4)
+
+class NoiseTracker:
+    """Minima controlled recursive averaging (MCRA) of the noise power in every bin
+
+    Each frame's power is smoothed over time and its running minimum is
+    tracked over ``window`` to ``2 * window`` frames. Where the smoothed
+    power stands ``presence_threshold`` times above that minimum, speech is
+    taken to be present. The noise power follows the frame power with a
+    time constant that grows with the smoothed speech presence
+    probability, so it keeps adapting in speech pauses and holds still
+    during speech. All state is preallocated per bin and every update is a
+    fixed number of in-place array operations.
+    """
+
+    # Arrays holding the estimate between updates, e.g. to gather and scatter rows
+    STATE = ('noise_power', 'presence', '_power', '_minimum', '_window_minimum')
+
+    def __init__(self,
+                 shape,
+                 dtype=np.float64,
+                 window: int = 128,
+                 power_smoothing: float = 0.8,
+                 presence_threshold: float = 5.0,
+                 presence_smoothing: float = 0.2,
+                 noise_smoothing: float = 0.95):
+        self.shape = tuple(shape)
+        self.window = window  # Frames per minimum search window
+        self.power_smoothing = power_smoothing
+        self.presence_threshold = presence_threshold
+        self.presence_smoothing = presence_smoothing
+        self.noise_smoothing = noise_smoothing
+        self.noise_power = np.zeros(self.shape, dtype)
+        self.presence = np.zeros(self.shape, dtype)  # Smoothed speech presence probability
+        self._power = np.zeros(self.shape, dtype)  # Smoothed frame power
+        self._minimum = np.zeros(self.shape, dtype)
+        self._window_minimum = np.zeros(self.shape, dtype)  # Minimum of the current window so far
+        self._frame_power = np.empty(self.shape, dtype)
+        self._scratch = np.empty(self.shape, dtype)
+        self._present = np.empty(self.shape, bool)
+        self.reset()
+
+    def reset(self):
+        """Forget the noise estimate; the next frame starts it again"""
+        self.frames = 0
+        self.presence.fill(0)
+
+    def seed(self, noise_power, rows=None):
+        """Start from a known noise power instead of the next frame
+
+        With a boolean ``rows`` mask only those rows start again, taking
+        their rows of ``noise_power``, and the frame count is kept.
+        """
+        if rows is not None:
+            for state in (self.noise_power, self._power, self._minimum, self._window_minimum):
+                state[rows] = noise_power[rows]
+            self.presence[rows] = 0
+            return
+        for state in (self.noise_power, self._power, self._minimum, self._window_minimum):
+            state[:] = noise_power
+        self.presence.fill(0)
+        self.frames = 1
+
+    def update(self, magnitude, steps: int = 1):
+        """Fold one magnitude spectrum into the estimate
+
+        ``steps`` counts the frame as that many identical frames in one
+        update, for callers that only look at every few frames.
+        """
+        power = np.multiply(magnitude, magnitude, out=self._frame_power)
+        if self.frames == 0:
+            self.seed(power)
+            return
+
+        # Recursive smoothing of the frame power
+        smoothing = self.power_smoothing ** steps
+        self._power *= smoothing
+        self._power += np.multiply(power, 1 - smoothing, out=self._scratch)
+
+        # Running minimum, restarted from the window's own minimum every window
+        np.minimum(self._minimum, self._power, out=self._minimum)
+        np.minimum(self._window_minimum, self._power, out=self._window_minimum)
+        if (self.frames + steps) // self.window != self.frames // self.window:
+            self._minimum[:] = self._window_minimum
+            self._window_minimum[:] = self._power
+        self.frames += steps
+
+        # Speech presence where the smoothed power is well above the minimum
+        np.greater(self._power, np.multiply(self._minimum, self.presence_threshold, out=self._scratch),
+                   out=self._present)
+        smoothing = self.presence_smoothing ** steps
+        self.presence *= smoothing
+        np.copyto(self._scratch, self._present)  # Mixed bool and float math would buffer
+        self._scratch *= 1 - smoothing
+        self.presence += self._scratch
+
+        # Noise follows the frame power more slowly the likelier speech is
+        alpha = np.multiply(self.presence, 1 - self.noise_smoothing, out=self._scratch)
+        alpha += self.noise_smoothing
+        if steps > 1:
+            alpha **= steps
+        self.noise_power -= power
+        self.noise_power *= alpha
+        self.noise_power += power
+
+    def profile(self, noise_profile, noise_std):
+        """Write the noise profile and deviation the gate expects into the given arrays"""
+        np.sqrt(self.noise_power, out=noise_profile)
+        np.multiply(noise_profile, STD_SCALE, out=noise_std)
+        noise_profile *= PROFILE_SCALE
@@ -1,77 +1,387 @@
 import numpy as np
-import sounddevice as sd
-import torch
-import torchaudio
 from typing import Optional, Callable
-import queue
 import threading
-from scipy import signal
+import time
 
-class AudioProcessor:
+from .backends import SoundDeviceBackend
+from .devices import DeviceRegistry
+from .models import SpectralGatingBackend, MaskModelBackend
+from .noise_cache import NoiseProfileCache
+from .quality import QualityLadder
+from .ring_buffer import BlockRingBuffer
+from .suppressor import NoiseSuppressor
+from .tap import INPUT, OUTPUT, TapRecorder
+
+# Output fades around a reconfiguration
+FADE_OUT, FADE_IN = -1, 1
+
+# Default for noise_cache, so that an explicit None can disable the cache
+_DEFAULT_NOISE_CACHE = object()
+
+class AudioProcessor(NoiseSuppressor):
+    STREAM_MODES = ('threaded', 'callback')
+    
     def __init__(self, 
                  sample_rate: int = 44100,
                  channels: int = 1,
                  chunk_size: int = 1024,
                  input_device: Optional[str] = None,
-                 output_device: Optional[str] = None):
-        self.sample_rate = sample_rate
-        self.channels = channels
-        self.chunk_size = chunk_size
+                 output_device: Optional[str] = None,
+                 hop_size: Optional[int] = None,
+                 buffer_depth: int = 8,
+                 max_latency_blocks: int = 2,
+                 underrun_policy: str = 'passthrough',
+                 stream_mode: str = 'threaded',
+                 noise_cache: Optional[NoiseProfileCache] = _DEFAULT_NOISE_CACHE,
+                 stream_backend=None,
+                 dtype=np.float64,
+                 fft_workers: Optional[int] = None):
         self.input_device = input_device
         self.output_device = output_device
+        self.input_device_name = input_device if isinstance(input_device, str) else None
+        self.output_device_name = output_device if isinstance(output_device, str) else None
         self.is_running = False
         self.feedback_enabled = True
         self.filter_enabled = True  # Add filter toggle flag
-        self.audio_queue = queue.Queue()
-        self.processed_queue = queue.Queue()
         self.stream_thread = None
+        self.stream_started_at = None  # perf_counter time start_stream last returned
         self.processing_thread = None
         
         # Initialize output volume parameter (0.0 to 1.0)
         self.output_volume = 1.0  # Default to 100% volume
         
-        # Initialize noise suppression parameters with much more aggressive values
-        self.noise_threshold = 0.35  # Increased from 0.05 to 0.35 (7x more aggressive)
-        self.voice_threshold = 0.25  # Increased from 0.15 to 0.25 (more selective for voice)
-        self.smoothing_factor = 0.99  # Increased from 0.98 to 0.99 for more stable noise profile
-        self.noise_learning_rate = 0.001
-        self.min_noise_floor = 0.0001
-        
-        # AC-specific parameters with increased suppression
-        self.ac_freq_range = (30, 300)  # Widened AC frequency range to catch more noise
-        self.ac_bins = None  # Will be initialized in _init_ac_bins
-        self.ac_suppression_factor = 0.98  # Increased from 0.95 to 0.98 (much stronger AC suppression)
-        
-        # Initialize noise profile and statistics
-        self.noise_profile = np.zeros(chunk_size // 2 + 1)  # For FFT bins
-        self.noise_std = np.zeros(chunk_size // 2 + 1)
-        self.signal_energy = 0
-        self.noise_energy = 0
-        self.learning_noise = True
-        self.noise_samples = 0
-        self.max_noise_samples = 300  # Increased for better noise learning
-        
-        # Initialize AC frequency bins
-        self._init_ac_bins()
-        
-    def _init_ac_bins(self):
-        """Initialize the frequency bins that correspond to AC noise"""
-        freqs = np.fft.rfftfreq(self.chunk_size, 1/self.sample_rate)
-        self.ac_bins = np.where((freqs >= self.ac_freq_range[0]) & 
-                              (freqs <= self.ac_freq_range[1]))[0]
-        
-    def initialize_model(self):
-        """Initialize the noise suppression model"""
-        # For now, we'll use a simple noise suppression approach
-        # This will be replaced with a more sophisticated model later
-        pass
+        # Initialize noise suppression state shared with the offline path
+        super().__init__(sample_rate=sample_rate, channels=channels,
+                         chunk_size=chunk_size, hop_size=hop_size,
+                         dtype=dtype, fft_workers=fft_workers)
+        
+        # Preallocated ring buffers between audio_callback and the worker
+        self.buffer_depth = buffer_depth
+        self.max_latency_blocks = max_latency_blocks  # Processed blocks allowed to queue up for output
+        self.underrun_policy = underrun_policy  # 'passthrough', 'repeat' or 'silence'
+        self._init_buffers(channels)
+        
+        # 'threaded' hands blocks to the processing thread, 'callback' denoises
+        # inside the audio callback itself
+        self.stream_mode = stream_mode
+        self._block_index = 0
+        self._device_latency = 0.0  # Stream latency reported when opening the device
+        self._latency = {'device': 0.0, 'pipeline': 0.0, 'max_round_trip': 0.0}
+        
+        # Learned noise profiles persist across restarts; None disables this
+        self.noise_cache = NoiseProfileCache() if noise_cache is _DEFAULT_NOISE_CACHE else noise_cache
+        
+        # Source of devices and streams; a VirtualBackend runs without sound hardware
+        self.stream_backend = stream_backend or SoundDeviceBackend()
+        self._device_registry = None
+        
+        # Denoising backends by name; spectral gating is always available
+        gating = SpectralGatingBackend(self)
+        self.backends = {gating.name: gating}
+        self.backend = gating
+        
+        # Gating quality steps down while blocks miss their real-time budget
+        self.adaptive_quality = True
+        self.quality = QualityLadder(chunk_size / sample_rate)
+        self._quality_base = {}  # Settings overridden by the current quality level
+        
+        # Live sample rate and block size changes, built in the background and
+        # taken over by the stream thread between blocks
+        self._processing_lock = threading.Lock()  # Held while the worker or callback processes audio
+        self._reconfigure_thread = None
+        self._resized = None  # Resized copy waiting to be taken over
+        self._fade = 0  # FADE_OUT or FADE_IN while the output ramps around a reconfiguration
+        self._fade_hold = 0  # Silent blocks before fading in, until processed audio arrives
+        self._faded = threading.Event()  # Set once the output has faded out
+        self._processed = threading.Event()  # Set whenever the worker has put out a batch
+        
+        # Recorder of every stream block in and out, None when not recording
+        self.tap = None
+        self.output_channels = self.channels  # Channels of the output stream, may differ from the input
+        
+    def _init_buffers(self, channels: int):
+        """Allocate the ring buffers and worker scratch blocks for the given channel count"""
+        output_policy = None if self.underrun_policy == 'passthrough' else self.underrun_policy
+        self.input_buffer = BlockRingBuffer(self.buffer_depth, self.chunk_size, channels, underrun_policy=None)
+        self.output_buffer = BlockRingBuffer(self.buffer_depth, self.chunk_size, channels, underrun_policy=output_policy)
+        # Room for a whole ring of blocks so backends can process a backlog in one call
+        self._work_blocks = np.zeros((self.buffer_depth, self.chunk_size, channels), dtype=np.float32)
+        self._processed_blocks = np.zeros((self.buffer_depth, self.chunk_size, channels), self.dtype)
+        self._block_tags = np.zeros(self.buffer_depth, dtype=np.int64)
+        self._missed_blocks = 0  # Input overruns and output underruns the worker has seen
+        self._work_block = self._work_blocks[0]
+        self._processed_block = self._processed_blocks[0]
+        self._output_block = np.zeros((self.chunk_size, channels), dtype=np.float32)
+        self._fade_ramp = np.linspace(0, 1, self.chunk_size, dtype=np.float32)[:, np.newaxis]
+        
+    def set_channels(self, channels: int):
+        """Resize the per-channel noise state and ring buffers for a new channel count"""
+        super().set_channels(channels)
+        self._init_buffers(channels)
+        if self.tap is not None:
+            self.tap = self.tap.reopen(self.sample_rate, self.chunk_size, (channels, self.output_channels))
+        for backend in self.backends.values():
+            backend.set_channels(channels)
+        
+    def resized(self, sample_rate: int, chunk_size: int):
+        """A copy of this processor for another sample rate and block size, with its own buffers"""
+        resized = super().resized(sample_rate, chunk_size)
+        resized._init_buffers(self.channels)
+        resized.quality = QualityLadder(chunk_size / sample_rate)
+        resized._latency = {'device': 0.0, 'pipeline': 0.0, 'max_round_trip': 0.0}
+        return resized
+        
+    def adopt(self, resized):
+        """Take over a resized copy; backends other than spectral gating have to be loaded again"""
+        super().adopt(resized)
+        gating = self.backends[SpectralGatingBackend.name]
+        gating.chunk_size = self.chunk_size
+        for name in list(self.backends):
+            if self.backends[name] is not gating:
+                print(f"{self.backends.pop(name).label} has to be loaded again for the new block size")
+        self.backend = gating
+        self._apply_quality_level(0)
+        if self.tap is not None:
+            # Recording goes on in new files at the new rate and block size
+            self.tap = self.tap.reopen(self.sample_rate, self.chunk_size, (self.channels, self.output_channels))
+        
+    @property
+    def reconfiguring(self):
+        """Whether a sample rate or block size change has not been taken over yet"""
+        thread = self._reconfigure_thread
+        return (thread is not None and thread.is_alive()) or self._resized is not None
+        
+    def reconfigure(self, sample_rate: Optional[int] = None, chunk_size: Optional[int] = None):
+        """Change the sample rate and block size without stopping the processing
+
+        The state for the new configuration is built on a background thread
+        and the call returns at once; ``reconfiguring`` stays True until it
+        has been taken over. A running stream then fades out at the end of a
+        block and is reopened with the new settings, fading back in. The
+        processing thread and the noise profile carry on, so there is no
+        new learning phase.
+        """
+        sample_rate = sample_rate or self.sample_rate
+        chunk_size = chunk_size or self.chunk_size
+        if self.backend.name != SpectralGatingBackend.name:
+            raise ValueError(f"{self.backend.label} cannot change its block size, switch to spectral gating first")
+        # Backends without check_blocksize stream any block size
+        check_blocksize = getattr(self.stream_backend, 'check_blocksize', None)
+        if check_blocksize is not None and not check_blocksize(chunk_size):
+            raise ValueError(f"The audio device cannot stream {chunk_size} sample blocks")
+        if self.reconfiguring:
+            raise ValueError("A reconfiguration is already in progress")
+        self._reconfigure_thread = threading.Thread(target=self._prepare_reconfiguration,
+                                                    args=(sample_rate, chunk_size), daemon=True)
+        self._reconfigure_thread.start()
+        
+    def _prepare_reconfiguration(self, sample_rate: int, chunk_size: int):
+        """Build the resized state and hand it to the stream thread, or take it over if there is no stream"""
+        try:
+            # The profile of the old configuration is kept for when it comes back
+            self.save_noise_profile()
+            resized = self.resized(sample_rate, chunk_size)
+        except Exception as e:
+            print(f"Could not reconfigure to {sample_rate} Hz with {chunk_size} sample blocks: {e}")
+            return
+        self._resized = resized
+        if not (self.stream_thread and self.stream_thread.is_alive()):
+            self._adopt_resized()
+        
+    def _adopt_resized(self):
+        """Take over a pending resized copy once no block is being processed"""
+        with self._processing_lock:
+            resized, self._resized = self._resized, None
+            if resized is not None:
+                self.adopt(resized)
+                print(f"Reconfigured to {self.sample_rate} Hz with {self.chunk_size} sample blocks")
+        
+    def start_recording(self, directory: str, **options):
+        """Record the raw input and the output of the stream to files in ``directory``
+
+        ``options`` are passed to TapRecorder, e.g. ``max_file_seconds=60``
+        or ``file_format='flac'``. Blocks are only copied in the audio
+        callback; a background thread writes them out.
+        """
+        self.stop_recording()
+        self.tap = TapRecorder(directory, self.sample_rate, self.chunk_size,
+                               (self.channels, self.output_channels), **options)
+        
+    def stop_recording(self):
+        """Finish writing the recording, returning its final statistics or None if there was none"""
+        tap, self.tap = self.tap, None
+        if tap is None:
+            return None
+        tap.close()
+        return tap.stats()
+        
+    def get_recording_stats(self):
+        """Files, recorded and dropped seconds of the current recording, or None when not recording"""
+        tap = self.tap
+        return tap.stats() if tap is not None else None
+        
+    def _apply_fade(self, outdata):
+        """Ramp the output in after a reconfiguration, or out and then silent before one"""
+        ramp = self._fade_ramp[:len(outdata)]
+        if self._fade == FADE_IN:
+            if self._fade_hold > 0:
+                self._fade_hold -= 1
+                outdata.fill(0)
+            else:
+                outdata *= ramp
+                self._fade = 0
+        elif self._faded.is_set():
+            outdata.fill(0)
+        else:
+            outdata *= ramp[::-1]
+            self._faded.set()
+        
+    def _mix_to_output(self, block, outdata):
+        """Copy a (frames, channels) block to the output, mixing down to fewer output channels"""
+        if outdata.shape[1] == 1 and block.shape[1] > 1:
+            np.mean(block, axis=1, keepdims=True, out=outdata)
+        else:
+            outdata[:] = block[:, :outdata.shape[1]]  # Mono is copied to every output channel
+        
+    def get_buffer_stats(self):
+        """Fill levels and overrun/underrun counters of both ring buffers"""
+        return {
+            'input': self.input_buffer.stats(),
+            'output': self.output_buffer.stats(),
+        }
+        
+    def get_latency(self):
+        """Measured input-to-output latency of the running stream in milliseconds"""
+        algorithmic = self.backend.latency
+        round_trip = self._latency['device'] + self._latency['pipeline'] + algorithmic
+        return {
+            'mode': self.stream_mode,
+            'device_ms': self._latency['device'] * 1000,
+            'pipeline_ms': self._latency['pipeline'] * 1000,
+            'algorithmic_ms': algorithmic * 1000,
+            'round_trip_ms': round_trip * 1000,
+            'max_round_trip_ms': max(self._latency['max_round_trip'], round_trip) * 1000,
+        }
+        
+    def _measure_latency(self, time, pipeline_blocks: int):
+        """Record device and pipeline latency for the current callback"""
+        device = 0.0
+        if time is not None:
+            device = time.outputBufferDacTime - time.inputBufferAdcTime
+        if device <= 0:
+            device = self._device_latency  # Host API does not report buffer times
+        pipeline = pipeline_blocks * self.chunk_size / self.sample_rate
+        self._latency['device'] = device
+        self._latency['pipeline'] = pipeline
+        round_trip = device + pipeline + self.backend.latency
+        if round_trip > self._latency['max_round_trip']:
+            self._latency['max_round_trip'] = round_trip
+        
+    def initialize_model(self, backend: str = SpectralGatingBackend.name, **options):
+        """Create a denoising backend if needed and make it the active one
+
+        'spectral_gating' is always available. 'neural_mask' loads a
+        TorchScript mask model and takes ``model_path`` plus the optional
+        ``num_threads``, ``max_batch_blocks`` and ``warmup_runs``; passing
+        options again reloads it.
+        """
+        if backend == MaskModelBackend.name:
+            if options or backend not in self.backends:
+                self.backends[backend] = MaskModelBackend(sample_rate=self.sample_rate,
+                                                          chunk_size=self.chunk_size,
+                                                          channels=self.channels, **options)
+        elif backend not in self.backends:
+            raise ValueError(f"Unknown backend: {backend}")
+        self.set_backend(backend)
+        return self.backend
+        
+    def set_backend(self, name: str):
+        """Switch to an initialized backend; takes effect with the next block"""
+        if name not in self.backends:
+            raise ValueError(f"Backend {name} has not been initialized")
+        self.backend = self.backends[name]
+        
+    def get_backend_stats(self):
+        """Per-block cost of every initialized backend and the name of the active one"""
+        return {
+            'active': self.backend.name,
+            'backends': {name: backend.stats() for name, backend in self.backends.items()},
+        }
+        
+    def get_quality(self):
+        """Current quality level, its transition counts and the measured cost per level"""
+        stats = self.quality.stats()
+        stats['enabled'] = self.adaptive_quality
+        return stats
+        
+    def set_adaptive_quality(self, enabled: bool):
+        """Enable or disable quality degradation under CPU pressure"""
+        self.adaptive_quality = enabled
+        if not enabled:
+            self.reset_quality()
+        
+    def reset_quality(self):
+        """Return to full quality and forget the measured costs"""
+        self.quality.reset()
+        self._apply_quality_level(0)
+        
+    def _apply_quality_level(self, level: int):
+        """Set the suppressor settings of a quality level, restoring those it no longer overrides"""
+        overrides = self.quality.settings(level)
+        for name in list(self._quality_base):
+            if name not in overrides:
+                setattr(self, name, self._quality_base.pop(name))
+        for name, value in overrides.items():
+            self._quality_base.setdefault(name, getattr(self, name))
+            setattr(self, name, value)
+        
+    def _update_quality(self, behind: bool = False):
+        """Feed the cost of the last processed block to the quality ladder"""
+        if not self.adaptive_quality or self.backend.name != SpectralGatingBackend.name:
+            return
+        level = self.quality.record(self.backend.last_block_cost, behind)
+        if level is not None:
+            self._apply_quality_level(level)
+            print(f"Processing quality: {self.quality.name}")
+        
+    def restore_noise_profile(self):
+        """Load the cached noise profile for the current input device, if any"""
+        if self.noise_cache is None or self.input_device_name is None:
+            return False
+        cached = self.noise_cache.load(self.input_device_name, self.sample_rate, self.fft_size)
+        if cached is None:
+            return False
+        noise_profile, noise_std, confidence = cached
+        self.load_noise_profile(noise_profile, noise_std, confidence)
+        print(f"Loaded cached noise profile for {self.input_device_name} ({confidence:.0%} confidence)")
+        return True
+        
+    def save_noise_profile(self):
+        """Store the learned noise profile for the current input device
+
+        The profile keeps adapting while blocks are processed, so a copy
+        taken between two blocks is stored.
+        """
+        if self.noise_cache is None or self.input_device_name is None:
+            return False
+        with self._processing_lock:
+            if self.learning_noise:
+                return False
+            noise_profile, noise_std = self.noise_profile.copy(), self.noise_std.copy()
+            rate, frame_size = self.sample_rate, self.fft_size
+        return self.noise_cache.save(self.input_device_name, rate, frame_size, noise_profile, noise_std)
         
     def start_processing(self):
         """Start the audio processing thread"""
-        if self.is_running:
+        if self.processing_thread and self.processing_thread.is_alive():
             return
             
+        self.restore_noise_profile()
+        self.reset_quality()
         self.is_running = True
+        self.input_buffer.reset()
+        self.output_buffer.reset()
+        self._missed_blocks = 0
         self.processing_thread = threading.Thread(target=self._process_audio)
         self.processing_thread.start()
         
@@ -80,192 +390,284 @@ class AudioProcessor:
         self.is_running = False
         if self.processing_thread:
             self.processing_thread.join()
-        if self.stream_thread:
+        if self.stream_thread and self.stream_thread is not threading.current_thread():
             self.stream_thread.join()
+        self.save_noise_profile()
             
+    def wait_for_output(self, timeout: float = 1.0):
+        """Wait until the worker has a processed block ready for the callback
+
+        Streams that are not paced by a clock, such as a fast virtual
+        stream, call this between blocks so the threaded mode runs at the
+        speed of the processing thread instead of underrunning. Returns
+        False if nothing arrived within ``timeout`` seconds.
+        """
+        deadline = time.perf_counter() + timeout
+        while not len(self.output_buffer):
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or not self.is_running:
+                return False
+            self._processed.wait(remaining)
+            self._processed.clear()
+        return True
+        
     def _process_audio(self):
         """Main audio processing loop"""
         while self.is_running:
-            try:
-                # Get audio chunk from queue
-                audio_chunk = self.audio_queue.get(timeout=0.1)
+            if not len(self.input_buffer):
+                # Poll a few times per block so the worker never holds a lock
+                time.sleep(self.chunk_size / self.sample_rate / 8)
+                continue
+                
+            # A reconfiguration swaps the buffers and state between batches
+            with self._processing_lock:
+                # Get audio chunks from the input ring; a backend that batches
+                # takes every pending block at once when the worker fell behind
+                backend = self.backend
+                pending = len(self.input_buffer)
+                count = min(pending, backend.max_batch_blocks, self.buffer_depth)
+                for i in range(count):
+                    self.input_buffer.read(self._work_blocks[i])
+                    self._block_tags[i] = self.input_buffer.last_tag
+                work = self._work_blocks[:count].reshape(count * self.chunk_size, -1)
+                
+                # The worker fell behind if input piled up, or the callback dropped
+                # input or played raw audio since the last batch
+                missed = self.input_buffer.overruns + self.output_buffer.underruns
+                behind = pending > 1 or missed > self._missed_blocks
+                self._missed_blocks = missed
                 
                 # Apply sensitivity adjustment
-                audio_chunk = audio_chunk * self.output_volume
+                work *= self.output_volume
                 
                 # Apply noise suppression if enabled
                 if self.filter_enabled:
-                    processed_chunk = self._apply_noise_suppression(audio_chunk)
+                    processed = backend.process(work, self._processed_blocks[:count].reshape(work.shape))
+                    self._update_quality(behind)
                 else:
-                    processed_chunk = audio_chunk
+                    processed = work
                 
-                # Put processed audio in output queue
-                self.processed_queue.put(processed_chunk)
+                # Put processed audio in the output ring, dropping it if the ring is full
+                for i in range(count):
+                    self.output_buffer.write(processed[i * self.chunk_size:(i + 1) * self.chunk_size],
+                                             int(self._block_tags[i]))
+            self._processed.set()
                 
-            except queue.Empty:
-                continue
-                
-    def _apply_noise_suppression(self, audio_chunk):
-        """Apply noise suppression to the audio chunk using spectral gating"""
-        # Convert to float32 if needed
-        audio = audio_chunk.astype(np.float32)
-        
-        # Apply window function to reduce spectral leakage
-        window = np.hanning(len(audio))
-        audio_windowed = audio * window
-        
-        # Compute FFT
-        spec = np.fft.rfft(audio_windowed, axis=0)
-        magnitude = np.abs(spec)
-        phase = np.angle(spec)
-        
-        # Calculate signal energy
-        current_energy = np.mean(magnitude ** 2)
-        
-        # Update noise profile during initial learning phase
-        if self.learning_noise and self.noise_samples < self.max_noise_samples:
-            # Update overall noise profile with more aggressive learning
-            self.noise_profile = (self.noise_profile * self.noise_samples + magnitude * 1.5) / (self.noise_samples + 1)
-            self.noise_std = np.sqrt((self.noise_std ** 2 * self.noise_samples + (magnitude - self.noise_profile) ** 2) / (self.noise_samples + 1))
-            
-            # Specifically learn AC noise profile with overestimation
-            if self.noise_samples > 50:  # Start learning AC profile after some initial samples
-                ac_profile = np.mean(magnitude[self.ac_bins])
-                self.noise_profile[self.ac_bins] = np.maximum(
-                    self.noise_profile[self.ac_bins],
-                    ac_profile * 2.0  # Double the AC noise estimation
-                )
-            
-            self.noise_samples += 1
-            if self.noise_samples >= self.max_noise_samples:
-                self.learning_noise = False
-                print("Noise profile learning completed")
-        
-        # Calculate noise floor with enhanced AC suppression
-        noise_floor = self.noise_profile + self.noise_std * self.noise_threshold
-        
-        # Apply spectral gating with more aggressive suppression
-        # 1. Compute spectral gain with increased threshold
-        gain = np.maximum(0, (magnitude - noise_floor * 1.5) / magnitude)
-        
-        # 2. Apply stronger suppression to AC frequencies
-        if not self.learning_noise:
-            ac_gain = gain[self.ac_bins] * (1 - self.ac_suppression_factor)
-            gain[self.ac_bins] = np.minimum(gain[self.ac_bins], ac_gain)
-        
-        # 3. Apply voice activity detection with more aggressive threshold
-        is_voice = current_energy > self.voice_threshold
-        if not is_voice:
-            gain *= 0.05  # Reduced from 0.1 to 0.05 for more aggressive noise suppression
-        
-        # 4. Smooth the gain to avoid musical noise
-        gain = signal.medfilt(gain, kernel_size=7)  # Increased kernel size for smoother suppression
-        
-        # 5. Apply gain to magnitude spectrum
-        magnitude = magnitude * gain
-        
-        # 6. Update noise profile slowly
-        if not self.learning_noise:
-            # Update overall noise profile more aggressively
-            self.noise_profile = (self.smoothing_factor * self.noise_profile + 
-                                (1 - self.smoothing_factor) * magnitude * 1.2)
+    def audio_callback(self, indata, outdata, frames, time, status):
+        """Callback for audio stream"""
+        if status:
+            print(f"Status: {status}")
             
-            # Update AC noise profile more aggressively
-            ac_magnitude = magnitude[self.ac_bins]
-            self.noise_profile[self.ac_bins] = np.maximum(
-                self.noise_profile[self.ac_bins],
-                ac_magnitude * 0.9  # Increased from 0.8 to 0.9 for stronger AC suppression
-            )
+        # Put input audio in the processing ring, tagged with its block index
+        instrumentation = self.instrumentation
+        block_index = self._block_index
+        self._block_index += 1
+        if not self.input_buffer.write(indata, block_index) and instrumentation is not None:
+            instrumentation.overruns += 1
+        if instrumentation is not None:
+            instrumentation.record_queue_depth(len(self.input_buffer))
         
-        # Reconstruct signal
-        spec = magnitude * np.exp(1j * phase)
-        processed = np.fft.irfft(spec, axis=0)
-        
-        # Apply inverse window
-        processed = processed / window
+        if not self.feedback_enabled:
+            outdata.fill(0)  # Output silence when feedback is disabled
+            return
         
-        # Normalize
-        processed = processed / (np.max(np.abs(processed)) + 1e-6)
+        # Keep output latency bounded if the worker delivered a burst of blocks
+        backlog = len(self.output_buffer) - self.max_latency_blocks
+        if backlog > 0:
+            self.output_buffer.discard(backlog)
         
-        return processed
-                
-    def audio_callback(self, indata, outdata, frames, time, status):
-        """Callback for audio stream"""
+        # Get processed audio from the output ring, straight into outdata when
+        # the channel counts match
+        direct = outdata.shape[1] == self.output_buffer.channels
+        target = outdata if direct else self._output_block
+        received = self.output_buffer.read(target)
+        if received or self.underrun_policy != 'passthrough':
+            if not direct:
+                self._mix_to_output(target, outdata)
+            # Apply output volume adjustment
+            outdata *= self.output_volume
+            if received:
+                self._measure_latency(time, block_index - self.output_buffer.last_tag)
+                return
+            
+        if instrumentation is not None:
+            instrumentation.underruns += 1
+        if self.underrun_policy == 'passthrough':
+            # Apply output volume adjustment to raw audio as well
+            self._mix_to_output(indata, outdata)
+            outdata *= self.output_volume
+            if instrumentation is not None:
+                instrumentation.fallback_raw += 1
+            
+    def inline_callback(self, indata, outdata, frames, time, status):
+        """Callback for audio stream that denoises each block synchronously"""
         if status:
             print(f"Status: {status}")
             
-        # Put input audio in processing queue
-        self.audio_queue.put(indata.copy())
+        # Apply sensitivity adjustment into the preallocated work block
+        np.multiply(indata, self.output_volume, out=self._work_block)
         
-        # Get processed audio from output queue
-        try:
-            processed_audio = self.processed_queue.get_nowait()
-            if self.feedback_enabled:
-                # Apply output volume adjustment
-                outdata[:] = processed_audio * self.output_volume
-            else:
-                outdata[:] = np.zeros_like(indata)  # Output silence when feedback is disabled
-        except queue.Empty:
-            if self.feedback_enabled:
-                # Apply output volume adjustment to raw audio as well
-                outdata[:] = indata * self.output_volume
-            else:
-                outdata[:] = np.zeros_like(indata)  # Output silence when feedback is disabled
+        # Apply noise suppression if enabled
+        if self.filter_enabled:
+            with self._processing_lock:
+                processed_chunk = self.backend.process(self._work_block, self._processed_block)
+            self._update_quality()
+        else:
+            processed_chunk = self._work_block
+        
+        if self.feedback_enabled:
+            # Apply output volume adjustment
+            self._mix_to_output(processed_chunk, outdata)
+            outdata *= self.output_volume
+            self._measure_latency(time, 0)
+        else:
+            outdata.fill(0)  # Output silence when feedback is disabled
             
     def _run_stream(self):
-        """Run the audio stream in a separate thread"""
+        """Run the audio stream in a separate thread
+
+        A pending reconfiguration is taken over between two streams: the
+        output fades out, the stream closes, the resized state replaces the
+        old one and the stream reopens with the new settings, fading in.
+        """
         try:
-            # Get device info
-            input_info = sd.query_devices(self.input_device)
-            output_info = sd.query_devices(self.output_device)
+            # Get device info, by name when known since a rescan may renumber devices
+            backend = self.stream_backend
+            devices = self.device_registry
+            input_info = devices.find(self.input_device_name or self.input_device, 'input')
+            output_info = devices.find(self.output_device_name or self.output_device, 'output')
+            if input_info is None or output_info is None:
+                raise ValueError("input or output device is no longer available")
             
             # Update channels based on device capabilities
             input_channels = min(self.channels, input_info['max_input_channels'])
             output_channels = min(self.channels, output_info['max_output_channels'])
+            self.output_channels = output_channels
+            if input_channels != self.channels:
+                self.set_channels(input_channels)
+            elif self.tap is not None and self.tap.channels != (input_channels, output_channels):
+                # The output is recorded as the stream plays it
+                self.tap = self.tap.reopen(self.sample_rate, self.chunk_size, (input_channels, output_channels))
             
             # Create stream with correct channel configuration
-            with sd.Stream(
-                device=(self.input_device, self.output_device),
-                channels=(input_channels, output_channels),
-                samplerate=self.sample_rate,
-                blocksize=self.chunk_size,
-                callback=self.audio_callback
-            ):
-                while self.is_running:
-                    sd.sleep(100)
+            mode_callback = self.inline_callback if self.stream_mode == 'callback' else self.audio_callback
+            def callback(indata, outdata, frames, time, status):
+                mode_callback(indata, outdata, frames, time, status)
+                if self._fade:
+                    self._apply_fade(outdata)
+                tap = self.tap
+                if tap is not None:
+                    tap.record(INPUT, indata)
+                    tap.record(OUTPUT, outdata)
+                    
+            self._adopt_resized()
+            while self.is_running:
+                with backend.open_stream(
+                    device=(input_info['index'], output_info['index']),
+                    channels=(input_channels, output_channels),
+                    samplerate=self.sample_rate,
+                    blocksize=self.chunk_size,
+                    callback=callback
+                ) as stream:
+                    self._device_latency = sum(stream.latency)
+                    while self.is_running and stream.active and self._resized is None:
+                        backend.sleep(100)
+                    if not (self.is_running and stream.active):
+                        break
+                    # Let one block fade out before closing the stream
+                    self._faded.clear()
+                    self._fade = FADE_OUT
+                    self._faded.wait(4 * self.chunk_size / self.sample_rate + 0.1)
+                    
+                # Take over the new state and stay silent until it delivers processed audio
+                self._adopt_resized()
+                pipeline_blocks = 1 if self.stream_mode == 'threaded' else 0
+                self._fade_hold = int(np.ceil(self.backend.latency * self.sample_rate / self.chunk_size)) + \
+                    pipeline_blocks
+                self._fade = FADE_IN
+            self._adopt_resized()
         except Exception as e:
             print(f"Error in audio stream: {e}")
             self.stop_processing()
             
-    def start_stream(self):
-        """Start the audio stream in a separate thread"""
+    def start_stream(self, mode: Optional[str] = None):
+        """Start the audio stream in a separate thread
+
+        ``mode`` is 'threaded' to denoise on the processing thread or
+        'callback' to denoise inline in the audio callback; the processing
+        thread is started as needed.
+        """
+        if mode is not None:
+            if mode not in self.STREAM_MODES:
+                raise ValueError(f"Unknown stream mode: {mode}")
+            self.stream_mode = mode
+        
+        self.is_running = True
+        self._block_index = 0
+        self._fade = 0
+        self._latency = {'device': 0.0, 'pipeline': 0.0, 'max_round_trip': 0.0}
+        if self.stream_mode == 'threaded':
+            self.start_processing()
+        else:
+            self.restore_noise_profile()
+            self.reset_quality()
         self.stream_thread = threading.Thread(target=self._run_stream)
         self.stream_thread.start()
+        self.stream_started_at = time.perf_counter()
             
+    @property
+    def device_registry(self):
+        """Cached device list of the current stream backend, created on first use"""
+        registry = self._device_registry
+        if registry is None or registry.backend is not self.stream_backend:
+            if registry is not None:
+                registry.stop()
+            registry = DeviceRegistry(self.stream_backend)
+            registry.start()
+            self._device_registry = registry
+        return registry
+
+    @property
+    def devices_version(self):
+        """Counts the changes of the device list since it was first enumerated"""
+        return self.device_registry.version
+
     def get_available_devices(self):
         """Get list of available audio devices"""
-        return sd.query_devices()
+        return self.device_registry.devices
+
+    def refresh_devices(self):
+        """Enumerate the devices again now, returning True if they changed"""
+        return self.device_registry.refresh()
+
+    def get_supported_sample_rates(self, device_name: str, kind: str = 'input'):
+        """Common sample rates the 'input' or 'output' device accepts at the current channel count"""
+        return self.device_registry.supported_sample_rates(device_name, kind, self.channels)
         
     def set_devices(self, input_device_name: str, output_device_name: str):
         """Set both input and output devices"""
-        devices = self.get_available_devices()
+        devices = self.device_registry
         
         # Find input device
-        input_found = False
-        for i, device in enumerate(devices):
-            if device['name'] == input_device_name:
-                self.input_device = i
-                input_found = True
-                # Update channels based on input device capabilities
-                self.channels = min(self.channels, device['max_input_channels'])
-                break
+        device = devices.find(input_device_name, 'input')
+        if device is not None:
+            self.input_device = device['index']
+            # A different microphone needs its own noise profile
+            if input_device_name != self.input_device_name:
+                self.input_device_name = input_device_name
+                self.reset_noise_profile()
+            # Update channels based on input device capabilities
+            channels = min(self.channels, device['max_input_channels'])
+            if channels != self.channels:
+                print(f"{input_device_name} supports {channels} input channel(s), "
+                      f"processing {channels} instead of {self.channels}")
+                self.set_channels(channels)
+        input_found = device is not None
                 
         # Find output device
-        output_found = False
-        for i, device in enumerate(devices):
-            if device['name'] == output_device_name:
-                self.output_device = i
-                output_found = True
-                break
+        device = devices.find(output_device_name, 'output')
+        if device is not None:
+            self.output_device = device['index']
+            self.output_device_name = output_device_name
                 
-        return input_found and output_found 
\ No newline at end of file
+        return input_found and device is not None 
\ No newline at end of file
@@ -0,0 +1,113 @@
+from collections import deque
+from typing import Optional
+
+# Quality levels from best to cheapest. Each is the NoiseSuppressor
+# settings it overrides and includes every override of the levels above it.
+QUALITY_LEVELS = (
+    ('full', {}),
+    ('fast_smoothing', {'gain_smoothing': 'mean', 'gain_attack_time': 0.0, 'gain_release_time': 0.0}),
+    ('frozen_profile', {'freeze_noise_profile': True}),
+    ('no_smoothing', {'gain_smoothing': 'none'}),
+    ('sparse_gain', {'gain_update_interval': 2}),
+)
+
+def level_settings(levels, level: int):
+    """All setting overrides in effect at ``level``"""
+    settings = {}
+    for _, overrides in levels[:level + 1]:
+        settings.update(overrides)
+    return settings
+
+class QualityLadder:
+    """Steps processing quality down when blocks miss their real-time budget and back up with headroom
+
+    ``record`` is called with the processing time of every block. A block
+    misses when it takes more than ``max_load`` of the ``budget`` or the
+    worker is behind. ``miss_limit`` misses within the last ``window``
+    blocks step one level down. After ``recovery_blocks`` blocks without a
+    miss the ladder steps back up, as long as the level above was last
+    measured to fit in ``headroom`` of the budget; it tries anyway after
+    four times as long, in case the pressure came from elsewhere. No
+    transition happens within ``cooldown`` blocks of the last one.
+    """
+
+    def __init__(self,
+                 budget: float,
+                 levels=QUALITY_LEVELS,
+                 max_load: float = 0.9,
+                 headroom: float = 0.6,
+                 window: int = 8,
+                 miss_limit: int = 2,
+                 recovery_blocks: Optional[int] = None,
+                 cooldown: int = 4):
+        self.budget = budget
+        self.levels = levels
+        self.max_load = max_load
+        self.headroom = headroom
+        self.miss_limit = miss_limit
+        self.recovery_blocks = recovery_blocks or max(int(2.0 / budget), 1)  # About two seconds
+        self.cooldown = cooldown
+        self._recent = deque(maxlen=window)
+        self.reset()
+
+    def reset(self):
+        """Go back to full quality and forget all measurements"""
+        self.level = 0
+        self.transitions = {'down': 0, 'up': 0}
+        self.misses = 0
+        self.level_cost = [None] * len(self.levels)  # Smoothed seconds per block at each level
+        self._recent.clear()
+        self._since_change = 0
+        self._clean_blocks = 0
+
+    @property
+    def name(self):
+        """Name of the current level"""
+        return self.levels[self.level][0]
+
+    def settings(self, level: Optional[int] = None):
+        """Setting overrides of ``level``, by default the current one"""
+        return level_settings(self.levels, self.level if level is None else level)
+
+    def record(self, cost: float, behind: bool = False):
+        """Account one block that took ``cost`` seconds; returns the new level when it changes"""
+        previous = self.level_cost[self.level]
+        self.level_cost[self.level] = cost if previous is None else 0.9 * previous + 0.1 * cost
+
+        miss = behind or cost > self.max_load * self.budget
+        self.misses += miss
+        self._recent.append(miss)
+        self._since_change += 1
+        self._clean_blocks = 0 if miss else self._clean_blocks + 1
+        if self._since_change < self.cooldown:
+            return None
+
+        if sum(self._recent) >= self.miss_limit and self.level < len(self.levels) - 1:
+            return self._change(1)
+        if self.level > 0 and self._clean_blocks >= self.recovery_blocks:
+            above = self.level_cost[self.level - 1]
+            if (above is None or above < self.headroom * self.budget or
+                    self._clean_blocks >= 4 * self.recovery_blocks):
+                return self._change(-1)
+        return None
+
+    def _change(self, step: int):
+        """Move ``step`` levels down (positive) or up (negative)"""
+        self.level += step
+        self.transitions['down' if step > 0 else 'up'] += 1
+        self._recent.clear()
+        self._since_change = 0
+        self._clean_blocks = 0
+        return self.level
+
+    def stats(self):
+        """Current level, transition counts and the measured cost of every level"""
+        return {
+            'level': self.level,
+            'name': self.name,
+            'levels': [name for name, _ in self.levels],
+            'transitions': dict(self.transitions),
+            'misses': self.misses,
+            'budget_ms': self.budget * 1000,
+            'level_cost_ms': [cost * 1000 if cost is not None else None for cost in self.level_cost],
+        }
@@ -0,0 +1,108 @@
+import numpy as np
+
+class BlockRingBuffer:
+    """Single-producer/single-consumer ring of fixed-size float32 audio blocks
+
+    All blocks are preallocated. The producer only advances the write index
+    and the consumer only advances the read index, so no lock is needed:
+    each index is a plain int that is replaced atomically under the GIL and
+    each block copy is a single NumPy call.
+
+    Overruns (writing into a full ring) always drop the incoming block, so
+    the ring never holds more than ``depth`` blocks of latency. Underruns
+    (reading from an empty ring) fill the output according to
+    ``underrun_policy``: ``'repeat'`` the last block read, ``'silence'``, or
+    ``None`` to leave the output untouched for the caller to fill.
+
+    Each block can carry an integer tag (e.g. its capture sequence number),
+    which is available as ``last_tag`` after it has been read.
+    """
+
+    UNDERRUN_POLICIES = ('repeat', 'silence', None)
+
+    def __init__(self, depth: int, frames: int, channels: int = 1, underrun_policy='repeat'):
+        if depth < 1:
+            raise ValueError("Ring buffer depth must be at least 1")
+        if underrun_policy not in self.UNDERRUN_POLICIES:
+            raise ValueError(f"Unknown underrun policy: {underrun_policy}")
+        self.depth = depth
+        self.frames = frames
+        self.channels = channels
+        self.underrun_policy = underrun_policy
+        self._blocks = np.zeros((depth, frames, channels), dtype=np.float32)
+        self._last = np.zeros((frames, channels), dtype=np.float32)
+        self._tags = np.zeros(depth, dtype=np.int64)
+        self.reset()
+
+    def reset(self):
+        """Empty the ring and clear the counters; only call while both sides are idle"""
+        self._write_index = 0
+        self._read_index = 0
+        self._last.fill(0)
+        self.last_tag = -1
+        self.writes = 0
+        self.reads = 0
+        self.overruns = 0
+        self.underruns = 0
+        self.discarded = 0
+
+    def __len__(self):
+        """Number of blocks waiting to be read"""
+        return self._write_index - self._read_index
+
+    def write(self, block, tag: int = 0):
+        """Copy a block into the ring; returns False and counts an overrun when full"""
+        index = self._write_index
+        if index - self._read_index >= self.depth:
+            self.overruns += 1
+            return False
+        slot = index % self.depth
+        np.copyto(self._blocks[slot], block.reshape(self.frames, -1))
+        self._tags[slot] = tag
+        self._write_index = index + 1
+        self.writes += 1
+        return True
+
+    def read(self, out):
+        """Copy the oldest block into ``out``; returns False and counts an underrun when empty
+
+        ``out`` may have more channels than the ring as long as the block
+        broadcasts to it.
+        """
+        index = self._read_index
+        if index == self._write_index:
+            self.underruns += 1
+            if self.underrun_policy == 'repeat':
+                np.copyto(out, self._last)
+            elif self.underrun_policy == 'silence':
+                out.fill(0)
+            return False
+        slot = index % self.depth
+        block = self._blocks[slot]
+        np.copyto(out, block)
+        self.last_tag = int(self._tags[slot])
+        if self.underrun_policy == 'repeat':
+            np.copyto(self._last, block)
+        self._read_index = index + 1
+        self.reads += 1
+        return True
+
+    def discard(self, count: int):
+        """Drop up to ``count`` of the oldest blocks from the consumer side"""
+        count = min(count, len(self))
+        if count > 0:
+            self._read_index += count
+            self.discarded += count
+        return count
+
+    def stats(self):
+        """Snapshot of the fill level and event counters"""
+        return {
+            'depth': self.depth,
+            'fill': len(self),
+            'writes': self.writes,
+            'reads': self.reads,
+            'overruns': self.overruns,
+            'underruns': self.underruns,
+            'discarded': self.discarded,
+        }
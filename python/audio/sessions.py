@@ -0,0 +1,367 @@
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+
+from .hum import HumFilter
+from .noise_tracker import PROFILE_SCALE, NoiseTracker
+from .stft import overlap_add
+from .suppressor import (NoiseSuppressor, adapt_noise, block_energy, learn_noise_frame, spectral_gain,
+                         spectrum_energy, update_vad_hold)
+
+# Settings every session may override, defaulting to the NoiseSuppressor values
+SESSION_PARAMETERS = ('noise_threshold', 'voice_threshold', 'non_voice_gain')
+
+# Per-row noise tracker state, by NoiseTracker attribute
+TRACKER_STATE = {name: '_tracker_' + name.lstrip('_') for name in NoiseTracker.STATE}
+
+def _rows_index(mask):
+    """Index selecting the rows of a boolean mask, a plain slice when it selects them all"""
+    return slice(None) if mask.all() else mask
+
+def _starts(channels):
+    """First row of every session, given the number of rows of each"""
+    return np.cumsum(np.concatenate(([0], channels[:-1])))
+
+class SessionEngine:
+    """Spectral gating for many independent streams in one process
+
+    Every session (e.g. one participant leg of a conference bridge) keeps
+    its own noise profile, learning phase, overlap-add state and
+    thresholds. Each channel of a session is one row of engine-wide state
+    arrays, so the blocks handed to ``process`` in the same tick are
+    stacked and the FFT, gating, smoothing and inverse FFT run as single
+    calls across all of them. With ``workers`` above 1 the sessions of a
+    tick are split across a shared thread pool.
+
+    The gating runs the same functions as ``NoiseSuppressor``, and the
+    settings of ``template`` apply to every session: the noise estimator,
+    the fast path for silent blocks, the hum filter, channel linking, gain
+    smoothing across frequency and time and freezing the noise profile.
+    """
+
+    def __init__(self,
+                 sample_rate: int = 48000,
+                 chunk_size: int = 960,
+                 hop_size: Optional[int] = None,
+                 workers: int = 1,
+                 capacity: int = 16):
+        # One suppressor holds the shared settings, window and AC bins
+        self.template = NoiseSuppressor(sample_rate=sample_rate, channels=1, chunk_size=chunk_size,
+                                        hop_size=hop_size)
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        self.hop_size = self.template.hop_size
+        if chunk_size % self.hop_size:
+            raise ValueError(f"chunk_size {chunk_size} is not a multiple of hop_size {self.hop_size}")
+        self.window = self.template.stft.window
+        self.synthesis_window = self.template.stft.synthesis_window
+        self.bins = chunk_size // 2 + 1
+        self._keep = chunk_size - self.hop_size
+        self._block_frames = chunk_size // self.hop_size
+        # Weight of every output position over the frames of one block, for
+        # passing silent blocks through without transforming them
+        self._bypass_weight = overlap_add(np.tile(self.window * self.synthesis_window, (self._block_frames, 1)),
+                                          self.hop_size, np.zeros(self._keep + chunk_size))
+        self._frames = 0  # Frames per row so far, paces the noise tracker windows
+
+        self.sessions = {}  # Session id -> array of its rows
+        self.hum_filters = {}  # Session id -> its hum filter
+        self._ids = itertools.count()
+        self._free_rows = []
+        self._row_state = ['noise_profile', 'noise_std', 'noise_samples', 'learning_noise', '_previous_gain',
+                           '_gain_started', '_tracked'] + list(TRACKER_STATE.values()) + list(SESSION_PARAMETERS)
+        self._allocate(capacity)
+
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        self._local = threading.local()  # Gain smoother scratch buffers per worker thread
+
+    @property
+    def latency(self):
+        """Delay of every session's output behind its input in seconds"""
+        return self._keep / self.sample_rate
+
+    def _allocate(self, capacity: int):
+        """Grow the per-row state arrays to ``capacity`` rows"""
+        old = getattr(self, '_capacity', 0)
+        fields = {
+            'noise_profile': (self.bins,), 'noise_std': (self.bins,),
+            '_history': (self._keep,), '_overlap': (self._keep,), '_previous_gain': (self.bins,),
+        }
+        fields.update({name: (self.bins,) for name in TRACKER_STATE.values()})
+        for name, shape in fields.items():
+            array = np.zeros((capacity,) + shape)
+            if old:
+                array[:old] = getattr(self, name)
+            setattr(self, name, array)
+        for name, dtype in (('noise_samples', np.int64), ('learning_noise', bool), ('_tracked', bool),
+                            ('_gain_started', bool), ('_vad_hold', np.int64)):
+            array = np.zeros(capacity, dtype=dtype)
+            if old:
+                array[:old] = getattr(self, name)
+            setattr(self, name, array)
+        for name in SESSION_PARAMETERS:
+            array = np.full(capacity, getattr(self.template, name), dtype=float)
+            if old:
+                array[:old] = getattr(self, name)
+            setattr(self, name, array)
+        self._free_rows.extend(range(old, capacity))
+        self._capacity = capacity
+
+    def add_session(self, channels: int = 1, session_id=None, **parameters):
+        """Start a new stream that learns its own noise profile and return its id"""
+        if session_id is None:
+            session_id = next(self._ids)
+        if session_id in self.sessions:
+            raise ValueError(f"Session {session_id!r} already exists")
+        while len(self._free_rows) < channels:
+            self._allocate(2 * self._capacity)
+        self._free_rows.sort()
+        rows = np.array(self._free_rows[:channels])
+        del self._free_rows[:channels]
+        self.sessions[session_id] = rows
+        self.hum_filters[session_id] = HumFilter(self.sample_rate, channels)
+        self.reset_session(session_id)
+        self.set_parameters(session_id, **parameters)
+        return session_id
+
+    def remove_session(self, session_id):
+        """Stop a stream and free its rows"""
+        del self.hum_filters[session_id]
+        self._free_rows.extend(self.sessions.pop(session_id).tolist())
+
+    def reset_session(self, session_id):
+        """Clear a stream's audio history and learn its noise profile again"""
+        rows = self.sessions[session_id]
+        for name in ('noise_profile', 'noise_std', '_history', '_overlap', '_previous_gain',
+                     'noise_samples', '_tracked', '_gain_started', '_vad_hold'):
+            getattr(self, name)[rows] = 0
+        self.learning_noise[rows] = True
+        self.hum_filters[session_id].reset()
+
+    def set_parameters(self, session_id, **parameters):
+        """Override ``SESSION_PARAMETERS`` for one stream"""
+        rows = self.sessions[session_id]
+        for name, value in parameters.items():
+            if name not in SESSION_PARAMETERS:
+                raise ValueError(f"Unknown session parameter {name!r}, expected one of {SESSION_PARAMETERS}")
+            getattr(self, name)[rows] = value
+
+    def process(self, blocks: dict):
+        """Denoise one tick of blocks, given and returned as {session id: (chunk_size, channels) array}
+
+        Sessions without a block in this tick keep their state untouched.
+        """
+        ids = [session_id for session_id in blocks if session_id in self.sessions]
+        if self._pool is None or len(ids) < 2:
+            results = self._process_sessions(ids, blocks)
+        else:
+            groups = [ids[i::self.workers] for i in range(self.workers)]
+            results = {}
+            for result in self._pool.map(lambda group: self._process_sessions(group, blocks), groups):
+                results.update(result)
+        self._frames += self._block_frames
+        return results
+
+    def close(self):
+        """Shut the worker pool down"""
+        if self._pool is not None:
+            self._pool.shutdown()
+
+    def _process_sessions(self, ids, blocks):
+        """Run one tick for a group of sessions as batched calls over their stacked rows"""
+        if not ids:
+            return {}
+        template = self.template
+        rows = np.concatenate([self.sessions[session_id] for session_id in ids])
+        columns = [np.asarray(blocks[session_id]).reshape(self.chunk_size, -1) for session_id in ids]
+        if template.hum_removal:
+            columns = [self.hum_filters[session_id].process(column) for session_id, column in zip(ids, columns)]
+        audio = np.concatenate(columns, axis=1).T
+        channels = np.array([block.shape[1] for block in columns])
+        starts = _starts(channels)
+
+        # Whole sessions past learning whose blocks are clearly silent skip the gating
+        silent_sessions = self._silent_sessions(rows, starts, channels, audio)
+        silent = np.repeat(silent_sessions, channels)
+
+        # Streaming STFT input of every row: history followed by the new block
+        signal = np.concatenate((self._history[rows], audio), axis=1)
+        output = np.zeros((len(rows), self._keep + self.chunk_size))
+        output[:, :self._keep] = self._overlap[rows]
+        state = {name: getattr(self, name)[rows] for name in self._row_state}
+
+        if not silent.all():
+            self._gate_rows(signal[_rows_index(~silent)], output, _rows_index(~silent), state,
+                            _starts(channels[~silent_sessions]))
+        if silent.any():
+            self._pass_silent_rows(signal, output, _rows_index(silent), state, _starts(channels[silent_sessions]))
+
+        for name in self._row_state:
+            getattr(self, name)[rows] = state[name]
+        self._overlap[rows] = output[:, self.chunk_size:]
+        self._history[rows] = signal[:, -self._keep:]
+
+        # Peak normalize each session's block like the live path, then split the rows back up
+        peaks = np.maximum.reduceat(np.max(np.abs(output[:, :self.chunk_size]), axis=1), starts)
+        processed = output[:, :self.chunk_size] / (np.repeat(peaks, channels) + 1e-6)[:, np.newaxis]
+        return {session_id: processed[start:start + count].T.reshape(np.shape(blocks[session_id]))
+                for session_id, start, count in zip(ids, starts, channels)}
+
+    def _silent_sessions(self, rows, starts, channels, audio):
+        """Voice activity decision of every session, from the time-domain energy of its block"""
+        template = self.template
+        first_rows = rows[starts]
+        learning = np.logical_or.reduceat(self.learning_noise[rows], starts)
+        if not template.vad_enabled or learning.all():
+            return np.zeros(len(starts), dtype=bool)
+        energy = np.maximum.reduceat(block_energy(audio.T, self.chunk_size), starts)
+        hold = update_vad_hold(energy, self._vad_hold[first_rows], self.voice_threshold[first_rows],
+                               template.vad_on_ratio, template.vad_off_ratio,
+                               int(template.vad_hangover * self.sample_rate), self.chunk_size)
+        # Sessions still learning always run the gating and keep their hold
+        hold = np.where(learning, self._vad_hold[first_rows], hold)
+        self._vad_hold[rows] = np.repeat(hold, channels)
+        return ~learning & (hold <= 0)
+
+    def _gate_rows(self, signal, output, index, state, starts):
+        """Gate every frame of the ``index`` rows and overlap-add them into ``output``"""
+        frames = np.lib.stride_tricks.sliding_window_view(signal, self.chunk_size, axis=-1)[:, ::self.hop_size]
+        spectra = np.fft.rfft(frames * self.window, axis=-1)
+
+        part = {name: value[index] for name, value in state.items()}
+        tracker = self._tracker(part)
+        for frame in range(spectra.shape[1]):
+            spectra[:, frame] = self._gate(spectra[:, frame], part, starts, tracker)
+        self._store(part, index, state, tracker)
+
+        frames = np.fft.irfft(spectra, n=self.chunk_size, axis=-1) * self.synthesis_window
+        rows_output = output[index]
+        overlap_add(frames, self.hop_size, rows_output)
+        output[index] = rows_output
+
+    def _pass_silent_rows(self, signal, output, index, state, starts):
+        """Attenuate the ``index`` rows' blocks without transforming them and track their noise
+
+        Like ``NoiseSuppressor._pass_silence``, the newest frame of every
+        row stands for all frames of its block.
+        """
+        template = self.template
+        output[index] += signal[index] * self._bypass_weight * state['non_voice_gain'][index, np.newaxis]
+        if template.freeze_noise_profile:
+            return
+
+        part = {name: value[index] for name, value in state.items()}
+        newest = signal[index, -self.chunk_size:] * self.window
+        magnitude = np.abs(np.fft.rfft(newest, axis=-1))
+        tracker = self._tracker(part)
+        if tracker is not None:
+            self._track(tracker, magnitude, part, self._block_frames)
+        else:
+            gated = magnitude * self._gain(magnitude, part, starts)
+            self._adapt(part, np.broadcast_to(gated, (self._block_frames,) + gated.shape), slice(None))
+        self._store(part, index, state, tracker)
+
+    def _tracker(self, state):
+        """Noise tracker over the gathered rows of ``state``, or None with the learned estimator"""
+        if self.template.noise_estimator != 'tracking':
+            return None
+        tracker = self.template.new_noise_tracker(state['noise_profile'].shape)
+        for name, field in TRACKER_STATE.items():
+            setattr(tracker, name, state[field])
+        tracker.frames = self._frames
+        return tracker
+
+    def _store(self, part, index, state, tracker):
+        """Write the state of a subset of rows back into the gathered ``state``"""
+        if tracker is not None:
+            for name, field in TRACKER_STATE.items():
+                part[field] = getattr(tracker, name)
+        for name, value in part.items():
+            state[name][index] = value
+
+    def _track(self, tracker, magnitude, state, steps: int = 1):
+        """Follow the noise of every row with minimum statistics, like ``NoiseSuppressor.track_noise``"""
+        template = self.template
+        fresh = ~state['_tracked']
+        if fresh.any():
+            # Rows start from their learned profile if they have one, else from this spectrum
+            learned = (state['noise_samples'] > 0)[:, np.newaxis]
+            tracker.seed(np.where(learned, (state['noise_profile'] / PROFILE_SCALE) ** 2, magnitude ** 2), fresh)
+            state['_tracked'][:] = True
+        tracker.update(magnitude, steps)
+        tracker.profile(state['noise_profile'], state['noise_std'])
+        state['noise_samples'][:] = template.max_noise_samples
+        state['learning_noise'][:] = False
+
+    def _gate(self, spec, state, starts, tracker):
+        """Spectral gating of one (rows, bins) frame, updating the gathered row ``state``"""
+        template = self.template
+        ac_bins = None if template.hum_removal else template.ac_bins
+        magnitude = np.abs(spec)
+        profile, std, samples = state['noise_profile'], state['noise_std'], state['noise_samples']
+
+        # Track the noise continuously, or fold this frame into the profile of rows still learning
+        if tracker is not None:
+            if not template.freeze_noise_profile:
+                self._track(tracker, magnitude, state)
+        else:
+            learning = state['learning_noise'] & (samples < template.max_noise_samples)
+            if learning.any():
+                profile[learning], std[learning] = learn_noise_frame(
+                    profile[learning], std[learning], magnitude[learning], samples[learning], ac_bins)
+                samples[learning] += 1
+                state['learning_noise'] &= samples < template.max_noise_samples
+        adapting = ~state['learning_noise']
+
+        gain = self._gain(magnitude, state, starts)
+
+        # Rows past learning slowly track their noise
+        if tracker is None and not template.freeze_noise_profile and adapting.any():
+            rows = _rows_index(adapting)
+            self._adapt(state, (magnitude[rows] * gain[rows])[np.newaxis], rows)
+        return spec * gain
+
+    def _gain(self, magnitude, state, starts):
+        """Smoothed gate of one (rows, bins) magnitude spectrum per row of the gathered ``state``"""
+        template = self.template
+        ac_bins = None if template.hum_removal else template.ac_bins
+        energy = spectrum_energy(magnitude, template.energy_scale)
+        ac_gain = np.where(state['learning_noise'], 1.0, 1 - template.ac_suppression_factor)
+        gain = spectral_gain(magnitude, energy, state['noise_profile'], state['noise_std'],
+                             state['noise_threshold'], state['voice_threshold'], state['non_voice_gain'],
+                             ac_bins, ac_gain)
+
+        # Linked channels of a session share the most permissive gain of any of them
+        if template.link_channels and len(starts) < len(gain):
+            counts = np.diff(np.append(starts, len(gain)))
+            gain = np.repeat(np.maximum.reduceat(gain, starts, axis=0), counts, axis=0)
+
+        smoother = self._smoother()
+        smoother.smooth_frequency(gain, gain)
+        if smoother.temporal:
+            fresh = ~state['_gain_started']
+            if fresh.any():
+                # Start from the first frame instead of from silence
+                state['_previous_gain'][fresh] = gain[fresh]
+                state['_gain_started'][:] = True
+            smoother.smooth_time(gain, state['_previous_gain'])
+        return gain
+
+    def _adapt(self, state, gated, rows):
+        """Adapt the noise of the ``rows`` of ``state`` from a (frames, rows, bins) batch of gated magnitudes"""
+        template = self.template
+        state['noise_profile'][rows], state['noise_std'][rows] = adapt_noise(
+            state['noise_profile'][rows], state['noise_std'][rows], gated, template.smoothing_factor,
+            None if template.hum_removal else template.ac_bins)
+
+    def _smoother(self):
+        """Gain smoother of the calling thread for the template's current settings"""
+        settings = self.template.gain_smoothing_settings
+        if getattr(self._local, 'settings', None) != settings:
+            self._local.smoother = self.template.new_gain_smoother()
+            self._local.settings = settings
+        return self._local.smoother
@@ -0,0 +1,167 @@
+import numpy as np
+
+# Kernels for smoothing the gain across frequency, roughly from most to least expensive
+KERNELS = ('median', 'mean', 'none')
+
+def sorting_network(size: int):
+    """Comparators (low, high) of Batcher's odd-even merge sort for ``size`` inputs"""
+    length = 1 << (size - 1).bit_length()
+    pairs = []
+    p = 1
+    while p < length:
+        k = p
+        while k >= 1:
+            for j in range(k % p, length - k, 2 * k):
+                for i in range(min(k, length - j - k)):
+                    if (i + j) // (2 * p) == (i + j + k) // (2 * p):
+                        pairs.append((i + j, i + j + k))
+            k //= 2
+        p *= 2
+    # Inputs past ``size`` act as +inf and never move, so their comparators drop out
+    return [(low, high) for low, high in pairs if high < size]
+
+def median_network(size: int):
+    """Comparators that move the median of ``size`` inputs to position ``size // 2``
+
+    Each entry is (low, high, keep_low, keep_high). Comparators that cannot
+    affect the median are pruned, and so is either output of a comparator
+    that is never read again.
+    """
+    needed = {size // 2}
+    steps = []
+    for low, high in reversed(sorting_network(size)):
+        keep_low, keep_high = low in needed, high in needed
+        if keep_low or keep_high:
+            steps.append((low, high, keep_low, keep_high))
+            needed |= {low, high}
+    return steps[::-1]
+
+class GainSmoother:
+    """Smooths spectral gains across frequency and, optionally, over time
+
+    Gains are (..., channels, bins) arrays, leading axes being frames in
+    time order. Across frequency a sliding median or mean of
+    ``kernel_size`` bins is taken with zero padding at the edges, which
+    matches ``scipy.ndimage.median_filter(mode='constant')``. The median is a
+    selection network of element-wise minimum and maximum calls over
+    shifted views, so its cost does not depend on the data and all buffers
+    are allocated once per gain shape.
+
+    Over time each bin follows a one-pole attack/release smoother carried
+    across calls: ``attack`` and ``release`` are the per-frame coefficients
+    used while the gain rises and falls, 0 following it at once.
+    """
+
+    def __init__(self, kernel: str = 'median', kernel_size: int = 7, attack: float = 0.0, release: float = 0.0):
+        if kernel not in KERNELS:
+            raise ValueError(f"Unknown gain smoothing kernel {kernel!r}, expected one of {KERNELS}")
+        if kernel_size < 1:
+            raise ValueError(f"kernel_size must be at least 1, got {kernel_size}")
+        self.kernel = kernel
+        self.kernel_size = kernel_size
+        self.attack = attack
+        self.release = release
+        self._layout = None  # (shape, dtype) the buffers were allocated for
+        self._previous = None
+        self._rising = None
+
+    @property
+    def temporal(self):
+        """Whether the gain is smoothed from frame to frame"""
+        return self.attack > 0 or self.release > 0
+
+    def reset(self):
+        """Forget the gain of the previous frame"""
+        self._previous = None
+
+    def process(self, gain, out=None):
+        """Smooth ``gain`` and return the result, written to ``out`` if given"""
+        if out is None:
+            out = np.empty(gain.shape, dtype=gain.dtype)
+        self.smooth_frequency(gain, out)
+        if self.temporal:
+            self.smooth_time(out)
+        return out
+
+    def smooth_frequency(self, gain, out):
+        """Apply the frequency kernel to ``gain`` and write the result to ``out``"""
+        if self.kernel == 'none' or self.kernel_size == 1:
+            if out is not gain:
+                out[...] = gain
+            return out
+        if (gain.shape, gain.dtype) != self._layout:
+            self._allocate(gain.shape, gain.dtype)
+
+        bins = gain.shape[-1]
+        half = self.kernel_size // 2
+        self._padded[..., half:half + bins] = gain
+        if self.kernel == 'median':
+            for ufunc, first, second, target in self._median_steps:
+                ufunc(first, second, out=target)
+            out[...] = self._median
+        else:
+            np.cumsum(self._padded, axis=-1, out=self._cumsum[..., 1:])
+            np.subtract(self._cumsum[..., self.kernel_size:], self._cumsum[..., :-self.kernel_size], out=out)
+            out *= 1.0 / self.kernel_size
+        return out
+
+    def smooth_time(self, gain, previous=None):
+        """Run the attack/release smoother over the frames of ``gain`` in place
+
+        ``previous`` is the gain of the frame before the first one and is
+        updated in place; by default the smoother carries its own from call
+        to call.
+        """
+        frames = gain.reshape((-1,) + gain.shape[-2:])
+        first = 0
+        if previous is None:
+            if (self._previous is None or self._previous.shape != frames.shape[1:] or
+                    self._previous.dtype != frames.dtype):
+                # Start from the first frame instead of from silence
+                self._previous = frames[0].copy()
+                first = 1
+            previous = self._previous
+        if self._rising is None or self._rising.shape != frames.shape[1:] or self._delta.dtype != frames.dtype:
+            self._rising = np.empty(frames.shape[1:], dtype=bool)
+            self._coefficient = np.empty(frames.shape[1:], dtype=frames.dtype)
+            self._delta = np.empty(frames.shape[1:], dtype=frames.dtype)
+
+        for frame in frames[first:]:
+            np.greater(frame, previous, out=self._rising)
+            np.multiply(self._rising, self.attack - self.release, out=self._coefficient)
+            self._coefficient += self.release
+            np.subtract(previous, frame, out=self._delta)
+            self._delta *= self._coefficient
+            frame += self._delta
+            previous[...] = frame
+        return gain
+
+    def _allocate(self, shape, dtype=np.float64):
+        """Create the padded input and the scratch buffers for one gain shape and dtype"""
+        bins = shape[-1]
+        size = self.kernel_size
+        self._layout = (shape, dtype)
+        self._padded = np.zeros(shape[:-1] + (bins + size - 1,), dtype=dtype)
+        if self.kernel == 'mean':
+            self._cumsum = np.zeros(shape[:-1] + (bins + size,), dtype=dtype)
+            return
+
+        # Bind every comparator to its input views and output buffer up front,
+        # reusing buffers whose row is no longer needed
+        rows = [self._padded[..., i:i + bins] for i in range(size)]
+        free = []
+        steps = []
+        for low, high, keep_low, keep_high in median_network(size):
+            targets = []
+            for keep, ufunc in ((keep_low, np.minimum), (keep_high, np.maximum)):
+                target = None
+                if keep:
+                    target = free.pop() if free else np.empty(shape, dtype=dtype)
+                    steps.append((ufunc, rows[low], rows[high], target))
+                targets.append(target)
+            for index, target in zip((low, high), targets):
+                if rows[index] is not None and rows[index].base is not self._padded:
+                    free.append(rows[index])
+                rows[index] = target
+        self._median_steps = steps
+        self._median = rows[size // 2]
@@ -0,0 +1,277 @@
+import numpy as np
+from typing import Callable, Optional
+
+from .instrumentation import WINDOW, FFT, IFFT
+
+def analysis_window(frame_size: int):
+    """Periodic Hann window used for STFT analysis"""
+    return np.hanning(frame_size + 1)[:-1]
+
+def synthesis_window(window, hop_size: int):
+    """Synthesis window giving perfect weighted overlap-add reconstruction
+
+    The analysis window is divided by the overlapped sum of its squares, so
+    any hop that divides the frame size reconstructs the input exactly when
+    the spectrum is left untouched.
+    """
+    frame_size = len(window)
+    if hop_size <= 0 or frame_size % hop_size:
+        raise ValueError(f"hop_size {hop_size} must evenly divide frame size {frame_size}")
+
+    overlap = (window ** 2).reshape(-1, hop_size).sum(axis=0)
+    if np.min(overlap) < 1e-6:
+        raise ValueError(f"hop_size {hop_size} is too large for a {frame_size}-point window")
+    return window / np.tile(overlap, frame_size // hop_size)
+
+def frame_signal(audio, frame_size: int, hop_size: int):
+    """Split signals along the last axis into (..., frames, frame_size) overlapping frames
+
+    The signal is padded so that every sample is covered by the full set of
+    overlapping frames; the first output sample of ``overlap_add`` then lines
+    up with ``frame_size - hop_size``. The frames are a read-only view into
+    the padded signal.
+    """
+    lead = frame_size - hop_size
+    length = audio.shape[-1]
+    num_frames = (lead + length - 1) // hop_size + 1
+    padded = np.zeros(audio.shape[:-1] + ((num_frames - 1) * hop_size + frame_size,), dtype=audio.dtype)
+    padded[..., lead:lead + length] = audio
+    return np.lib.stride_tricks.sliding_window_view(padded, frame_size, axis=-1)[..., ::hop_size, :]
+
+def overlap_add(frames, hop_size: int, output, first_frame: int = 0):
+    """Overlap-add a (..., frames, frame_size) block into ``output`` in place
+
+    ``first_frame`` is the index of the first frame of the block in the
+    whole frame sequence, so long signals can be synthesized block by block.
+    """
+    num_frames, frame_size = frames.shape[-2:]
+    start = first_frame * hop_size
+    for offset in range(0, frame_size, hop_size):
+        segment = output[..., start + offset:start + offset + num_frames * hop_size]
+        segment += frames[..., offset:offset + hop_size].reshape(frames.shape[:-2] + (-1,))
+    return output
+
+# NumPy 2 FFTs can write into preallocated output arrays
+_FFT_HAS_OUT = np.lib.NumpyVersion(np.__version__) >= '2.0.0'
+
+class StreamingSTFT:
+    """Streaming weighted overlap-add STFT with preallocated buffers
+
+    Blocks of any multiple of ``hop_size`` samples are analysed frame by
+    frame, each spectrum is handed to a callback, and the result is
+    overlap-added back into an output block of the same length. Output lags
+    input by ``latency`` samples. No arrays are allocated per block on
+    NumPy 2; older versions allocate only the FFT results.
+
+    Windows, buffers and spectra use ``dtype`` (float64 or float32, with
+    complex128 or complex64 spectra). With ``workers`` the FFTs run on
+    ``scipy.fft`` with that many threads, which keeps its own plan cache
+    but allocates the FFT results. float32 always uses it, since NumPy's
+    float32 FFT goes through a scratch buffer several times the frame.
+    """
+
+    def __init__(self, frame_size: int = 1024, hop_size: Optional[int] = None, channels: int = 1,
+                 dtype=np.float64, workers: Optional[int] = None):
+        self.frame_size = frame_size
+        self.hop_size = hop_size or frame_size // 2
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self.workers = workers
+        self._scipy_fft = None
+        if workers is not None or self.dtype == np.float32:
+            import scipy.fft
+            self._scipy_fft = scipy.fft
+        self.window = analysis_window(frame_size).astype(self.dtype)
+        self.synthesis_window = synthesis_window(analysis_window(frame_size), self.hop_size).astype(self.dtype)
+
+        # Analysis history and overlap-add accumulator are linear buffers
+        # that get compacted when full, so frames are always contiguous views
+        self._capacity = 2 * frame_size
+        self._input = np.zeros((channels, self._capacity), dtype=self.dtype)
+        self._accumulator = np.zeros((channels, self._capacity), dtype=self.dtype)
+        self._frame = np.empty((channels, frame_size), dtype=self.dtype)
+        self.spectrum = np.empty((channels, frame_size // 2 + 1), dtype=np.result_type(self.dtype, np.complex64))
+        # Share of the full overlap-add weight that the output still pending
+        # after a hop has received from the frames already processed
+        product = self.window * self.synthesis_window
+        self._pending_weight = np.array([product[k + self.hop_size::self.hop_size].sum()
+                                         for k in range(frame_size - self.hop_size)])
+        self._bypass_weights = {}  # Block length -> weight of the input in ``bypass``
+        self.timer = None  # Optional Instrumentation charged for window, FFT and inverse FFT
+        self.reset()
+
+    @property
+    def latency(self):
+        """Delay between input and output in samples"""
+        return self.frame_size - self.hop_size
+
+    def reset(self):
+        """Clear the analysis history and pending overlap-add output"""
+        self._input.fill(0)
+        self._accumulator.fill(0)
+        self._input_end = self.frame_size  # At least one frame of history is always kept
+        self._output_start = 0
+
+    def process(self, block, callback: Callable, out=None):
+        """Run ``callback`` on every spectrum of ``block`` and return the resynthesized block
+
+        ``block`` is (samples,) or (samples, channels). ``callback`` receives
+        a (channels, bins) complex spectrum and returns the spectrum to
+        resynthesize, which may be the same array modified in place.
+        """
+        if len(block) % self.hop_size:
+            raise ValueError(f"block length {len(block)} is not a multiple of hop_size {self.hop_size}")
+        if out is None:
+            out = np.empty(block.shape, dtype=self.dtype)
+
+        columns = block.reshape(len(block), -1)
+        out_columns = out.reshape(len(out), -1)
+        for start in range(0, len(block), self.hop_size):
+            stop = start + self.hop_size
+            self._push(columns[start:stop])
+            self._process_frame(callback)
+            self._pop(out_columns[start:stop])
+        return out
+
+    def process_batch(self, block, callback: Callable, out=None):
+        """Like ``process``, but hand every spectrum of ``block`` to one ``callback`` call
+
+        ``callback`` receives a (frames, channels, bins) array of spectra in
+        time order, so a model can run on all of them at once. Both methods
+        share the same streaming state and may be mixed.
+        """
+        if len(block) % self.hop_size:
+            raise ValueError(f"block length {len(block)} is not a multiple of hop_size {self.hop_size}")
+        if out is None:
+            out = np.empty(block.shape, dtype=self.dtype)
+        timer = self.timer
+        keep = self.frame_size - self.hop_size
+
+        # Analysis history followed by the new samples, framed every hop
+        signal = np.concatenate((self._input[:, self._input_end - keep:self._input_end],
+                                 block.reshape(len(block), -1).T), axis=1, dtype=self.dtype)
+        frames = np.lib.stride_tricks.sliding_window_view(signal, self.frame_size, axis=-1)[:, ::self.hop_size]
+        frames = frames.transpose(1, 0, 2) * self.window
+        if timer is not None:
+            timer.mark(WINDOW)
+        spectra = self.rfft(frames)
+        if timer is not None:
+            timer.mark(FFT)
+        spectra = callback(spectra)
+        frames = self.irfft(spectra)
+        frames *= self.synthesis_window
+
+        # Pending overlap-add output followed by room for the new frames
+        output = np.zeros((self.channels, keep + len(block)), dtype=self.dtype)
+        output[:, :keep] = self._accumulator[:, self._output_start:self._output_start + keep]
+        overlap_add(frames.transpose(1, 0, 2), self.hop_size, output)
+        out.reshape(len(out), -1)[:] = output[:, :len(block)].T
+
+        self._input[:, :self.frame_size] = signal[:, signal.shape[1] - self.frame_size:]
+        self._input_end = self.frame_size
+        self._accumulator.fill(0)
+        self._accumulator[:, :keep] = output[:, len(block):]
+        self._output_start = 0
+        if timer is not None:
+            timer.mark(IFFT)
+        return out
+
+    def bypass(self, block, gain=1.0, out=None):
+        """Pass ``block`` through scaled by ``gain`` instead of transforming it
+
+        The output lines up with ``process`` and is weighted against the
+        overlap-add output still pending from earlier frames, so blocks can
+        switch between the two seamlessly. With a gain of 1 the input comes
+        out exactly, only delayed. ``gain`` is a scalar or one value per
+        channel.
+        """
+        if len(block) % self.hop_size:
+            raise ValueError(f"block length {len(block)} is not a multiple of hop_size {self.hop_size}")
+        if out is None:
+            out = np.empty(block.shape, dtype=self.dtype)
+        keep = self.frame_size - self.hop_size
+
+        # Input delayed into output positions: analysis history followed by the new samples
+        signal = np.concatenate((self._input[:, self._input_end - keep:self._input_end],
+                                 block.reshape(len(block), -1).T), axis=1, dtype=self.dtype)
+
+        # Each position gets the weight that the skipped frames would have added
+        weight = self._bypass_weights.get(len(block))
+        if weight is None:
+            done = np.zeros(signal.shape[1], dtype=self.dtype)
+            done[:keep] = self._pending_weight
+            total = np.ones(signal.shape[1], dtype=self.dtype)
+            total[len(block):] = self._pending_weight
+            weight = self._bypass_weights[len(block)] = total - done
+        output = signal * weight
+        output *= np.reshape(gain, (-1, 1)).astype(self.dtype)
+        output[:, :keep] += self._accumulator[:, self._output_start:self._output_start + keep]
+        out.reshape(len(out), -1)[:] = output[:, :len(block)].T
+
+        self._input[:, :self.frame_size] = signal[:, signal.shape[1] - self.frame_size:]
+        self._input_end = self.frame_size
+        self._accumulator.fill(0)
+        self._accumulator[:, :keep] = output[:, len(block):]
+        self._output_start = 0
+        return out
+
+    def latest_spectrum(self):
+        """(channels, bins) spectrum of the newest frame of input, without synthesizing it"""
+        np.multiply(self._input[:, self._input_end - self.frame_size:self._input_end],
+                    self.window, out=self._frame)
+        return self.rfft(self._frame)
+
+    def rfft(self, frames, out=None):
+        """Real FFT along the last axis, into ``out`` where the FFT backend supports it"""
+        if self._scipy_fft is not None:
+            return self._scipy_fft.rfft(frames, axis=-1, workers=self.workers)
+        if _FFT_HAS_OUT and out is not None:
+            return np.fft.rfft(frames, axis=-1, out=out)
+        return np.fft.rfft(frames, axis=-1)
+
+    def irfft(self, spectra, out=None):
+        """Inverse real FFT to ``frame_size`` samples along the last axis, into ``out`` where supported"""
+        if self._scipy_fft is not None:
+            # The spectrum is not needed afterwards, so scipy may work in place
+            return self._scipy_fft.irfft(spectra, n=self.frame_size, axis=-1, workers=self.workers,
+                                         overwrite_x=True)
+        if _FFT_HAS_OUT and out is not None:
+            return np.fft.irfft(spectra, n=self.frame_size, axis=-1, out=out)
+        return np.fft.irfft(spectra, n=self.frame_size, axis=-1)
+
+    def _push(self, samples):
+        """Append one hop of input to the analysis history"""
+        if self._input_end + self.hop_size > self._capacity:
+            keep = self.frame_size - self.hop_size
+            self._input[:, :keep] = self._input[:, self._input_end - keep:self._input_end]
+            self._input_end = keep
+        self._input[:, self._input_end:self._input_end + self.hop_size] = samples.T
+        self._input_end += self.hop_size
+
+    def _process_frame(self, callback):
+        """Analyse the newest frame, apply the callback and overlap-add the result"""
+        timer = self.timer
+        np.multiply(self._input[:, self._input_end - self.frame_size:self._input_end],
+                    self.window, out=self._frame)
+        if timer is not None:
+            timer.mark(WINDOW)
+        spectrum = self.rfft(self._frame, self.spectrum)
+        if timer is not None:
+            timer.mark(FFT)
+        spectrum = callback(spectrum)
+        frame = self.irfft(spectrum, self._frame)
+        frame *= self.synthesis_window
+
+        if self._output_start + self.frame_size > self._capacity:
+            keep = self.frame_size - self.hop_size
+            self._accumulator[:, :keep] = self._accumulator[:, self._output_start:self._output_start + keep]
+            self._accumulator[:, keep:] = 0
+            self._output_start = 0
+        self._accumulator[:, self._output_start:self._output_start + self.frame_size] += frame
+        if timer is not None:
+            timer.mark(IFFT)
+
+    def _pop(self, out):
+        """Move one finished hop of output into ``out``"""
+        out[:] = self._accumulator[:, self._output_start:self._output_start + self.hop_size].T
+        self._output_start += self.hop_size
@@ -0,0 +1,563 @@
+import copy
+import numpy as np
+from typing import Optional
+
+from .hum import HumFilter
+from .instrumentation import (Instrumentation, HUM, VAD, MAGNITUDE, NOISE_PROFILE, GAIN,
+                              SMOOTHING, NORMALIZE)
+from .noise_tracker import PROFILE_SCALE, NoiseTracker
+from .smoothing import GainSmoother
+from .stft import StreamingSTFT
+
+def rebin_spectrum(state, rate: int, frame_size: int, new_rate: int, new_frame_size: int):
+    """Interpolate (..., bins) STFT magnitudes onto the bins of another rate and frame size
+
+    The noise reaching the device has a fixed power per Hz, so its STFT
+    magnitudes grow with the square root of the frame length times the
+    sample rate. Bins above the old Nyquist frequency take the value of the
+    highest old bin.
+    """
+    frequencies = np.fft.rfftfreq(frame_size, 1 / rate)
+    new_frequencies = np.fft.rfftfreq(new_frame_size, 1 / new_rate)
+    rows = np.reshape(state, (-1, len(frequencies)))
+    rebinned = np.array([np.interp(new_frequencies, frequencies, row) for row in rows])
+    rebinned *= np.sqrt(new_frame_size * new_rate / (frame_size * rate))
+    return rebinned.reshape(np.shape(state)[:-1] + (len(new_frequencies),))
+
+def _per_row(value, dtype):
+    """A setting for every row as it is if scalar, else as a column broadcasting over the bins"""
+    if np.ndim(value) == 0:
+        return value
+    return np.asarray(value, dtype)[..., np.newaxis]
+
+# The gating math below works on (..., rows, bins) spectra, a row being one
+# channel of one stream. Settings and counts are scalars or hold one value
+# per row, so NoiseSuppressor and the batched SessionEngine share it.
+
+def spectrum_energy(magnitude, energy_scale: float = 1.0):
+    """Mean power of every (..., rows, bins) magnitude spectrum, on the scale of voice_threshold"""
+    return np.einsum('...j,...j->...', magnitude, magnitude) * (energy_scale / magnitude.shape[-1])
+
+def block_energy(block, frame_size: int):
+    """Time-domain energy of every channel of a (samples, channels) block, on the scale of voice_threshold
+
+    A windowed frame keeps 3/8 of the signal power per sample.
+    """
+    return 0.375 * frame_size * np.einsum('ij,ij->j', block, block) / len(block)
+
+def update_vad_hold(energy, hold, voice_threshold, on_ratio: float, off_ratio: float,
+                    hangover: int, block_size: int):
+    """Samples of full processing left after a block of ``energy``; the block is silent once it is 0 or less
+
+    A block above ``on_ratio`` of the voice threshold, or ``off_ratio``
+    while full processing is still held, restarts the ``hangover``.
+    """
+    ratio = np.where(hold > 0, off_ratio, on_ratio)
+    return np.where(energy > ratio * voice_threshold, hangover, hold - block_size)
+
+def learn_noise_frame(noise_profile, noise_std, magnitude, count, ac_bins=None):
+    """Fold one magnitude spectrum per row into the noise learned from ``count`` earlier ones
+
+    The profile is the running mean of the magnitudes times 1.5 and the
+    deviation the RMS deviation from it. With ``ac_bins``, rows past 50
+    learned frames raise the profile of those bins to twice their mean
+    magnitude. Returns the new profile and deviation.
+    """
+    rows = _per_row(count, magnitude.dtype)
+    # Update overall noise profile with more aggressive learning
+    noise_profile = (noise_profile * rows + magnitude * 1.5) / (rows + 1)
+    noise_std = np.sqrt((noise_std ** 2 * rows + (magnitude - noise_profile) ** 2) / (rows + 1))
+
+    # Specifically learn AC noise profile with overestimation after some initial samples
+    if ac_bins is not None and np.any(np.asarray(count) > 50):
+        ac_profile = np.mean(magnitude[..., ac_bins], axis=-1, keepdims=True)
+        raised = np.maximum(noise_profile[..., ac_bins], ac_profile * 2.0)  # Double the AC noise estimation
+        if np.ndim(count):
+            raised = np.where(rows > 50, raised, noise_profile[..., ac_bins])
+        noise_profile[..., ac_bins] = raised
+    return noise_profile, noise_std
+
+def spectral_gain(magnitude, energy, noise_profile, noise_std, noise_threshold, voice_threshold,
+                  non_voice_gain, ac_bins=None, ac_gain=1.0):
+    """Unsmoothed spectral gate of (..., rows, bins) magnitude spectra with one ``energy`` per spectrum
+
+    ``ac_gain`` scales the gain of ``ac_bins``, for all rows or per row.
+    """
+    # Calculate noise floor with enhanced AC suppression
+    noise_floor = noise_profile + noise_std * _per_row(noise_threshold, noise_std.dtype)
+
+    # 1. Compute spectral gain with increased threshold
+    gain = magnitude - noise_floor * 1.5
+    gain /= magnitude + 1e-12
+    np.maximum(gain, 0, out=gain)
+
+    # 2. Apply stronger suppression to AC frequencies
+    if ac_bins is not None:
+        gain[..., ac_bins] *= _per_row(ac_gain, gain.dtype)
+
+    # 3. Attenuate spectra without voice activity
+    is_voice = np.asarray(energy) > voice_threshold
+    gain *= np.where(is_voice, 1.0, non_voice_gain).astype(gain.dtype)[..., np.newaxis]
+    return gain
+
+def adapt_noise(noise_profile, noise_std, gated, smoothing_factor: float, ac_bins=None):
+    """Slowly track the noise from a (frames, ..., rows, bins) batch of gated magnitudes
+
+    The profile blends towards the gated magnitudes times 1.2 and the
+    deviation towards their RMS deviation from it, both applied in closed
+    form for the whole batch. With ``ac_bins`` those bins never fall below
+    0.9 times their gated magnitude. Returns the new profile and deviation.
+    """
+    frames = gated.shape[0]
+
+    # Update overall noise profile more aggressively
+    weights = (1 - smoothing_factor) * smoothing_factor ** np.arange(frames - 1, -1, -1, dtype=gated.dtype)
+    kept = smoothing_factor ** frames
+    noise_profile = kept * noise_profile + np.tensordot(weights, gated, axes=1) * 1.2
+    noise_std = np.sqrt(kept * noise_std ** 2 + np.tensordot(weights, (gated - noise_profile) ** 2, axes=1))
+
+    # Update AC noise profile more aggressively
+    if ac_bins is not None:
+        ac_magnitude = gated[..., ac_bins].max(axis=0)
+        noise_profile[..., ac_bins] = np.maximum(
+            noise_profile[..., ac_bins],
+            ac_magnitude * 0.9  # Increased from 0.8 to 0.9 for stronger AC suppression
+        )
+    return noise_profile, noise_std
+
+class NoiseSuppressor:
+    """Spectral gating noise suppressor without any audio device dependencies"""
+
+    def __init__(self,
+                 sample_rate: int = 44100,
+                 channels: int = 1,
+                 chunk_size: int = 1024,
+                 hop_size: Optional[int] = None,
+                 dtype=np.float64,
+                 fft_workers: Optional[int] = None):
+        self.channels = channels
+        self.dtype = np.dtype(dtype)  # Sample and spectrum precision, float32 halves the memory traffic
+        self.fft_workers = fft_workers  # scipy.fft threads per transform, None for numpy's FFT
+        self._init_sizes(sample_rate, chunk_size, hop_size)
+
+        # Initialize noise suppression parameters with much more aggressive values
+        self.noise_threshold = 0.35  # Increased from 0.05 to 0.35 (7x more aggressive)
+        self.voice_threshold = 0.25  # Increased from 0.15 to 0.25 (more selective for voice)
+        self.smoothing_factor = 0.99  # Increased from 0.98 to 0.99 for more stable noise profile
+        self.noise_learning_rate = 0.001
+        self.min_noise_floor = 0.0001
+
+        # AC-specific parameters with increased suppression
+        self.ac_freq_range = (30, 300)  # Widened AC frequency range to catch more noise
+        self.ac_bins = None  # Will be initialized in _init_ac_bins
+        self.ac_suppression_factor = 0.98  # Increased from 0.95 to 0.98 (much stronger AC suppression)
+        self.hum_removal = False  # Notch out detected mains hum instead of suppressing the AC bins
+
+        # Gain applied to blocks without voice activity
+        self.non_voice_gain = 0.05  # Reduced from 0.1 to 0.05 for more aggressive noise suppression
+        self.gain_smoothing = 'median'  # Kernel across frequency: 'median', 'mean' or 'none'
+        self.median_kernel_size = 7  # Increased kernel size for smoother suppression
+        self.gain_attack_time = 0.0  # Seconds for the gain to open, 0 follows it at once
+        self.gain_release_time = 0.0  # Seconds for the gain to close, e.g. 0.05 against flicker
+        self.link_channels = False  # Apply one gain to all channels to keep the stereo image
+        self.freeze_noise_profile = False  # Stop adapting the noise profile after learning
+        self.gain_update_interval = 1  # Compute the gain every n-th frame and reuse it in between
+        self.max_noise_samples = 300  # Increased for better noise learning
+        # 'learned' averages a learning phase and then adapts slowly from the
+        # gated output, 'tracking' follows the noise continuously with
+        # minimum statistics and needs no learning phase
+        self.noise_estimator = 'learned'
+        self.noise_tracking_window = 1.0  # Seconds the tracked noise minimum is searched over
+
+        # Time-domain voice activity detection ahead of the STFT; blocks that
+        # are clearly silent are only attenuated and update the noise profile
+        self.vad_enabled = True
+        self.vad_on_ratio = 0.5  # Fraction of voice_threshold a block needs to start full processing
+        self.vad_off_ratio = 0.25  # Fraction blocks stay below for vad_hangover seconds to stop it
+        self.vad_hangover = 0.3  # Seconds
+        self.vad_blocks = {'fast': 0, 'full': 0}
+        self._vad_hold = 0  # Samples of full processing left after the last loud block
+
+        # Initialize noise profile and statistics
+        self._init_gain_smoother()
+        self.reset_noise_profile()
+
+        # Initialize AC frequency bins
+        self._init_ac_bins()
+
+        # Optional hot-path timing, None when disabled
+        self.instrumentation = None
+        
+        # Streaming STFT used by the live path, fft_size frames every hop_size samples
+        self._init_stft(channels)
+
+        # Mains hum notch filter ahead of the STFT
+        self.hum_filter = HumFilter(sample_rate, channels)
+
+    def _init_sizes(self, sample_rate: int, chunk_size: int, hop_size: Optional[int] = None):
+        """Set the block, frame and hop sizes"""
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        self.fft_size = chunk_size  # STFT frame length
+        self.hop_size = hop_size or self.fft_size // 2
+        # Mean spectral energy grows with the frame length; compare it against
+        # voice_threshold as if frames were chunk_size samples long
+        self.energy_scale = chunk_size / self.fft_size
+
+    def _init_ac_bins(self):
+        """Initialize the frequency bins that correspond to AC noise"""
+        freqs = np.fft.rfftfreq(self.fft_size, 1/self.sample_rate)
+        self.ac_bins = np.where((freqs >= self.ac_freq_range[0]) &
+                              (freqs <= self.ac_freq_range[1]))[0]
+
+    @property
+    def gain_smoothing_settings(self):
+        """The settings the gain smoother is built from"""
+        return (self.gain_smoothing, self.median_kernel_size, self.gain_attack_time, self.gain_release_time)
+
+    def new_gain_smoother(self):
+        """A gain smoother for the current smoothing settings
+
+        Attack and release times become per-frame coefficients of the
+        one-pole smoother, frames being ``hop_size`` samples apart.
+        """
+        frame_period = self.hop_size / self.sample_rate
+        coefficients = [np.exp(-frame_period / seconds) if seconds > 0 else 0.0
+                        for seconds in (self.gain_attack_time, self.gain_release_time)]
+        return GainSmoother(self.gain_smoothing, self.median_kernel_size, *coefficients)
+
+    def _init_gain_smoother(self):
+        """Create the gain smoother from the current smoothing settings"""
+        self.gain_smoother = self.new_gain_smoother()
+        self._gain_smoothing_settings = self.gain_smoothing_settings
+
+    def set_channels(self, channels: int):
+        """Resize the per-channel state for a new channel count and relearn the noise"""
+        self.channels = channels
+        self._init_stft(channels)
+        self.hum_filter = HumFilter(self.sample_rate, channels)
+        self.reset_noise_profile()
+
+    def resized(self, sample_rate: int, chunk_size: int):
+        """A copy of this suppressor for another sample rate and block size
+
+        The copy keeps every setting. Its frame and hop sizes follow the
+        block size the way the constructor derives them, at the same hop
+        to frame ratio. Building it only reads from this suppressor, so it
+        can be done on another thread while this one keeps processing.
+        ``adopt`` then takes the copy over between two blocks.
+        """
+        resized = copy.copy(self)
+        resized._resized_from = dict(vars(self))
+        hop_ratio = self.hop_size / self.fft_size
+        resized._init_sizes(sample_rate, chunk_size)
+        resized.hop_size = max(int(resized.fft_size * hop_ratio), 1)
+        resized._init_gain_smoother()
+        resized._init_ac_bins()
+        resized.reset_noise_profile()
+        resized._init_stft(self.channels)
+        resized.hum_filter = HumFilter(sample_rate, self.channels)
+        resized._vad_hold = 0
+        return resized
+
+    def adopt(self, resized):
+        """Take over the state of a copy made by ``resized``
+
+        Settings changed here since the copy was made keep their new values.
+        The noise profile learned so far is interpolated onto the new
+        frequency bins, so processing continues without a learning phase.
+        """
+        previous = (self.noise_profile, self.noise_std, self.sample_rate, self.fft_size)
+        noise_samples = self.noise_samples
+        original = vars(resized).pop('_resized_from')
+        missing = object()
+        for name, value in vars(resized).items():
+            # Whatever the copy rebuilt differs from what it was copied from
+            if value is not original.get(name, missing):
+                setattr(self, name, value)
+
+        # Instrumentation budgets are per block
+        enabled = self.instrumentation is not None
+        self.instrumentation = None
+        self.enable_instrumentation(enabled)
+
+        if noise_samples:
+            noise_profile, noise_std, rate, frame_size = previous
+            self.load_noise_profile(rebin_spectrum(noise_profile, rate, frame_size, self.sample_rate, self.fft_size),
+                                    rebin_spectrum(noise_std, rate, frame_size, self.sample_rate, self.fft_size),
+                                    noise_samples / self.max_noise_samples)
+
+    def _init_stft(self, channels: int):
+        """Create the streaming STFT for the given number of input channels"""
+        self.stft = StreamingSTFT(self.fft_size, self.hop_size, channels, self.dtype, self.fft_workers)
+        self.stft.timer = self.instrumentation
+
+    @property
+    def algorithmic_latency(self):
+        """Delay of the output behind the input in seconds, excluding processing time"""
+        return self.stft.latency / self.sample_rate
+
+    def enable_instrumentation(self, enabled: bool = True):
+        """Turn per-stage timing of the live path on or off"""
+        if enabled:
+            if self.instrumentation is None:
+                self.instrumentation = Instrumentation(self.chunk_size / self.sample_rate)
+        else:
+            self.instrumentation = None
+        self.stft.timer = self.instrumentation
+
+    def get_instrumentation(self):
+        """Snapshot of the hot-path histograms, or None when instrumentation is off"""
+        instrumentation = self.instrumentation
+        return instrumentation.snapshot() if instrumentation is not None else None
+
+    def reset_noise_profile(self):
+        """Forget the learned noise profile and start learning again"""
+        self.noise_profile = np.zeros((self.channels, self.fft_size // 2 + 1), self.dtype)  # Per channel FFT bins
+        self.noise_std = np.zeros((self.channels, self.fft_size // 2 + 1), self.dtype)
+        self._magnitude = None  # Preallocated magnitude of the live path's frame
+        self.signal_energy = 0
+        self.noise_energy = 0
+        self.learning_noise = True
+        self.noise_samples = 0
+        self.gain_smoother.reset()
+        self._last_gain = None
+        self._gain_frames = 0
+        self._noise_tracker = None  # Created with the first tracked spectrum
+
+    def load_noise_profile(self, noise_profile, noise_std, confidence: float = 1.0):
+        """Seed the noise profile with a previously learned one
+
+        The profile counts as ``confidence * max_noise_samples`` learned
+        blocks, so a fully trusted profile skips the learning phase and a
+        stale one is refined by the remaining learning blocks. A profile
+        learned with a different channel count is averaged across channels.
+        """
+        self.noise_profile = self._fit_channels(noise_profile)
+        self.noise_std = self._fit_channels(noise_std)
+        self.noise_samples = int(round(np.clip(confidence, 0, 1) * self.max_noise_samples))
+        self.learning_noise = self.noise_samples < self.max_noise_samples
+        self._noise_tracker = None  # Tracking restarts from the loaded profile
+
+    def _fit_channels(self, state):
+        """Reshape per-bin state to (channels, bins), averaging if the channel count differs"""
+        state = np.asarray(state, dtype=self.dtype).reshape(-1, self.fft_size // 2 + 1)
+        if state.shape[0] != self.channels:
+            state = np.repeat(state.mean(axis=0, keepdims=True), self.channels, axis=0)
+        return state.copy()
+
+    def learn_noise(self, magnitude):
+        """Fold one (channels, bins) magnitude spectrum into the noise profile during the learning phase"""
+        # The AC bins are left alone while the hum is notched out
+        self.noise_profile, self.noise_std = learn_noise_frame(
+            self.noise_profile, self.noise_std, magnitude, self.noise_samples,
+            None if self.hum_removal else self.ac_bins)
+        self.noise_samples += 1
+        if self.noise_samples >= self.max_noise_samples:
+            self.learning_noise = False
+            print("Noise profile learning completed")
+
+    def track_noise(self, magnitude, steps: int = 1):
+        """Follow the noise with minimum statistics from one (channels, bins) magnitude spectrum
+
+        The tracker starts from the current profile when one was learned or
+        loaded, and from the first spectrum otherwise. ``steps`` counts the
+        spectrum as that many consecutive frames.
+        """
+        tracker = self._noise_tracker
+        if tracker is None:
+            tracker = self._noise_tracker = self.new_noise_tracker(self.noise_profile.shape)
+            if self.noise_samples:
+                tracker.seed((self.noise_profile / PROFILE_SCALE) ** 2)
+        tracker.update(magnitude, steps)
+        tracker.profile(self.noise_profile, self.noise_std)
+        self.noise_samples = self.max_noise_samples
+        self.learning_noise = False
+
+    def new_noise_tracker(self, shape):
+        """A noise tracker for (..., bins) spectra that searches minima over ``noise_tracking_window``"""
+        window = max(int(self.noise_tracking_window * self.sample_rate / self.hop_size), 1)
+        return NoiseTracker(shape, self.dtype, window)
+
+    def compute_gain(self, magnitude, energy, noise_profile=None, noise_std=None, suppress_ac=None,
+                     smooth=True):
+        """Compute the smoothed spectral gate for one or more magnitude spectra
+
+        ``magnitude`` is (..., channels, bins) and ``energy`` holds one value
+        per channel spectrum. The noise profile defaults to the current one.
+        With ``smooth=False`` the gain smoothing is left to the caller.
+        Temporal smoothing carries over between calls, so spectra must be
+        passed in time order.
+        """
+        if noise_profile is None:
+            noise_profile = self.noise_profile
+        if noise_std is None:
+            noise_std = self.noise_std
+        if suppress_ac is None:
+            suppress_ac = not self.learning_noise and not self.hum_removal
+
+        gain = spectral_gain(magnitude, energy, noise_profile, noise_std, self.noise_threshold,
+                             self.voice_threshold, self.non_voice_gain,
+                             self.ac_bins if suppress_ac else None, 1 - self.ac_suppression_factor)
+
+        # Linked channels share the most permissive gain of any channel
+        if self.link_channels:
+            gain = np.broadcast_to(gain.max(axis=-2, keepdims=True), gain.shape).copy()
+
+        # 4. Smooth the gain across frequency and time to avoid musical noise
+        return self._smooth_gain(gain, gain) if smooth else gain
+
+    def _smooth_gain(self, gain, out=None):
+        """Smooth the gain of every channel, picking up changed smoothing settings"""
+        if self._gain_smoothing_settings != self.gain_smoothing_settings:
+            self._init_gain_smoother()
+        return self.gain_smoother.process(gain, out)
+
+    def adapt_noise_profile(self, magnitude):
+        """Slowly track the noise profile and deviation from gated magnitude spectra
+
+        ``magnitude`` is either one (channels, bins) spectrum or a
+        (frames, channels, bins) batch in time order, in which case the
+        exponential blend is applied in closed form for the whole batch.
+        """
+        if magnitude.ndim == self.noise_profile.ndim:
+            magnitude = magnitude[np.newaxis]
+        self.noise_profile, self.noise_std = adapt_noise(self.noise_profile, self.noise_std, magnitude,
+                                                         self.smoothing_factor,
+                                                         None if self.hum_removal else self.ac_bins)
+
+    def _apply_noise_suppression(self, audio_chunk, out=None):
+        """Apply noise suppression to the audio chunk using spectral gating
+
+        ``audio_chunk`` is (frames,) or (frames, channels) and ``frames``
+        must be a multiple of ``hop_size``. The output lags the input by
+        ``self.algorithmic_latency`` seconds.
+        """
+        timer = self.instrumentation
+        if timer is not None:
+            timer.begin_block()
+
+        if self.hum_removal:
+            audio_chunk = self.hum_filter.process(audio_chunk)
+            if timer is not None:
+                timer.mark(HUM)
+
+        if self._is_silent(audio_chunk):
+            processed = self._pass_silence(audio_chunk, out)
+        else:
+            processed = self.stft.process(audio_chunk, self._gate_spectrum, out)
+
+        # Normalize by the peak without an intermediate absolute value array
+        processed /= max(processed.max(), -processed.min()) + 1e-6
+
+        if timer is not None:
+            timer.mark(NORMALIZE)
+            timer.end_block()
+        return processed
+
+    def _is_silent(self, audio_chunk):
+        """Whether a block is confidently without voice, from its time-domain energy
+
+        The block energy is on the same scale the gate compares against
+        ``voice_threshold``. A block above ``vad_on_ratio`` of the threshold
+        starts full processing; it stops once blocks stayed below
+        ``vad_off_ratio`` for ``vad_hangover`` seconds.
+        """
+        timer = self.instrumentation
+        if not self.vad_enabled or self.learning_noise:
+            self.vad_blocks['full'] += 1
+            return False
+
+        energy = np.max(block_energy(audio_chunk.reshape(len(audio_chunk), -1), self.chunk_size))
+        self._vad_hold = int(update_vad_hold(energy, self._vad_hold, self.voice_threshold, self.vad_on_ratio,
+                                             self.vad_off_ratio, int(self.vad_hangover * self.sample_rate),
+                                             len(audio_chunk)))
+        silent = self._vad_hold <= 0
+        self.vad_blocks['fast' if silent else 'full'] += 1
+        if timer is not None:
+            timer.mark(VAD)
+        return silent
+
+    def _pass_silence(self, audio_chunk, out=None):
+        """Attenuate a silent block without the spectral gating and track the noise from it
+
+        Only the newest frame is transformed. The noise adapts from it as
+        from every frame of the block, the same way the gating adapts it.
+        """
+        timer = self.instrumentation
+        processed = self.stft.bypass(audio_chunk, self.non_voice_gain, out)
+        if timer is not None:
+            timer.mark(GAIN)
+
+        if not self.freeze_noise_profile:
+            frames = len(audio_chunk) // self.hop_size
+            magnitude = np.abs(self.stft.latest_spectrum())
+            if self.noise_estimator == 'tracking':
+                self.track_noise(magnitude, frames)
+            else:
+                gain = self.compute_gain(magnitude, spectrum_energy(magnitude, self.energy_scale))
+                gated = np.multiply(magnitude, gain, out=magnitude)
+                self.adapt_noise_profile(np.broadcast_to(gated, (frames,) + gated.shape))
+            if timer is not None:
+                timer.mark(NOISE_PROFILE)
+        return processed
+
+    def _gate_spectrum(self, spec):
+        """Spectral gating of one (channels, bins) STFT frame, in place
+
+        The gain is real, so it scales the complex spectrum directly and the
+        phase never has to be taken apart and put back together.
+        """
+        timer = self.instrumentation
+        # Between gain updates the previous gain is applied as it is
+        if self.gain_update_interval > 1 and not self.learning_noise and self._last_gain is not None:
+            self._gain_frames += 1
+            if self._gain_frames % self.gain_update_interval:
+                spec *= self._last_gain
+                if timer is not None:
+                    timer.mark(GAIN)
+                return spec
+
+        magnitude = self._magnitude
+        if magnitude is None or magnitude.shape != spec.shape:
+            magnitude = self._magnitude = np.empty(spec.shape, spec.real.dtype)
+        np.abs(spec, out=magnitude)
+
+        # Calculate signal energy per channel
+        current_energy = spectrum_energy(magnitude, self.energy_scale)
+        if timer is not None:
+            timer.mark(MAGNITUDE)
+
+        # Track the noise continuously, or learn it during the initial learning phase
+        if self.noise_estimator == 'tracking':
+            if not self.freeze_noise_profile:
+                self.track_noise(magnitude)
+                if timer is not None:
+                    timer.mark(NOISE_PROFILE)
+        elif self.learning_noise and self.noise_samples < self.max_noise_samples:
+            self.learn_noise(magnitude)
+            if timer is not None:
+                timer.mark(NOISE_PROFILE)
+
+        # Apply spectral gating
+        gain = self.compute_gain(magnitude, current_energy, smooth=False)
+        if timer is not None:
+            timer.mark(GAIN)
+
+        # Smooth the gain to avoid musical noise
+        gain = self._smooth_gain(gain, gain)
+        self._last_gain = gain
+        if timer is not None:
+            timer.mark(SMOOTHING)
+
+        # Update noise profile slowly from the gated magnitude
+        if self.noise_estimator == 'learned' and not self.learning_noise and not self.freeze_noise_profile:
+            self.adapt_noise_profile(np.multiply(magnitude, gain, out=magnitude))
+            if timer is not None:
+                timer.mark(NOISE_PROFILE)
+
+        # Apply gain to the spectrum
+        spec *= gain
+        if timer is not None:
+            timer.mark(GAIN)
+        return spec
@@ -0,0 +1,197 @@
+import os
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from .ring_buffer import BlockRingBuffer
+from .wavio import WavStreamWriter
+
+# Tap points of the live path, in file name order
+INPUT, OUTPUT = range(2)
+TAP_POINTS = ('input', 'output')
+
+class CompressedWriter:
+    """Audio file in a compressed format such as FLAC or Ogg Vorbis
+
+    Written through soundfile, which is only imported when a compressed
+    recording starts.
+    """
+
+    def __init__(self, path: str, sample_rate: int, channels: int, file_format: str = 'flac'):
+        import soundfile
+        self.path = path
+        self._file = soundfile.SoundFile(path, 'w', sample_rate, channels, format=file_format.upper())
+
+    @property
+    def size(self):
+        """Bytes in the file so far"""
+        return os.path.getsize(self.path)
+
+    def write(self, audio):
+        """Append float samples in [-1, 1]"""
+        self._file.write(audio)
+
+    def close(self):
+        """Finish and close the file"""
+        self._file.close()
+
+class TapRecorder:
+    """Records the raw input and processed output blocks of the live path to rotating files
+
+    ``record`` only copies a block into a preallocated ring per tap point,
+    so it is safe to call from the audio callback. When the writer falls
+    behind and a ring is full, the block is dropped and counted instead of
+    waiting. A writer thread empties the rings every ``flush_interval``
+    seconds, writing all pending blocks of a tap point in one sequential
+    write. A tap point moves on to a new file once its current one holds
+    ``max_file_seconds`` of audio or has reached ``max_file_bytes``.
+
+    Files are named ``<point>-<start time>-<number>.<file_format>``.
+    'wav' is written directly in ``sample_format``; other formats, e.g.
+    'flac', need soundfile. ``channels`` is one count for both points or an
+    (input, output) pair, like the channels of a duplex stream.
+    """
+
+    def __init__(self,
+                 directory: str,
+                 sample_rate: int,
+                 chunk_size: int,
+                 channels=1,
+                 file_format: str = 'wav',
+                 sample_format: str = 'int16',
+                 max_file_seconds: Optional[float] = 600.0,
+                 max_file_bytes: Optional[int] = None,
+                 buffer_seconds: float = 5.0,
+                 flush_interval: float = 0.5):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        self.channels = (channels, channels) if np.ndim(channels) == 0 else tuple(channels)
+        self.file_format = file_format.lower()
+        self.sample_format = sample_format
+        self.max_file_seconds = max_file_seconds
+        self.max_file_bytes = max_file_bytes
+        self.buffer_seconds = buffer_seconds
+        self.flush_interval = flush_interval
+        if self.file_format != 'wav':
+            import soundfile  # Fail here rather than on the writer thread
+        os.makedirs(directory, exist_ok=True)
+
+        depth = max(int(buffer_seconds * sample_rate / chunk_size), 2)
+        self.rings = [BlockRingBuffer(depth, chunk_size, count, underrun_policy=None) for count in self.channels]
+        # Writer side staging, per point
+        self._batches = [np.zeros((depth, chunk_size, count), dtype=np.float32) for count in self.channels]
+        self._writers = [None] * len(TAP_POINTS)
+        self._file_frames = [0] * len(TAP_POINTS)  # Frames in the current file of each point
+        self.files = [[] for _ in TAP_POINTS]  # Every file started, per point
+        self.frames_written = [0] * len(TAP_POINTS)
+        self.errors = 0
+        # Written seconds and dropped blocks of the recorders this one took over from
+        self._earlier_seconds = [0.0] * len(TAP_POINTS)
+        self._earlier_dropped = [0] * len(TAP_POINTS)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def record(self, point: int, block):
+        """Queue a (frames, channels) block for ``point`` without blocking; False if it was dropped"""
+        return self.rings[point].write(block)
+
+    def reopen(self, sample_rate: int, chunk_size: int, channels):
+        """A recorder with the same options for a new stream configuration, taking over from this one
+
+        This recorder first writes out every queued block and closes; a
+        block queued after that counts as dropped. The files and counts
+        carry over, so the stats of the new recorder cover both.
+        """
+        self.close()
+        recorder = TapRecorder(self.directory, sample_rate, chunk_size, channels, self.file_format,
+                               self.sample_format, self.max_file_seconds, self.max_file_bytes,
+                               self.buffer_seconds, self.flush_interval)
+        recorder.files = [list(files) for files in self.files]
+        recorder.errors = self.errors
+        for point, ring in enumerate(self.rings):
+            recorder._earlier_seconds[point] = self._earlier_seconds[point] + \
+                self.frames_written[point] / self.sample_rate
+            recorder._earlier_dropped[point] = self._earlier_dropped[point] + ring.overruns + len(ring)
+        return recorder
+
+    def close(self, wait: bool = True):
+        """Write what is queued, close the files and end the writer thread"""
+        self._stop.set()
+        if wait and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def stats(self):
+        """Files, written and dropped seconds and pending blocks of every tap point"""
+        stats = {'directory': self.directory, 'errors': self.errors}
+        for point, name in enumerate(TAP_POINTS):
+            stats[name] = {
+                'files': list(self.files[point]),
+                'seconds': self._earlier_seconds[point] + self.frames_written[point] / self.sample_rate,
+                'dropped_blocks': self._earlier_dropped[point] + self.rings[point].overruns,
+                'pending_blocks': len(self.rings[point]),
+            }
+        return stats
+
+    def _run(self):
+        """Writer loop: empty the rings every flush interval until closed"""
+        try:
+            while not self._stop.wait(self.flush_interval):
+                self._flush()
+            self._flush()
+        finally:
+            for point, writer in enumerate(self._writers):
+                if writer is not None:
+                    writer.close()
+                    self._writers[point] = None
+
+    def _flush(self):
+        """Write every pending block, counting failures instead of stopping"""
+        for point in range(len(TAP_POINTS)):
+            try:
+                self._flush_point(point)
+            except Exception as e:
+                self.errors += 1
+                print(f"Error writing {TAP_POINTS[point]} recording: {e}")
+
+    def _flush_point(self, point: int):
+        """Write the pending blocks of one tap point, starting new files where limits are reached"""
+        ring = self.rings[point]
+        batch = self._batches[point]
+        count = len(ring)
+        for i in range(count):
+            ring.read(batch[i])
+        audio = batch[:count].reshape(-1, self.channels[point])
+        max_frames = int(self.max_file_seconds * self.sample_rate) if self.max_file_seconds else None
+        while len(audio):
+            writer = self._writers[point]
+            if writer is None:
+                writer = self._writers[point] = self._open(point)
+            room = len(audio) if max_frames is None else min(len(audio), max_frames - self._file_frames[point])
+            writer.write(audio[:room])
+            self._file_frames[point] += room
+            self.frames_written[point] += room
+            audio = audio[room:]
+            if (max_frames is not None and self._file_frames[point] >= max_frames) or \
+                    (self.max_file_bytes is not None and writer.size >= self.max_file_bytes):
+                writer.close()
+                self._writers[point] = None
+
+    def _open(self, point: int):
+        """Start the next file of a tap point"""
+        started = time.strftime('%Y%m%d-%H%M%S')
+        number = len(self.files[point]) + 1
+        path = os.path.join(self.directory, f"{TAP_POINTS[point]}-{started}-{number:03d}.{self.file_format}")
+        while os.path.exists(path):  # A recorder reopened within the same second
+            number += 1
+            path = os.path.join(self.directory, f"{TAP_POINTS[point]}-{started}-{number:03d}.{self.file_format}")
+        if self.file_format == 'wav':
+            writer = WavStreamWriter(path, self.sample_rate, self.channels[point], self.sample_format)
+        else:
+            writer = CompressedWriter(path, self.sample_rate, self.channels[point], self.file_format)
+        self.files[point].append(path)
+        self._file_frames[point] = 0
+        return writer
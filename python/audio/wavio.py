@@ -0,0 +1,257 @@
+import struct
+
+import numpy as np
+
+# WAVE format tags
+PCM = 1
+IEEE_FLOAT = 3
+EXTENSIBLE = 0xFFFE
+
+# Sample formats by (format tag, bits per sample), stored little-endian
+SAMPLE_FORMATS = {
+    (PCM, 8): 'uint8',
+    (PCM, 16): 'int16',
+    (PCM, 24): 'int24',
+    (PCM, 32): 'int32',
+    (IEEE_FLOAT, 32): 'float32',
+}
+STORAGE = {'uint8': '<u1', 'int16': '<i2', 'int32': '<i4', 'float32': '<f4'}
+
+def _read_header(f):
+    """(format tag, channels, sample rate, bits, data offset, data size) of an open WAV file"""
+    riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+    if riff != b'RIFF' or wave != b'WAVE':
+        raise ValueError("Not a RIFF WAVE file")
+    fmt = None
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            raise ValueError("WAV file has no data chunk")
+        chunk_id, size = struct.unpack('<4sI', header)
+        if chunk_id == b'fmt ':
+            body = f.read(size)
+            tag, channels, sample_rate, _, _, bits = struct.unpack('<HHIIHH', body[:16])
+            if tag == EXTENSIBLE and size >= 26:
+                tag = struct.unpack('<H', body[24:26])[0]  # First two bytes of the sub-format GUID
+            fmt = (tag, channels, sample_rate, bits)
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise ValueError("WAV data chunk comes before the fmt chunk")
+            return fmt + (f.tell(), size)
+        else:
+            f.seek(size + (size & 1), 1)  # Chunks are padded to an even size
+
+class WavReader:
+    """Memory-mapped WAV file read as float32 blocks without loading it
+
+    Supports 8, 16, 24 and 32-bit PCM and 32-bit float. Float files are
+    handed out as zero-copy views of the mapping; other formats are
+    converted into one reused block buffer.
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            tag, self.channels, self.sample_rate, bits, offset, size = _read_header(f)
+        if (tag, bits) not in SAMPLE_FORMATS:
+            raise ValueError(f"Unsupported WAV format: tag {tag} with {bits} bits per sample")
+        self.sample_format = SAMPLE_FORMATS[(tag, bits)]
+        width = bits // 8
+        self.frames = size // (width * self.channels)
+
+        if self.frames == 0:
+            self._data = np.empty((0, self.channels, 3) if self.sample_format == 'int24' else (0, self.channels))
+        elif self.sample_format == 'int24':
+            self._data = np.memmap(path, np.uint8, 'r', offset, (self.frames, self.channels, 3))
+        else:
+            self._data = np.memmap(path, STORAGE[self.sample_format], 'r', offset, (self.frames, self.channels))
+        self._buffer = None
+
+    @property
+    def duration(self):
+        """Length in seconds"""
+        return self.frames / self.sample_rate
+
+    def close(self):
+        """Release the mapping"""
+        self._data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def read(self, start: int, stop: int):
+        """Frames ``start:stop`` as a (frames, channels) float32 array in [-1, 1]
+
+        The result is a view of the file or of a buffer reused by the next
+        call, so copy it to keep it.
+        """
+        raw = self._data[start:stop]
+        if self.sample_format == 'float32':
+            return np.asarray(raw)
+
+        if self._buffer is None or len(self._buffer) < len(raw):
+            self._buffer = np.empty((len(raw), self.channels), dtype=np.float32)
+        out = self._buffer[:len(raw)]
+        if self.sample_format == 'int24':
+            # Sign-extend the top byte and add the lower two
+            ints = raw[..., 2].view(np.int8).astype(np.int32) << 16
+            ints |= raw[..., 1].astype(np.int32) << 8
+            ints |= raw[..., 0]
+            np.multiply(ints, 1 / (1 << 23), out=out, casting='unsafe')
+        elif self.sample_format == 'uint8':
+            out[...] = raw
+            out -= 128
+            out *= 1 / 128
+        else:
+            np.multiply(raw, 1 / (np.iinfo(raw.dtype).max + 1), out=out, casting='unsafe')
+        return out
+
+    def blocks(self, block_size: int, pad: bool = False):
+        """Yield consecutive ``block_size``-frame float32 blocks
+
+        With ``pad`` the last block is zero padded to the full size,
+        otherwise it is shorter. Blocks follow the rules of ``read``.
+        """
+        for start in range(0, self.frames, block_size):
+            block = self.read(start, start + block_size)
+            if pad and len(block) < block_size:
+                padded = np.zeros((block_size, self.channels), dtype=np.float32)
+                padded[:len(block)] = block
+                block = padded
+            yield block
+
+def _sample_width(sample_format: str):
+    """Bytes per sample of a WAV sample format"""
+    if sample_format not in STORAGE and sample_format != 'int24':
+        raise ValueError(f"Unsupported WAV sample format {sample_format}")
+    return 3 if sample_format == 'int24' else np.dtype(STORAGE[sample_format]).itemsize
+
+def _wav_header(sample_rate: int, channels: int, sample_format: str, data_size: int):
+    """Canonical 44-byte header of a WAV file holding ``data_size`` bytes of samples"""
+    width = _sample_width(sample_format)
+    tag = IEEE_FLOAT if sample_format == 'float32' else PCM
+    return struct.pack('<4sI4s4sIHHIIHH4sI', b'RIFF', 36 + data_size, b'WAVE',
+                       b'fmt ', 16, tag, channels, sample_rate,
+                       sample_rate * channels * width, channels * width, 8 * width,
+                       b'data', data_size)
+
+def _encode(audio, sample_format: str, target):
+    """Store float samples in [-1, 1] into ``target`` in the sample format, clipping the rest"""
+    audio = np.clip(audio, -1.0, 1.0)
+    if sample_format == 'float32':
+        target[...] = audio
+    elif sample_format == 'int24':
+        ints = np.clip(np.round(audio * (1 << 23)), -(1 << 23), (1 << 23) - 1).astype(np.int32)
+        for byte in range(3):
+            target[..., byte] = (ints >> (8 * byte)) & 0xFF
+    elif sample_format == 'uint8':
+        target[...] = np.clip(np.round(audio * 128 + 128), 0, 255)
+    else:
+        info = np.iinfo(target.dtype)
+        target[...] = np.clip(np.round(audio * (info.max + 1)), info.min, info.max)
+
+class WavWriter:
+    """WAV file of a known length, preallocated and written block by block through a memory map
+
+    The header is final from the start. Frames that are never written stay
+    zero.
+    """
+
+    def __init__(self, path: str, sample_rate: int, channels: int, frames: int, sample_format: str = 'int16'):
+        width = _sample_width(sample_format)
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frames = frames
+        self.sample_format = sample_format
+        self.position = 0
+
+        data_size = frames * channels * width
+        header = _wav_header(sample_rate, channels, sample_format, data_size)
+        with open(path, 'wb') as f:
+            f.write(header)
+            f.truncate(len(header) + data_size)
+        if frames == 0:
+            self._data = np.empty((0, channels, 3) if sample_format == 'int24' else (0, channels))
+        elif sample_format == 'int24':
+            self._data = np.memmap(path, np.uint8, 'r+', len(header), (frames, channels, 3))
+        else:
+            self._data = np.memmap(path, STORAGE[sample_format], 'r+', len(header), (frames, channels))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, audio):
+        """Append float samples in [-1, 1], (samples,) or (samples, channels)"""
+        audio = np.asarray(audio)
+        if audio.ndim == 1:
+            audio = audio[:, np.newaxis]
+        stop = self.position + len(audio)
+        if stop > self.frames:
+            raise ValueError(f"Writing past the {self.frames} preallocated frames")
+        _encode(audio, self.sample_format, self._data[self.position:stop])
+        self.position = stop
+
+    def close(self):
+        """Flush the mapping to disk and release it"""
+        if isinstance(self._data, np.memmap):
+            self._data.flush()
+        self._data = None
+
+class WavStreamWriter:
+    """WAV file of open-ended length, appended to with one sequential write per call
+
+    Samples are encoded into a reused buffer and written straight to the
+    file. The sizes in the header are filled in on ``close``.
+    """
+
+    def __init__(self, path: str, sample_rate: int, channels: int, sample_format: str = 'int16'):
+        self.width = _sample_width(sample_format)
+        self.path = path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_format = sample_format
+        self.frames = 0
+        self._file = open(path, 'wb')
+        self._file.write(_wav_header(sample_rate, channels, sample_format, 0))
+        self._buffer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def size(self):
+        """Bytes in the file so far"""
+        return 44 + self.frames * self.channels * self.width
+
+    def write(self, audio):
+        """Append float samples in [-1, 1], (samples,) or (samples, channels)"""
+        audio = np.asarray(audio)
+        if audio.ndim == 1:
+            audio = audio[:, np.newaxis]
+        if self._buffer is None or len(self._buffer) < len(audio):
+            shape = (len(audio), self.channels) + ((3,) if self.sample_format == 'int24' else ())
+            self._buffer = np.empty(shape, np.uint8 if self.sample_format == 'int24' else STORAGE[self.sample_format])
+        target = self._buffer[:len(audio)]
+        _encode(audio, self.sample_format, target)
+        self._file.write(memoryview(target).cast('B'))
+        self.frames += len(audio)
+
+    def close(self):
+        """Write the final sizes into the header and close the file"""
+        if self._file is None:
+            return
+        data_size = self.frames * self.channels * self.width
+        if data_size & 1:
+            self._file.write(b'\0')  # Chunks are padded to an even size
+        self._file.seek(0)
+        self._file.write(_wav_header(self.sample_rate, self.channels, self.sample_format, data_size))
+        self._file.close()
+        self._file = None
@@ -0,0 +1,126 @@
+import argparse
+import contextlib
+import io
+import json
+import time
+
+import numpy as np
+from scipy import signal
+
+from audio.backends import VirtualBackend
+from audio.batch import read_wav, write_wav
+from .processor import create_processor, environment, parse_settings
+from .signals import SIGNALS
+
+def measure_delay(reference, recorded, sample_rate: int, max_delay: float = 0.5):
+    """Lag of ``recorded`` behind ``reference`` in seconds, found by cross-correlation
+
+    The first third of the recording is skipped so the noise learning phase
+    does not dominate. The estimate is only as good as the resemblance of
+    the denoised output to the input, and strongly periodic signals can
+    shift it by whole periods.
+    """
+    reference = np.asarray(reference, dtype=float).reshape(len(reference), -1).mean(axis=1)
+    recorded = np.asarray(recorded, dtype=float).reshape(len(recorded), -1).mean(axis=1)
+    max_lag = int(max_delay * sample_rate)
+    start = max(len(reference) // 3, max_lag)
+    length = min(len(reference), len(recorded)) - start
+    if length <= 0:
+        return 0.0
+    correlation = signal.correlate(reference[start - max_lag:start + length],
+                                   recorded[start:start + length], mode='valid')
+    return (max_lag - int(np.argmax(correlation))) / sample_rate
+
+def run_end_to_end(audio, sample_rate: int, chunk_size: int, mode: str = 'threaded',
+                   realtime: bool = True, device_latency: float = 0.0, settings: dict = None):
+    """Stream ``audio`` through a full AudioProcessor on a virtual device
+
+    Returns the recorded output and a report of the measured delay, the
+    latency the processor reported and the stream event counters.
+    """
+    audio = np.asarray(audio, dtype=np.float32).reshape(len(audio), -1)
+    backend = VirtualBackend(audio, realtime=realtime, device_latency=device_latency)
+    processor = create_processor(sample_rate, chunk_size, audio.shape[1], settings or {})
+    processor.stream_backend = backend
+    processor.noise_cache = None  # Runs must not depend on or change cached profiles
+    if mode == 'threaded':
+        # A fast stream waits for the processing thread instead of outrunning it
+        backend.pace = processor.wait_for_output
+    processor.set_devices(VirtualBackend.INPUT_NAME, VirtualBackend.OUTPUT_NAME)
+    processor.enable_instrumentation(True)
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor.start_stream(mode)
+        # The stream thread returns once the virtual input is exhausted
+        processor.stream_thread.join()
+        processor.stop_processing()
+    elapsed = time.perf_counter() - start
+
+    snapshot = processor.get_instrumentation()
+    report = {
+        'mode': mode,
+        'realtime': realtime,
+        'sample_rate': sample_rate,
+        'chunk_size': chunk_size,
+        'channels': audio.shape[1],
+        'blocks': backend.position // chunk_size,
+        'audio_seconds': backend.position / sample_rate,
+        'wall_seconds': elapsed,
+        'measured_delay_ms': measure_delay(audio, backend.output, sample_rate) * 1000,
+        'reported_latency': processor.get_latency(),
+        'late_callbacks': backend.late_blocks,
+        'underruns': snapshot['underruns'],
+        'overruns': snapshot['overruns'],
+        'fallback_raw': snapshot['fallback_raw'],
+        'buffers': processor.get_buffer_stats(),
+        'block': snapshot['block'],
+    }
+    return backend.output, report
+
+def format_report(report):
+    """Human readable summary of an end-to-end run"""
+    latency = report['reported_latency']
+    return (f"{report['mode']:>8} {'real time' if report['realtime'] else 'fast':>9}  "
+            f"{report['blocks']} blocks in {report['wall_seconds']:.2f} s  "
+            f"delay {report['measured_delay_ms']:.1f} ms (reported {latency['round_trip_ms']:.1f} ms)  "
+            f"underruns {report['underruns']}  raw fallback {report['fallback_raw']}  "
+            f"overruns {report['overruns']}  late callbacks {report['late_callbacks']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the live pipeline end to end on a virtual audio device")
+    parser.add_argument("--input", help="WAV file to play instead of a synthetic signal")
+    parser.add_argument("--signal", default='speech+pink', choices=list(SIGNALS))
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    parser.add_argument("--chunk-size", type=int, default=1024)
+    parser.add_argument("--channels", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of synthetic audio")
+    parser.add_argument("--mode", nargs='+', default=['threaded', 'callback'], choices=['threaded', 'callback'])
+    parser.add_argument("--fast", action='store_true', help="deliver blocks as fast as possible instead of in real time")
+    parser.add_argument("--device-latency", type=float, default=0.0, help="simulated device latency in ms")
+    parser.add_argument("--set", dest="settings", action='append', metavar="NAME=VALUE",
+                        help="override an AudioProcessor setting")
+    parser.add_argument("--record", help="write the processed output of the last run to this WAV file")
+    parser.add_argument("--output", help="write the reports as JSON to this file")
+    args = parser.parse_args(argv)
+
+    if args.input:
+        audio, sample_rate, _ = read_wav(args.input)
+    else:
+        sample_rate = args.sample_rate
+        audio = SIGNALS[args.signal](args.duration, sample_rate, args.channels)
+
+    reports = []
+    for mode in args.mode:
+        output, report = run_end_to_end(audio, sample_rate, args.chunk_size, mode,
+                                        realtime=not args.fast,
+                                        device_latency=args.device_latency / 1000,
+                                        settings=parse_settings(args.settings))
+        print(format_report(report))
+        reports.append(report)
+
+    if args.record:
+        write_wav(args.record, output, sample_rate)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment(), 'reports': reports}, f, indent=2)
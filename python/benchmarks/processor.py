@@ -0,0 +1,195 @@
+import argparse
+import ast
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import scipy
+
+from audio.processor import AudioProcessor
+from .signals import SIGNALS
+
+CASE_KEYS = ('signal', 'sample_rate', 'chunk_size', 'channels')
+METRICS = ('p50_ms', 'p99_ms', 'max_ms', 'real_time_factor', 'alloc_peak_kib')
+# Settings that size the processing state and must be passed to the constructor
+CONSTRUCTOR_SETTINGS = ('hop_size', 'dtype', 'fft_workers')
+
+def parse_settings(items):
+    """Parse ``name=value`` pairs into AudioProcessor attribute overrides"""
+    settings = {}
+    for item in items or []:
+        name, _, value = item.partition('=')
+        try:
+            settings[name] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            settings[name] = value
+    return settings
+
+def create_processor(sample_rate: int, chunk_size: int, channels: int, settings: dict):
+    """Build an AudioProcessor without opening any audio device"""
+    arguments = {name: value for name, value in settings.items() if name in CONSTRUCTOR_SETTINGS}
+    processor = AudioProcessor(sample_rate=sample_rate, channels=channels, chunk_size=chunk_size,
+                               **arguments)
+    for name, value in settings.items():
+        if name not in CONSTRUCTOR_SETTINGS:
+            setattr(processor, name, value)
+    processor._init_ac_bins()
+    return processor
+
+def run_case(signal_name: str, sample_rate: int, chunk_size: int, channels: int,
+             duration: float = 10.0, warmup: int = 10, settings: dict = None,
+             allocation_blocks: int = 50, stages: bool = False):
+    """Time _apply_noise_suppression block by block on one synthetic signal
+
+    With ``stages`` the processor's instrumentation is enabled and the
+    median per-block cost of every hot-path stage is added to the result.
+    """
+    settings = settings or {}
+    audio = SIGNALS[signal_name](duration, sample_rate, channels)
+    num_blocks = len(audio) // chunk_size
+    out = np.empty((chunk_size, channels))
+
+    processor = create_processor(sample_rate, chunk_size, channels, settings)
+    processor.enable_instrumentation(stages)
+    times = np.empty(num_blocks)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(num_blocks):
+            block = audio[i * chunk_size:(i + 1) * chunk_size]
+            start = time.perf_counter()
+            processor._apply_noise_suppression(block, out)
+            times[i] = time.perf_counter() - start
+
+    measured = times[min(warmup, num_blocks - 1):]
+    block_duration = chunk_size / sample_rate
+    result = {
+        'signal': signal_name,
+        'sample_rate': sample_rate,
+        'chunk_size': chunk_size,
+        'channels': channels,
+        'blocks': len(measured),
+        'mean_ms': float(np.mean(measured) * 1000),
+        'p50_ms': float(np.percentile(measured, 50) * 1000),
+        'p99_ms': float(np.percentile(measured, 99) * 1000),
+        'max_ms': float(np.max(measured) * 1000),
+        'real_time_factor': float(np.mean(measured) / block_duration),
+        'deadline_misses': int(np.sum(measured > block_duration)),
+    }
+    if stages:
+        snapshot = processor.get_instrumentation()
+        result['stage_p50_ms'] = {name: summary['p50_ms'] for name, summary in snapshot['stages'].items()}
+    processor.enable_instrumentation(False)
+    result['alloc_peak_kib'] = _allocation_peak(processor, audio, chunk_size, out, allocation_blocks)
+    return result
+
+def _allocation_peak(processor, audio, chunk_size, out, num_blocks):
+    """Mean peak of memory allocated while processing one block, in KiB
+
+    Runs in a separate pass because tracing allocations slows every call
+    down. Returns None on Python versions without tracemalloc.reset_peak.
+    """
+    if not hasattr(tracemalloc, 'reset_peak') or num_blocks <= 0:
+        return None
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(min(num_blocks, len(audio) // chunk_size)):
+                block = audio[i * chunk_size:(i + 1) * chunk_size]
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                processor._apply_noise_suppression(block, out)
+                peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+    return float(np.mean(peaks) / 1024)
+
+def environment():
+    """Describe the machine and library versions a run was made with"""
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def run_suite(signals, sample_rates, chunk_sizes, channel_counts, duration, warmup, settings,
+              stages=False):
+    """Run every combination of the sweep parameters"""
+    results = []
+    for signal_name in signals:
+        for sample_rate in sample_rates:
+            for chunk_size in chunk_sizes:
+                for channels in channel_counts:
+                    result = run_case(signal_name, sample_rate, chunk_size, channels,
+                                      duration=duration, warmup=warmup, settings=settings,
+                                      stages=stages)
+                    print(format_result(result), file=sys.stderr)
+                    results.append(result)
+    return {'environment': environment(), 'settings': settings, 'results': results}
+
+def format_result(result):
+    """One-line human readable summary of a benchmark case"""
+    alloc = result['alloc_peak_kib']
+    alloc = f"{alloc:8.1f} KiB" if alloc is not None else "     n/a"
+    return (f"{result['signal']:>12} {result['sample_rate']:>6} Hz {result['chunk_size']:>5} "
+            f"x{result['channels']}  p50 {result['p50_ms']:7.3f} ms  p99 {result['p99_ms']:7.3f} ms  "
+            f"max {result['max_ms']:7.3f} ms  RTF {result['real_time_factor']:.3f}  alloc {alloc}")
+
+def compare(base_path: str, new_path: str):
+    """Print the relative change of every metric between two result files"""
+    with open(base_path) as f:
+        base = {tuple(r[k] for k in CASE_KEYS): r for r in json.load(f)['results']}
+    with open(new_path) as f:
+        new = json.load(f)['results']
+
+    for result in new:
+        key = tuple(result[k] for k in CASE_KEYS)
+        if key not in base:
+            continue
+        changes = []
+        for metric in METRICS:
+            old_value, new_value = base[key].get(metric), result.get(metric)
+            if old_value and new_value is not None:
+                changes.append(f"{metric} {100 * (new_value - old_value) / old_value:+6.1f}%")
+        for stage, new_value in result.get('stage_p50_ms', {}).items():
+            old_value = base[key].get('stage_p50_ms', {}).get(stage)
+            if old_value:
+                changes.append(f"{stage} {100 * (new_value - old_value) / old_value:+6.1f}%")
+        print(f"{' '.join(str(k) for k in key):>28}  " + "  ".join(changes))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the spectral gating hot path")
+    parser.add_argument("--signals", nargs='+', default=list(SIGNALS), choices=list(SIGNALS))
+    parser.add_argument("--sample-rates", nargs='+', type=int, default=[16000, 44100, 48000])
+    parser.add_argument("--chunk-sizes", nargs='+', type=int, default=[256, 512, 1024, 2048])
+    parser.add_argument("--channels", nargs='+', type=int, default=[1, 2])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of audio per case")
+    parser.add_argument("--warmup", type=int, default=10, help="blocks excluded from the timings")
+    parser.add_argument("--set", dest="settings", action='append', metavar="NAME=VALUE",
+                        help="override an AudioProcessor setting, e.g. --set median_kernel_size=5 "
+                             "or --set dtype=float32")
+    parser.add_argument("--stages", action='store_true', help="also record the cost of each hot-path stage")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"),
+                        help="compare two result files instead of running")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run_suite(args.signals, args.sample_rates, args.chunk_sizes, args.channels,
+                       args.duration, args.warmup, parse_settings(args.settings), args.stages)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
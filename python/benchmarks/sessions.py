@@ -0,0 +1,94 @@
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+
+import numpy as np
+
+from audio.sessions import SessionEngine
+from audio.suppressor import NoiseSuppressor
+from .processor import environment
+from .signals import SIGNALS
+
+def run_sessions(streams: int, sample_rate: int, chunk_size: int, duration: float, workers: int = 1,
+                 warmup: int = 10):
+    """Per-stream cost of one SessionEngine tick against one NoiseSuppressor per stream
+
+    Only blocks after the noise learning phase plus ``warmup`` are timed.
+    """
+    audio = SIGNALS['speech+pink'](duration, sample_rate, 1)[:, 0]
+    num_blocks = len(audio) // chunk_size
+    # Every stream plays the same signal at its own level and offset
+    offsets = np.linspace(0, num_blocks, streams, endpoint=False).astype(int)
+    gains = np.linspace(0.5, 1.5, streams)
+
+    def blocks(i):
+        return {stream: gains[stream] * audio[((i + offsets[stream]) % num_blocks) * chunk_size:
+                                              ((i + offsets[stream]) % num_blocks + 1) * chunk_size]
+                for stream in range(streams)}
+
+    engine = SessionEngine(sample_rate, chunk_size, workers=workers, capacity=streams)
+    for stream in range(streams):
+        engine.add_session(session_id=stream)
+    suppressors = [NoiseSuppressor(sample_rate, 1, chunk_size) for _ in range(streams)]
+
+    batched = np.empty(num_blocks)
+    separate = np.empty(num_blocks)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(num_blocks):
+            tick = blocks(i)
+            start = time.perf_counter()
+            engine.process(tick)
+            batched[i] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for stream, suppressor in enumerate(suppressors):
+                suppressor._apply_noise_suppression(tick[stream])
+            separate[i] = time.perf_counter() - start
+    engine.close()
+
+    block_duration = chunk_size / sample_rate
+    learning_blocks = engine.template.max_noise_samples * engine.hop_size // chunk_size
+    skip = min(learning_blocks + warmup, num_blocks - 1)
+    batched = batched[skip:]
+    separate = separate[skip:]
+    return {
+        'streams': streams,
+        'workers': workers,
+        'sample_rate': sample_rate,
+        'chunk_size': chunk_size,
+        'batched_us_per_stream': float(np.median(batched) / streams * 1e6),
+        'separate_us_per_stream': float(np.median(separate) / streams * 1e6),
+        'batched_p99_tick_ms': float(np.percentile(batched, 99) * 1000),
+        'max_streams_real_time': int(block_duration / (np.median(batched) / streams)),
+    }
+
+def format_result(result):
+    """One-line summary of a stream count"""
+    return (f"{result['streams']:>5} streams x{result['workers']}  "
+            f"batched {result['batched_us_per_stream']:8.1f} us/stream  "
+            f"separate {result['separate_us_per_stream']:8.1f} us/stream  "
+            f"speedup {result['separate_us_per_stream'] / result['batched_us_per_stream']:5.1f}x  "
+            f"p99 tick {result['batched_p99_tick_ms']:6.2f} ms  "
+            f"real-time capacity ~{result['max_streams_real_time']} streams")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-stream cost of the multi-session engine as streams grow")
+    parser.add_argument("--streams", nargs='+', type=int, default=[1, 4, 16, 64, 256])
+    parser.add_argument("--workers", type=int, default=1, help="engine worker threads")
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--chunk-size", type=int, default=320)
+    parser.add_argument("--duration", type=float, default=8.0, help="seconds of audio per stream count")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = []
+    for streams in args.streams:
+        result = run_sessions(streams, args.sample_rate, args.chunk_size, args.duration, args.workers)
+        print(format_result(result), file=sys.stderr)
+        results.append(result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
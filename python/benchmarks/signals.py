@@ -0,0 +1,60 @@
+import numpy as np
+
+def speech_like(duration: float, sample_rate: int, channels: int = 1, seed: int = 0):
+    """Voiced harmonic tones with a gliding pitch and a syllable-rate envelope"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    f0 = 140 + 40 * np.sin(2 * np.pi * 0.7 * t)  # Pitch glides between 100 and 180 Hz
+    phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 16) if k * 180 < sample_rate / 2)
+    envelope = np.clip(np.sin(2 * np.pi * 3 * t), 0, None) ** 2  # About 6 syllables per second
+    audio = 0.3 * voiced * envelope
+    return _to_channels(audio, channels, rng)
+
+def white_noise(duration: float, sample_rate: int, channels: int = 1, seed: int = 0):
+    """Gaussian white noise"""
+    rng = np.random.default_rng(seed)
+    audio = 0.1 * rng.standard_normal((int(duration * sample_rate), channels))
+    return audio.astype(np.float32)
+
+def pink_noise(duration: float, sample_rate: int, channels: int = 1, seed: int = 0):
+    """1/f noise shaped in the frequency domain"""
+    rng = np.random.default_rng(seed)
+    samples = int(duration * sample_rate)
+    spectrum = np.fft.rfft(rng.standard_normal((channels, samples)), axis=-1)
+    freqs = np.fft.rfftfreq(samples, 1 / sample_rate)
+    spectrum /= np.sqrt(np.maximum(freqs, freqs[1]))
+    audio = np.fft.irfft(spectrum, n=samples, axis=-1).T
+    return (0.1 * audio / np.std(audio)).astype(np.float32)
+
+def mains_hum(duration: float, sample_rate: int, channels: int = 1, seed: int = 0,
+              fundamental: float = 50.0, harmonics: int = 8):
+    """Mains hum at ``fundamental`` Hz with decaying odd and even harmonics"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    audio = sum(0.1 / k * np.sin(2 * np.pi * k * fundamental * t + rng.uniform(0, 2 * np.pi))
+                for k in range(1, harmonics + 1))
+    return _to_channels(audio, channels, rng)
+
+def call_leg(duration: float, sample_rate: int, channels: int = 1, seed: int = 0):
+    """Mostly silent call: 1.5 s talk spurts every 6 s over quiet pink noise"""
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    talking = (t % 6.0) >= 4.5  # First spurt after the noise learning phase
+    speech = speech_like(duration, sample_rate, channels, seed) * talking[:, np.newaxis]
+    return (speech + 0.1 * pink_noise(duration, sample_rate, channels, seed)).astype(np.float32)
+
+def _to_channels(audio, channels, rng):
+    """Copy a mono signal to every channel with a little independent noise"""
+    audio = np.repeat(audio[:, np.newaxis], channels, axis=1)
+    audio += 0.001 * rng.standard_normal(audio.shape)
+    return audio.astype(np.float32)
+
+SIGNALS = {
+    'speech': speech_like,
+    'white': white_noise,
+    'pink': pink_noise,
+    'hum50': lambda *args, **kwargs: mains_hum(*args, fundamental=50.0, **kwargs),
+    'hum60': lambda *args, **kwargs: mains_hum(*args, fundamental=60.0, **kwargs),
+    'speech+pink': lambda *args, **kwargs: speech_like(*args, **kwargs) + pink_noise(*args, **kwargs),
+    'call': call_leg,
+}
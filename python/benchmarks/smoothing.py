@@ -0,0 +1,123 @@
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+
+import numpy as np
+
+from audio.smoothing import GainSmoother
+from .processor import create_processor, environment, run_case
+from .signals import SIGNALS
+
+# Gain smoothing choices compared by default, as AudioProcessor setting overrides
+CHOICES = {
+    'median7': {'gain_smoothing': 'median', 'median_kernel_size': 7},
+    'median5': {'gain_smoothing': 'median', 'median_kernel_size': 5},
+    'mean7': {'gain_smoothing': 'mean', 'median_kernel_size': 7},
+    'none': {'gain_smoothing': 'none'},
+    'median7+release': {'gain_smoothing': 'median', 'median_kernel_size': 7, 'gain_release_time': 0.05},
+    'mean7+release': {'gain_smoothing': 'mean', 'median_kernel_size': 7, 'gain_release_time': 0.05},
+}
+
+def kernel_cost(shape, settings: dict, repeats: int = 500):
+    """Median microseconds to smooth one gain array of ``shape`` in isolation"""
+    smoother = GainSmoother(settings.get('gain_smoothing', 'median'), settings.get('median_kernel_size', 7),
+                            release=0.9 if settings.get('gain_release_time') else 0.0)
+    gain = np.random.default_rng(0).random(shape)
+    out = np.empty(shape)
+    return _median_time(lambda: smoother.process(gain, out), repeats)
+
+def reference_cost(shape, kernel_size: int = 7, repeats: int = 500):
+    """Median microseconds of the scipy median filter the smoother replaces"""
+    from scipy import ndimage
+    gain = np.random.default_rng(0).random(shape)
+    size = (1,) * (len(shape) - 1) + (kernel_size,)
+    return _median_time(lambda: ndimage.median_filter(gain, size=size, mode='constant'), repeats)
+
+def _median_time(call, repeats: int):
+    call()
+    times = np.empty(repeats)
+    for i in range(repeats):
+        start = time.perf_counter()
+        call()
+        times[i] = time.perf_counter() - start
+    return float(np.median(times) * 1e6)
+
+def gain_statistics(settings: dict, sample_rate: int = 44100, chunk_size: int = 1024, duration: float = 10.0):
+    """Mean gain and mean frame-to-frame gain change on pure pink noise once the profile is learned
+
+    Both are lower for less residual noise and less musical noise flicker.
+    """
+    audio = SIGNALS['pink'](duration, sample_rate, 1)
+    processor = create_processor(sample_rate, chunk_size, 1, settings)
+    gains = []
+    smooth_gain = processor._smooth_gain
+
+    def record(gain, out=None):
+        gain = smooth_gain(gain, out)
+        if not processor.learning_noise:
+            gains.append(gain.copy())
+        return gain
+
+    processor._smooth_gain = record
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(len(audio) // chunk_size):
+            processor._apply_noise_suppression(audio[i * chunk_size:(i + 1) * chunk_size])
+    gains = np.array(gains)
+    if len(gains) < 2:
+        return {'mean_gain': None, 'flicker': None}
+    return {'mean_gain': float(gains.mean()), 'flicker': float(np.abs(np.diff(gains, axis=0)).mean())}
+
+def run_choices(choices, signal_name: str, sample_rate: int, chunk_size: int, channels: int, duration: float):
+    """Cost and quality of every gain smoothing choice"""
+    live_shape = (channels, chunk_size // 2 + 1)
+    batch_shape = (64,) + live_shape  # BatchDenoiser's default block of frames
+    results = {'scipy_median7': {
+        'live_us': reference_cost(live_shape),
+        'batch_us': reference_cost(batch_shape),
+    }}
+    for name in choices:
+        settings = CHOICES[name]
+        case = run_case(signal_name, sample_rate, chunk_size, channels, duration=duration,
+                        settings=settings, allocation_blocks=0, stages=True)
+        results[name] = {
+            'live_us': kernel_cost(live_shape, settings),
+            'batch_us': kernel_cost(batch_shape, settings),
+            'block_p50_ms': case['p50_ms'],
+            'smoothing_p50_ms': case['stage_p50_ms']['smoothing'],
+            **gain_statistics(settings, sample_rate, chunk_size, duration),
+        }
+    return results
+
+def format_results(results):
+    """One line per smoothing choice"""
+    lines = [f"{'choice':>16} {'live us':>9} {'batch us':>9} {'block ms':>9} {'stage ms':>9} "
+             f"{'mean gain':>10} {'flicker':>9}"]
+    for name, result in results.items():
+        row = [f"{result['live_us']:9.1f}", f"{result['batch_us']:9.1f}"]
+        for key, width, digits in (('block_p50_ms', 9, 3), ('smoothing_p50_ms', 9, 3),
+                                   ('mean_gain', 10, 4), ('flicker', 9, 4)):
+            value = result.get(key)
+            row.append(f"{value:{width}.{digits}f}" if value is not None else f"{'-':>{width}}")
+        lines.append(f"{name:>16} " + " ".join(row))
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the cost and quality of the gain smoothing choices")
+    parser.add_argument("--choices", nargs='+', default=list(CHOICES), choices=list(CHOICES))
+    parser.add_argument("--signal", default='speech+pink', choices=list(SIGNALS))
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    parser.add_argument("--chunk-size", type=int, default=1024)
+    parser.add_argument("--channels", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of audio per choice")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = run_choices(args.choices, args.signal, args.sample_rate, args.chunk_size,
+                          args.channels, args.duration)
+    print(format_results(results), file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
@@ -0,0 +1,139 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from .processor import environment
+
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter so every import is cold
+PIPELINE_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import numpy as np
+from audio.processor import AudioProcessor
+from audio.backends import VirtualBackend
+imported = time.perf_counter()
+backend = VirtualBackend(np.zeros((64 * {chunk_size}, 1), dtype=np.float32), realtime=False)
+processor = AudioProcessor(chunk_size={chunk_size}, stream_backend=backend, noise_cache=None)
+processor.set_devices(VirtualBackend.INPUT_NAME, VirtualBackend.OUTPUT_NAME)
+constructed = time.perf_counter()
+processor.start_stream('callback')
+while processor.backend.first_block_at is None and processor.stream_thread.is_alive():
+    time.sleep(0.0005)
+first_block = processor.backend.first_block_at or time.perf_counter()
+processor.stop_processing()
+print(json.dumps({{
+    'import_processor': (imported - start) * 1000,
+    'processor_created': (constructed - start) * 1000,
+    'first_processed_block': (first_block - start) * 1000,
+}}))
+"""
+
+def import_times(module: str, min_ms: float = 5.0):
+    """Cumulative import time of ``module`` and every module it pulls in that takes at least ``min_ms``
+
+    Uses ``python -X importtime`` in a fresh interpreter.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=PYTHON_DIR, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        cumulative_ms = int(cumulative_us) / 1000
+        if cumulative_ms >= min_ms:
+            times[name.strip()] = {'self_ms': int(self_us) / 1000, 'cumulative_ms': cumulative_ms}
+    return times
+
+def pipeline_startup(chunk_size: int = 1024):
+    """Milliseconds from a cold start to importing, creating and running the processor headless"""
+    result = subprocess.run([sys.executable, '-c', PIPELINE_SCRIPT.format(chunk_size=chunk_size)],
+                            cwd=PYTHON_DIR, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def gui_startup(timeout: float = 60.0):
+    """Startup milestones of the real application, shown off screen, or None without PyQt6
+
+    The application starts processing on its default devices and quits
+    after the first processed block, so without sound devices that
+    milestone is missing.
+    """
+    env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get('QT_QPA_PLATFORM', 'offscreen'))
+    try:
+        result = subprocess.run([sys.executable, 'main.py', '--startup-report', '--exit-after-startup'],
+                                cwd=PYTHON_DIR, capture_output=True, text=True, env=env, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return None
+    if result.returncode:
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def median_runs(measure, runs: int):
+    """Median of every milestone reached in all runs, or None if a run could not measure"""
+    results = [measure() for _ in range(runs)]
+    if any(result is None for result in results):
+        return None
+    return {name: float(np.median([result[name] for result in results])) for name in results[0]
+            if all(name in result for result in results)}
+
+def format_report(report):
+    """Human readable startup report"""
+    lines = ["Import times (cumulative ms):"]
+    for name, times in report['imports'].items():
+        lines.append(f"  {name:<40} {times['cumulative_ms']:8.1f}")
+    for section in ('pipeline', 'gui'):
+        lines.append(f"{section.capitalize()} milestones (ms since start):")
+        if report[section] is None:
+            lines.append("  not available")
+            continue
+        for name, ms in report[section].items():
+            lines.append(f"  {name:<40} {ms:8.1f}")
+    return "\n".join(lines)
+
+def compare(base_path: str, new_path: str):
+    """Print the change of every milestone between two reports"""
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    for section in ('pipeline', 'gui'):
+        for name, ms in (new.get(section) or {}).items():
+            old = (base.get(section) or {}).get(name)
+            if old:
+                print(f"{section:>8} {name:<28} {old:8.1f} -> {ms:8.1f} ms ({100 * (ms - old) / old:+.1f}%)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure application startup time")
+    parser.add_argument("--module", default='audio.processor', help="module whose import time is broken down")
+    parser.add_argument("--min-ms", type=float, default=5.0, help="hide imports faster than this")
+    parser.add_argument("--runs", type=int, default=3, help="cold starts per measurement")
+    parser.add_argument("--no-gui", action='store_true', help="skip starting the real window")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"),
+                        help="compare two report files instead of running")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = {
+        'environment': environment(),
+        'imports': import_times(args.module, args.min_ms),
+        'pipeline': median_runs(pipeline_startup, args.runs),
+        'gui': None if args.no_gui else median_runs(gui_startup, args.runs),
+    }
+    print(format_report(report))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -1,13 +1,46 @@
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, 
                              QComboBox, QPushButton, QLabel, QStatusBar,
-                             QHBoxLayout, QSlider, QFrame)
-from PyQt6.QtCore import Qt, QTimer, QSettings
+                             QHBoxLayout, QSlider, QFrame, QFileDialog)
+from PyQt6.QtCore import Qt, QTimer, QSettings, pyqtSignal
 from PyQt6.QtGui import QIcon, QFont
-from audio.processor import AudioProcessor
+import queue
+import threading
+import time
+from typing import Optional
+from audio.engine import ENGINE_BUSY, EngineClient, EngineError
+from audio.models import SpectralGatingBackend, MaskModelBackend
+from .startup import StartupTimer
+
+# Returned by MainWindow.call_engine when the command failed
+ENGINE_FAILED = object()
+
+# Block sizes offered as the latency and CPU load trade-off
+LATENCY_PRESETS = (
+    (256, "Lowest latency (256 samples)"),
+    (512, "Low latency (512 samples)"),
+    (1024, "Balanced (1024 samples)"),
+    (2048, "Lowest CPU load (2048 samples)"),
+)
+
+class DeviceComboBox(QComboBox):
+    """Combo box that announces when its list is about to open"""
+    opening = pyqtSignal()
+    
+    def showPopup(self):
+        self.opening.emit()
+        super().showPopup()
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    # Emitted from the enumeration thread with the device list
+    devices_loaded = pyqtSignal(list)
+    # Emitted from the rescan thread, True if the device list changed
+    devices_rescanned = pyqtSignal(bool)
+    # Emitted from the command thread with the error of a failed command
+    engine_failed = pyqtSignal(str)
+    
+    def __init__(self, startup: Optional[StartupTimer] = None):
         super().__init__()
+        self.startup = startup
         self.setWindowTitle("AI Noise Cancellation")
         self.setMinimumSize(400, 500)
         
@@ -15,9 +48,20 @@ class MainWindow(QMainWindow):
         self.settings = QSettings('AINoiseCancellation', 'App')
         self.dark_mode = self.settings.value('dark_mode', False, type=bool)
         
-        # Initialize audio processor
-        self.audio_processor = AudioProcessor()
-        self.audio_processor.initialize_model()
+        # The audio stream and processing run in a separate engine process so
+        # the event loop cannot hold them up; it starts in the background
+        chunk_size = self.settings.value('chunk_size', 1024, type=int)
+        self.engine = EngineClient(chunk_size=chunk_size)
+        self.engine.start()
+        self._engine_restarted = False  # A new engine still needs the window's settings
+        self._engine_error = None  # Shown while idle after the engine stopped
+        self._stream_started_at = None  # perf_counter time the engine confirmed the stream start
+        
+        # Commands whose result is not needed are sent from a thread of their
+        # own, so they never hold up the event loop behind a slow command
+        self._commands = queue.Queue()
+        self.engine_failed.connect(self.on_engine_failed)
+        threading.Thread(target=self._send_commands, daemon=True).start()
         
         # Create central widget and layout
         central_widget = QWidget()
@@ -58,9 +102,11 @@ class MainWindow(QMainWindow):
         mic_label.setFont(QFont("Arial", 12))
         device_layout.addWidget(mic_label)
         
-        self.input_device_combo = QComboBox()
+        self.input_device_combo = DeviceComboBox()
         self.input_device_combo.setMinimumHeight(30)
-        self.refresh_devices()
+        self.input_device_combo.addItem("Loading devices...")
+        self.input_device_combo.setEnabled(False)
+        self.input_device_combo.opening.connect(self.rescan_devices)
         device_layout.addWidget(self.input_device_combo)
         
         # Output device (Speaker) selection
@@ -68,9 +114,11 @@ class MainWindow(QMainWindow):
         speaker_label.setFont(QFont("Arial", 12))
         device_layout.addWidget(speaker_label)
         
-        self.output_device_combo = QComboBox()
+        self.output_device_combo = DeviceComboBox()
         self.output_device_combo.setMinimumHeight(30)
-        self.refresh_output_devices()
+        self.output_device_combo.addItem("Loading devices...")
+        self.output_device_combo.setEnabled(False)
+        self.output_device_combo.opening.connect(self.rescan_devices)
         device_layout.addWidget(self.output_device_combo)
         
         layout.addWidget(device_frame)
@@ -85,13 +133,13 @@ class MainWindow(QMainWindow):
         volume_layout.addWidget(volume_label)
         
         volume_slider_layout = QHBoxLayout()
-        self.volume_label = QLabel(f"{int(self.audio_processor.output_volume * 100)}%")
+        self.volume_label = QLabel("100%")
         volume_slider_layout.addWidget(self.volume_label)
         
         self.volume_slider = QSlider(Qt.Orientation.Horizontal)
         self.volume_slider.setMinimum(0)
         self.volume_slider.setMaximum(100)
-        self.volume_slider.setValue(int(self.audio_processor.output_volume * 100))
+        self.volume_slider.setValue(100)
         self.volume_slider.valueChanged.connect(self.update_volume)
         volume_slider_layout.addWidget(self.volume_slider)
         
@@ -106,10 +154,51 @@ class MainWindow(QMainWindow):
         controls_frame.setFrameShape(QFrame.Shape.StyledPanel)
         controls_layout = QVBoxLayout(controls_frame)
         
+        # Processing mode selection
+        mode_label = QLabel("Processing Mode")
+        mode_label.setFont(QFont("Arial", 12))
+        controls_layout.addWidget(mode_label)
+        
+        self.mode_combo = QComboBox()
+        self.mode_combo.setMinimumHeight(30)
+        self.mode_combo.addItem("Threaded", 'threaded')
+        self.mode_combo.addItem("Inline (low latency)", 'callback')
+        self.mode_combo.setCurrentIndex(0)
+        controls_layout.addWidget(self.mode_combo)
+        
+        # Block size, switchable while processing
+        latency_label = QLabel("Latency")
+        latency_label.setFont(QFont("Arial", 12))
+        controls_layout.addWidget(latency_label)
+        
+        self.latency_combo = QComboBox()
+        self.latency_combo.setMinimumHeight(30)
+        for size, name in LATENCY_PRESETS:
+            self.latency_combo.addItem(name, size)
+        self.latency_combo.setCurrentIndex(max(self.latency_combo.findData(chunk_size), 0))
+        self._chunk_size = self.latency_combo.currentData()  # Block size the engine runs with
+        self.latency_combo.currentIndexChanged.connect(self.change_latency)
+        controls_layout.addWidget(self.latency_combo)
+        
+        # Denoising engine selection, switchable while processing
+        backend_label = QLabel("Denoising Engine")
+        backend_label.setFont(QFont("Arial", 12))
+        controls_layout.addWidget(backend_label)
+        
+        self.backend_combo = QComboBox()
+        self.backend_combo.setMinimumHeight(30)
+        self.backend_combo.addItem(SpectralGatingBackend.label, SpectralGatingBackend.name)
+        self.backend_combo.addItem(MaskModelBackend.label, MaskModelBackend.name)
+        self.backend_combo.setCurrentIndex(0)
+        self._backend_name = SpectralGatingBackend.name  # Engine the processor runs
+        self.backend_combo.currentIndexChanged.connect(self.change_backend)
+        controls_layout.addWidget(self.backend_combo)
+        
         # Start/Stop button
         self.start_button = QPushButton("Start")
         self.start_button.setMinimumHeight(40)
         self.start_button.clicked.connect(self.toggle_processing)
+        self.start_button.setEnabled(False)  # Until the devices are listed
         controls_layout.addWidget(self.start_button)
         
         # Filter toggle button
@@ -128,6 +217,22 @@ class MainWindow(QMainWindow):
         self.feedback_button.clicked.connect(self.toggle_feedback)
         controls_layout.addWidget(self.feedback_button)
         
+        # Diagnostics toggle button
+        self.diagnostics_button = QPushButton("Diagnostics: On")
+        self.diagnostics_button.setCheckable(True)
+        self.diagnostics_button.setChecked(True)
+        self.diagnostics_button.setMinimumHeight(40)
+        self.diagnostics_button.clicked.connect(self.toggle_diagnostics)
+        controls_layout.addWidget(self.diagnostics_button)
+        
+        # Recording toggle button, captures the input and output to files
+        self.recording_button = QPushButton("Recording: Off")
+        self.recording_button.setCheckable(True)
+        self.recording_button.setChecked(False)
+        self.recording_button.setMinimumHeight(40)
+        self.recording_button.clicked.connect(self.toggle_recording)
+        controls_layout.addWidget(self.recording_button)
+        
         layout.addWidget(controls_frame)
         
         # Add stretch to push everything up
@@ -149,37 +254,223 @@ class MainWindow(QMainWindow):
         # Apply initial theme
         self.update_theme()
         
+        # Enumerate devices in the background so the window shows right away
+        self._devices_version = None  # Engine device list version shown, None while loading
+        self._rescanning = False
+        self.devices_loaded.connect(self.on_devices_loaded)
+        self.devices_rescanned.connect(self.on_devices_rescanned)
+        self.load_devices()
+        
+        # Pick up devices the engine's registry found by itself
+        self.device_timer = QTimer()
+        self.device_timer.timeout.connect(self.check_devices)
+        self.device_timer.start(2000)
+        
+    def load_devices(self):
+        """Wait for the engine and list the audio devices on a background thread"""
+        diagnostics = self.diagnostics_button.isChecked()
+        def enumerate_devices():
+            version = -1  # Never current, so check_devices retries after a failure
+            try:
+                self.engine.enable_instrumentation(diagnostics)
+                version = self.engine.get('devices_version')['devices_version']
+                devices = list(self.engine.get_available_devices())
+            except Exception as e:
+                print(f"Error listing audio devices: {e}")
+                devices = []
+            self.devices_loaded.emit(devices)
+            self._devices_version = version
+        threading.Thread(target=enumerate_devices, daemon=True).start()
+        
+    def rescan_devices(self):
+        """Have the engine look for newly plugged in devices on a background thread
+        
+        The thread signals when the rescan has finished, and the lists are
+        reloaded if the devices changed.
+        """
+        if not self.engine.ready or self._rescanning:
+            return
+        self._rescanning = True
+        engine = self.engine
+        def rescan():
+            changed = False
+            try:
+                changed = engine.refresh_devices()
+            except Exception as e:
+                print(f"Error rescanning audio devices: {e}")
+            self.devices_rescanned.emit(bool(changed))
+        threading.Thread(target=rescan, daemon=True).start()
+        
+    def on_devices_rescanned(self, changed):
+        """Reload the device lists after a rescan that found a change"""
+        self._rescanning = False
+        if changed and self._devices_version is not None:
+            self._devices_version = None
+            self.load_devices()
+        
+    def check_devices(self):
+        """Reload the device lists when the engine's device list has changed
+        
+        Runs on the event loop, so it skips its turn rather than wait while
+        another command, such as a rescan, has the engine.
+        """
+        if self._rescanning or self._devices_version is None:
+            return
+        try:
+            result = self.engine.try_call('get', 'devices_version')
+        except EngineError:
+            return
+        if result is ENGINE_BUSY:
+            return
+        if result['devices_version'] != self._devices_version:
+            self._devices_version = None
+            self.load_devices()
+        
+    def on_devices_loaded(self, devices):
+        """Fill the device lists once enumeration has finished"""
+        self.refresh_devices(devices)
+        self.refresh_output_devices(devices)
+        self.input_device_combo.setEnabled(True)
+        self.output_device_combo.setEnabled(True)
+        self.start_button.setEnabled(True)
+        if self.startup is not None:
+            self.startup.mark('devices_listed')
+        
+    def call_engine(self, command, *args, **kwargs):
+        """Run an engine command, showing a failure in the status bar instead of raising
+
+        Returns ENGINE_FAILED if the command failed. If the engine process
+        died, processing is shown as stopped and the next command launches
+        a new engine.
+        """
+        return self._run_engine_command(self.engine.call, command, args, kwargs)
+        
+    def poll_engine(self, command, *args, **kwargs):
+        """Like call_engine, but return ENGINE_BUSY at once while another command has the engine"""
+        return self._run_engine_command(self.engine.try_call, command, args, kwargs)
+        
+    def send_engine(self, command, *args, **kwargs):
+        """Queue an engine command whose result is not needed; failures show up like call_engine's"""
+        self._commands.put((command, args, kwargs))
+        
+    def _run_engine_command(self, call, command, args, kwargs):
+        """Run a command with ``call``, handling failures for call_engine and poll_engine"""
+        try:
+            result = call(command, *args, **kwargs)
+        except EngineError as e:
+            self.on_engine_failed(str(e))
+            return ENGINE_FAILED
+        if result is not ENGINE_BUSY:
+            self._engine_error = None
+        return result
+        
+    def _send_commands(self):
+        """Forward queued commands to the engine in order, off the event loop"""
+        while True:
+            command, args, kwargs = self._commands.get()
+            try:
+                self.engine.call(command, *args, **kwargs)
+            except EngineError as e:
+                self.engine_failed.emit(str(e))
+        
+    def on_engine_failed(self, message):
+        """Show a failed command, replacing the engine if its process died"""
+        print(f"Audio engine error: {message}")
+        self.status_bar.showMessage(f"Error: {message}")
+        if not self.engine.alive:
+            self.restart_engine()
+        
+    def restart_engine(self):
+        """Replace a dead engine and reset the processing buttons"""
+        self.engine.close()
+        self.engine = EngineClient(chunk_size=self._chunk_size)
+        self.engine.start()
+        self._engine_restarted = True
+        self._engine_error = "Error: Audio engine stopped, restarting it"
+        self._stream_started_at = None
+        self.start_button.setText("Start Processing")
+        self.mode_combo.setEnabled(True)
+        self.is_processing = False
+        self.recording_button.setChecked(False)
+        self.recording_button.setText("Recording: Off")
+        self.backend_combo.blockSignals(True)
+        self.backend_combo.setCurrentIndex(0)
+        self.backend_combo.blockSignals(False)
+        self._backend_name = SpectralGatingBackend.name
+        
     def closeEvent(self, event):
         """Handle window close event"""
-        # Stop processing if it's running
-        if self.is_processing:
-            self.audio_processor.stop_processing()
+        # Shutting the engine down also stops any processing
+        self.engine.close()
         event.accept()
         
     def update_status(self):
         """Update status bar with current processing state"""
+        if not self.is_processing:
+            if self._engine_error is not None:
+                self.status_bar.showMessage(self._engine_error)
+            else:
+                self.status_bar.showMessage("Ready" if self.engine.ready else "Starting audio engine...")
+            return
+        # Keep the last status rather than wait behind another command
+        engine = self.poll_engine('status')
+        if engine is ENGINE_FAILED or engine is ENGINE_BUSY:
+            return
         status = "Processing audio..."
-        if not self.audio_processor.filter_enabled:
+        latency = engine['latency']
+        status += f" ({latency['round_trip_ms']:.0f} ms latency)"
+        stats = engine['instrumentation']
+        if stats is not None and stats['block']['count']:
+            status += (f" CPU {stats['block']['mean_ms']:.1f} ms/block ({stats['load']:.0%}),"
+                       f" {stats['deadline_misses']} missed")
+        backend = engine['backend']
+        cost = backend['cost']
+        if cost['count']:
+            status += f" [{backend['label']}: {cost['mean_ms']:.1f} ms/block]"
+        if engine['reconfiguring']:
+            status += " (Changing latency...)"
+        quality = engine['quality']
+        if quality['level']:
+            status += f" (Reduced quality: {quality['name']})"
+        if not engine['filter_enabled']:
             status += " (Noise Cancellation Off)"
-        if not self.audio_processor.feedback_enabled:
+        if not engine['feedback_enabled']:
             status += " (Audio Feedback Off)"
-        self.status_bar.showMessage(status if self.is_processing else "Ready")
-        
-    def refresh_devices(self):
-        """Refresh the list of available input devices"""
+        recording = engine['recording']
+        if recording is not None:
+            dropped = recording['input']['dropped_blocks'] + recording['output']['dropped_blocks']
+            status += f" (Recording, {dropped} blocks dropped)" if dropped else " (Recording)"
+        self.status_bar.showMessage(status)
+        # The engine reports the delay after its start_stream returned, which is when it replied
+        if self.startup is not None and self._stream_started_at is not None and \
+                backend['first_block_after'] is not None:
+            self.startup.mark('first_processed_block', self._stream_started_at + backend['first_block_after'])
+        
+    def refresh_devices(self, devices=None):
+        """Refresh the list of available input devices, keeping the selection if still present"""
+        if devices is None:
+            devices = self.call_engine('get_available_devices')
+            if devices is ENGINE_FAILED:
+                return
+        selected = self.input_device_combo.currentText()
         self.input_device_combo.clear()
-        devices = self.audio_processor.get_available_devices()
         for device in devices:
             if device['max_input_channels'] > 0:  # Only show input devices
                 self.input_device_combo.addItem(device['name'])
+        self.input_device_combo.setCurrentText(selected)
                 
-    def refresh_output_devices(self):
-        """Refresh the list of available output devices"""
+    def refresh_output_devices(self, devices=None):
+        """Refresh the list of available output devices, keeping the selection if still present"""
+        if devices is None:
+            devices = self.call_engine('get_available_devices')
+            if devices is ENGINE_FAILED:
+                return
+        selected = self.output_device_combo.currentText()
         self.output_device_combo.clear()
-        devices = self.audio_processor.get_available_devices()
         for device in devices:
             if device['max_output_channels'] > 0:  # Only show output devices
                 self.output_device_combo.addItem(device['name'])
+        self.output_device_combo.setCurrentText(selected)
                 
     def toggle_processing(self):
         """Toggle audio processing on/off"""
@@ -187,44 +478,129 @@ class MainWindow(QMainWindow):
             # Start processing
             input_device_name = self.input_device_combo.currentText()
             output_device_name = self.output_device_combo.currentText()
+            if self._engine_restarted:
+                # The engine was replaced after it stopped; it starts from the defaults
+                if self.call_engine('set', filter_enabled=self.filter_button.isChecked(),
+                                    feedback_enabled=self.feedback_button.isChecked(),
+                                    output_volume=self.volume_slider.value() / 100.0) is ENGINE_FAILED:
+                    return
+                self.call_engine('enable_instrumentation', self.diagnostics_button.isChecked())
+                self._engine_restarted = False
             
-            if self.audio_processor.set_devices(input_device_name, output_device_name):
-                self.audio_processor.is_running = True
-                self.audio_processor.start_processing()  # Start processing thread first
-                self.audio_processor.start_stream()      # Then start audio stream
+            found = self.call_engine('set_devices', input_device_name, output_device_name)
+            if found is ENGINE_FAILED:
+                return
+            if found:
+                # Starts the processing thread too when running threaded
+                if self.call_engine('start_stream', self.mode_combo.currentData()) is ENGINE_FAILED:
+                    return
+                self._stream_started_at = time.perf_counter()
+                if self.startup is not None:
+                    self.startup.mark('stream_started', self._stream_started_at)
                 self.start_button.setText("Stop Processing")
+                self.mode_combo.setEnabled(False)
                 self.is_processing = True
             else:
                 self.status_bar.showMessage("Error: Could not set audio devices")
         else:
             # Stop processing
-            self.audio_processor.stop_processing()
+            self.call_engine('stop_processing')
             self.start_button.setText("Start Processing")
+            self.mode_combo.setEnabled(True)
             self.is_processing = False 
         
+    def change_backend(self, index):
+        """Switch the denoising engine, loading the mask model on first use"""
+        name = self.backend_combo.itemData(index)
+        previous = self.backend_combo.findData(self._backend_name)
+        status = self.call_engine('status')
+        if status is ENGINE_FAILED:
+            result = ENGINE_FAILED
+        elif name in status['backends']:
+            result = self.call_engine('set_backend', name)
+        else:
+            model_path = self.settings.value('mask_model_path', '', type=str)
+            if not model_path:
+                model_path, _ = QFileDialog.getOpenFileName(
+                    self, "Select TorchScript mask model", "", "TorchScript models (*.pt *.pth *.ts)")
+            if not model_path:
+                self.status_bar.showMessage("Error: No model selected")
+                result = ENGINE_FAILED
+            else:
+                result = self.call_engine('initialize_model', name, model_path=model_path)
+                if result is ENGINE_FAILED:
+                    self.settings.remove('mask_model_path')  # Ask for a model again next time
+                else:
+                    self.settings.setValue('mask_model_path', model_path)
+        if result is ENGINE_FAILED:
+            self.backend_combo.blockSignals(True)
+            self.backend_combo.setCurrentIndex(previous)
+            self.backend_combo.blockSignals(False)
+        else:
+            self._backend_name = name
+            
+    def change_latency(self, index):
+        """Switch the block size, without stopping the audio while processing"""
+        chunk_size = self.latency_combo.itemData(index)
+        if self.call_engine('reconfigure', chunk_size=chunk_size) is ENGINE_FAILED:
+            self.latency_combo.blockSignals(True)
+            self.latency_combo.setCurrentIndex(self.latency_combo.findData(self._chunk_size))
+            self.latency_combo.blockSignals(False)
+        else:
+            self._chunk_size = chunk_size
+            self.settings.setValue('chunk_size', chunk_size)
+            
     def toggle_filter(self):
         """Toggle noise suppression filter on/off"""
-        self.audio_processor.filter_enabled = self.filter_button.isChecked()
-        self.filter_button.setText(f"Noise Cancellation: {'On' if self.audio_processor.filter_enabled else 'Off'}")
+        enabled = self.filter_button.isChecked()
+        self.send_engine('set', filter_enabled=enabled)
+        self.filter_button.setText(f"Noise Cancellation: {'On' if enabled else 'Off'}")
         
     def toggle_feedback(self):
         """Toggle audio feedback on/off"""
-        self.audio_processor.feedback_enabled = self.feedback_button.isChecked()
-        self.feedback_button.setText(f"Audio Feedback: {'On' if self.audio_processor.feedback_enabled else 'Off'}")
+        enabled = self.feedback_button.isChecked()
+        self.send_engine('set', feedback_enabled=enabled)
+        self.feedback_button.setText(f"Audio Feedback: {'On' if enabled else 'Off'}")
+        
+    def toggle_diagnostics(self):
+        """Toggle hot-path instrumentation on/off"""
+        enabled = self.diagnostics_button.isChecked()
+        self.send_engine('enable_instrumentation', enabled)
+        self.diagnostics_button.setText(f"Diagnostics: {'On' if enabled else 'Off'}")
+        
+    def toggle_recording(self):
+        """Start or stop recording the input and output to WAV files"""
+        if self.recording_button.isChecked():
+            directory = self.settings.value('recording_directory', '', type=str)
+            if not directory:
+                directory = QFileDialog.getExistingDirectory(self, "Select a folder for recordings")
+            if not directory:
+                self.status_bar.showMessage("Error: No folder selected")
+                self.recording_button.setChecked(False)
+            elif self.call_engine('start_recording', directory) is ENGINE_FAILED:
+                self.settings.remove('recording_directory')  # Ask for a folder again next time
+                self.recording_button.setChecked(False)
+            else:
+                self.settings.setValue('recording_directory', directory)
+        else:
+            stats = self.call_engine('stop_recording')
+            if stats is not None and stats is not ENGINE_FAILED:
+                self.status_bar.showMessage(f"Recorded {stats['output']['seconds']:.0f} s to {stats['directory']}")
+        self.recording_button.setText(f"Recording: {'On' if self.recording_button.isChecked() else 'Off'}")
         
     def update_noise_threshold(self, value):
         """Update noise threshold value"""
-        self.audio_processor.noise_threshold = value / 1000.0
-        self.noise_threshold_label.setText(f"{self.audio_processor.noise_threshold:.3f}")
+        self.send_engine('set', noise_threshold=value / 1000.0)
+        self.noise_threshold_label.setText(f"{value / 1000.0:.3f}")
         
     def update_voice_threshold(self, value):
         """Update voice threshold value"""
-        self.audio_processor.voice_threshold = value / 100.0
-        self.voice_threshold_label.setText(f"{self.audio_processor.voice_threshold:.3f}")
+        self.send_engine('set', voice_threshold=value / 100.0)
+        self.voice_threshold_label.setText(f"{value / 100.0:.3f}")
         
     def update_volume(self, value):
         """Update output volume value"""
-        self.audio_processor.output_volume = value / 100.0
+        self.send_engine('set', output_volume=value / 100.0)
         self.volume_label.setText(f"{value}%")
         
     def toggle_theme(self):
@@ -0,0 +1,32 @@
+import json
+import time
+from typing import Optional
+
+class StartupTimer:
+    """Milestones of application startup in milliseconds since ``start``
+
+    Only the first time a milestone is reached is kept, so marks can be
+    placed on paths that run more than once.
+    """
+
+    def __init__(self, start: Optional[float] = None):
+        self.start = start if start is not None else time.perf_counter()
+        self.milestones = {}
+
+    def mark(self, name: str, at: Optional[float] = None):
+        """Record that ``name`` was reached now, or at the perf_counter time ``at``"""
+        if name not in self.milestones:
+            moment = at if at is not None else time.perf_counter()
+            self.milestones[name] = (moment - self.start) * 1000
+
+    def report(self):
+        """Milestones in the order they were reached"""
+        return dict(sorted(self.milestones.items(), key=lambda item: item[1]))
+
+    def format(self):
+        """One line per milestone"""
+        return "\n".join(f"{name:>24}: {ms:8.1f} ms" for name, ms in self.report().items())
+
+    def to_json(self):
+        """Milestones as a JSON object"""
+        return json.dumps(self.report())
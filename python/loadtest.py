@@ -0,0 +1,5 @@
+import sys
+from benchmarks.end_to_end import main
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,12 +1,48 @@
 import sys
+import time
+
+# Measure startup from the first line of the application
+_start = time.perf_counter()
+
+from gui.startup import StartupTimer
+startup = StartupTimer(_start)
+
 from PyQt6.QtWidgets import QApplication
+from PyQt6.QtCore import QTimer
+startup.mark('qt_imported')
 from gui.main_window import MainWindow
+startup.mark('app_imported')
+
+# Seconds --exit-after-startup waits for the first processed block, e.g.
+# on a machine without sound devices, before quitting without it
+STARTUP_TIMEOUT = 20.0
 
 def main():
     app = QApplication(sys.argv)
-    window = MainWindow()
+    window = MainWindow(startup)
     window.show()
+    app.processEvents()
+    startup.mark('window_shown')
+    
+    # --startup-report prints the milestones as JSON on exit;
+    # --exit-after-startup starts processing on the selected devices once
+    # they are listed and quits when the engine has processed a block
+    if '--startup-report' in sys.argv:
+        app.aboutToQuit.connect(lambda: print(startup.to_json()))
+    if '--exit-after-startup' in sys.argv:
+        started = []  # Processing is only started once, even if that fails
+        def quit_when_started():
+            if 'first_processed_block' in startup.milestones or \
+                    time.perf_counter() - _start > STARTUP_TIMEOUT:
+                window.close()  # Shuts the engine down
+                app.quit()
+            elif 'devices_listed' in startup.milestones and not started:
+                started.append(True)
+                window.toggle_processing()
+        exit_timer = QTimer()
+        exit_timer.timeout.connect(quit_when_started)
+        exit_timer.start(10)
     sys.exit(app.exec())
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
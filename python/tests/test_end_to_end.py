@@ -0,0 +1,15 @@
+import numpy as np
+import pytest
+
+from benchmarks.end_to_end import run_end_to_end
+from benchmarks.signals import SIGNALS
+
+@pytest.mark.parametrize('mode', ['threaded', 'callback'])
+def test_fast_stream_keeps_the_pipeline_fed(mode):
+    audio = SIGNALS['speech+pink'](2.0, 16000, 1)
+    output, report = run_end_to_end(audio, 16000, 320, mode, realtime=False)
+    assert report['blocks'] == len(audio) // 320
+    # Only the first threaded block comes before anything was processed
+    assert report['fallback_raw'] <= (1 if mode == 'threaded' else 0)
+    assert report['overruns'] == 0
+    assert np.all(np.isfinite(output))
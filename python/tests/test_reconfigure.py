@@ -0,0 +1,73 @@
+import contextlib
+import io
+import time
+
+import numpy as np
+import pytest
+
+from audio.backends import VirtualBackend
+from audio.engine import SharedBlockRing, SharedMemoryBackend
+from audio.processor import AudioProcessor
+
+SAMPLE_RATE = 16000
+
+def create_processor(chunk_size: int = 320, **options):
+    return AudioProcessor(sample_rate=SAMPLE_RATE, chunk_size=chunk_size, noise_cache=None, **options)
+
+def wait_for_adoption(processor, timeout: float = 5.0):
+    deadline = time.perf_counter() + timeout
+    while processor.reconfiguring and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    assert not processor.reconfiguring
+
+def test_adopt_keeps_the_learned_profile():
+    processor = create_processor()
+    rng = np.random.default_rng(0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(60):
+            processor._apply_noise_suppression(rng.normal(0, 0.01, (320, 1)))
+        learned = processor.noise_samples
+        processor.reconfigure(sample_rate=8000, chunk_size=640)
+        wait_for_adoption(processor)
+
+    assert (processor.sample_rate, processor.chunk_size) == (8000, 640)
+    assert processor.input_buffer.frames == processor.output_buffer.frames == 640
+    assert processor.noise_samples == learned > 0
+    assert processor.noise_profile.shape[-1] == processor.fft_size // 2 + 1
+    output = processor._apply_noise_suppression(rng.normal(0, 0.01, (640, 1)))
+    assert np.all(np.isfinite(output))
+
+def test_reconfigure_while_streaming_continues_the_recording():
+    audio = (0.1 * np.sin(np.arange(int(SAMPLE_RATE * 1.5)) / 10)).astype(np.float32)[:, np.newaxis]
+    backend = VirtualBackend(audio, realtime=True)
+    processor = create_processor(input_device=VirtualBackend.INPUT_NAME, output_device=VirtualBackend.OUTPUT_NAME,
+                                 stream_backend=backend)
+    processor.filter_enabled = False
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor.start_stream('threaded')
+        time.sleep(0.5)
+        processor.reconfigure(chunk_size=640)
+        assert backend.wait(10)
+        processor.stream_thread.join(10)
+        processor.stop_processing()
+
+    assert processor.chunk_size == backend.stream.blocksize == 640
+    # The reopened stream carried on where the first one stopped
+    assert len(audio) - backend.position < 640
+    assert np.any(backend.output[-1000:] != 0)
+
+def test_reconfigure_rejects_block_sizes_the_backend_cannot_stream():
+    input_ring, output_ring = SharedBlockRing(frames=320), SharedBlockRing(frames=320)
+    try:
+        processor = create_processor(stream_backend=SharedMemoryBackend(input_ring.name, output_ring.name))
+        with pytest.raises(ValueError):
+            processor.reconfigure(chunk_size=640)
+        assert not processor.reconfiguring
+        # The block size stays, so changing the sample rate alone is fine
+        with contextlib.redirect_stdout(io.StringIO()):
+            processor.reconfigure(sample_rate=8000)
+            wait_for_adoption(processor)
+        assert (processor.sample_rate, processor.chunk_size) == (8000, 320)
+    finally:
+        input_ring.close()
+        output_ring.close()
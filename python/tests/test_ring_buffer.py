@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from audio.ring_buffer import BlockRingBuffer
+
+def block(value: float, frames: int = 4, channels: int = 2):
+    return np.full((frames, channels), value, dtype=np.float32)
+
+def test_wraparound_keeps_order_and_tags():
+    ring = BlockRingBuffer(3, 4, 2)
+    out = np.empty((4, 2), dtype=np.float32)
+    # Interleave writes and reads so the indices pass the end of the ring many times
+    written = read = 0
+    for step in range(50):
+        for _ in range(step % 3 + 1):
+            if ring.write(block(written), tag=written):
+                written += 1
+        while len(ring) > step % 2:
+            assert ring.read(out)
+            assert out[0, 0] == read and ring.last_tag == read
+            read += 1
+    assert ring.writes == written and ring.reads == read
+    assert ring.underruns == 0
+
+def test_overrun_drops_the_incoming_block():
+    ring = BlockRingBuffer(2, 4, 2)
+    assert ring.write(block(1)) and ring.write(block(2))
+    assert not ring.write(block(3))
+    assert ring.overruns == 1 and len(ring) == 2
+    out = np.empty((4, 2), dtype=np.float32)
+    ring.read(out)
+    assert out[0, 0] == 1
+
+@pytest.mark.parametrize('policy, expected', [('repeat', 5), ('silence', 0), (None, -1)])
+def test_underrun_policies(policy, expected):
+    ring = BlockRingBuffer(2, 4, 2, underrun_policy=policy)
+    out = np.empty((4, 2), dtype=np.float32)
+    ring.write(block(5))
+    ring.read(out)
+    out.fill(-1)
+    assert not ring.read(out)
+    assert ring.underruns == 1
+    assert np.all(out == expected)
+
+def test_discard_and_broadcast_read():
+    ring = BlockRingBuffer(4, 4, 1)
+    for value in range(3):
+        ring.write(block(value, channels=1))
+    assert ring.discard(5) == 3 and len(ring) == 0
+    ring.write(block(7, channels=1))
+    # A mono ring can be read into a stereo block
+    out = np.empty((4, 2), dtype=np.float32)
+    assert ring.read(out)
+    assert np.all(out == 7)
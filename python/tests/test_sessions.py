@@ -0,0 +1,45 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from audio.sessions import SessionEngine
+from audio.suppressor import NoiseSuppressor
+
+SAMPLE_RATE, CHUNK_SIZE = 16000, 320
+
+def noisy_speech(seconds: float = 4.0):
+    """Gated tone standing in for speech over white noise and 50 Hz hum"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    speech = 0.3 * np.sin(2 * np.pi * 220 * t) * (np.sin(2 * np.pi * 0.5 * t) > 0.3)
+    return speech + rng.normal(0, 0.01, t.size) + 0.02 * np.sin(2 * np.pi * 50 * t)
+
+SETTINGS = [dict(noise_estimator=estimator, vad_enabled=vad, hum_removal=hum, gain_release_time=release)
+            for estimator, vad, hum, release in itertools.product(['learned', 'tracking'], [True, False],
+                                                                   [True, False], [0.0, 0.05])]
+
+@pytest.mark.parametrize('settings', SETTINGS)
+def test_sessions_match_noise_suppressor(settings):
+    audio = noisy_speech()
+    engine = SessionEngine(sample_rate=SAMPLE_RATE, chunk_size=CHUNK_SIZE)
+    for name, value in settings.items():
+        setattr(engine.template, name, value)
+    stereo = engine.add_session(channels=2)
+    mono = engine.add_session()
+    quiet = engine.add_session(noise_threshold=0.5)
+
+    suppressor = NoiseSuppressor(sample_rate=SAMPLE_RATE, channels=1, chunk_size=CHUNK_SIZE)
+    for name, value in settings.items():
+        setattr(suppressor, name, value)
+
+    for index, start in enumerate(range(0, len(audio) - CHUNK_SIZE, CHUNK_SIZE)):
+        block = audio[start:start + CHUNK_SIZE]
+        blocks = {stereo: np.stack([block, 0.5 * block], axis=1), mono: block.copy()}
+        # Sessions that skip blocks must not disturb the others
+        if index % 3:
+            blocks[quiet] = 0.1 * block[:, np.newaxis]
+        result = engine.process(blocks)
+        assert result[stereo].shape == (CHUNK_SIZE, 2) and result[mono].shape == (CHUNK_SIZE,)
+        expected = suppressor._apply_noise_suppression(block.reshape(-1, 1))
+        np.testing.assert_allclose(result[mono], np.asarray(expected).reshape(-1), atol=1e-9)
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from audio.stft import StreamingSTFT
+
+def identity(spectra):
+    return spectra
+
+def delayed(audio, delay: int):
+    """``audio`` shifted later by ``delay`` samples, as the STFT outputs it"""
+    expected = np.zeros_like(audio)
+    expected[delay:] = audio[:len(audio) - delay]
+    return expected
+
+@pytest.mark.parametrize('hop_size', [128, 256, 512])
+@pytest.mark.parametrize('method', ['process', 'process_batch', 'bypass'])
+def test_perfect_reconstruction(hop_size, method):
+    rng = np.random.default_rng(0)
+    audio = rng.standard_normal((8192, 2))
+    stft = StreamingSTFT(1024, hop_size, channels=2)
+    out = np.empty_like(audio)
+    for start in range(0, len(audio), 1024):
+        block = audio[start:start + 1024]
+        if method == 'bypass':
+            stft.bypass(block, out=out[start:start + 1024])
+        else:
+            getattr(stft, method)(block, identity, out=out[start:start + 1024])
+    np.testing.assert_allclose(out, delayed(audio, stft.latency), atol=1e-12)
+
+def test_mixed_methods_reconstruct():
+    rng = np.random.default_rng(1)
+    audio = rng.standard_normal(16 * 512)
+    stft = StreamingSTFT(1024, 256)
+    methods = [lambda block: stft.process(block, identity), lambda block: stft.process_batch(block, identity),
+               stft.bypass]
+    out = np.concatenate([methods[i % 3](audio[i * 512:(i + 1) * 512]) for i in range(16)])
+    np.testing.assert_allclose(out, delayed(audio, stft.latency), atol=1e-12)
+
+def test_float32_reconstruction():
+    rng = np.random.default_rng(2)
+    audio = rng.standard_normal((4096, 1)).astype(np.float32)
+    stft = StreamingSTFT(512, 128, dtype=np.float32)
+    out = np.concatenate([stft.process(audio[i:i + 512], identity) for i in range(0, len(audio), 512)])
+    assert out.dtype == np.float32
+    np.testing.assert_allclose(out, delayed(audio, stft.latency), atol=1e-5)
+
+def test_block_must_be_whole_hops():
+    with pytest.raises(ValueError):
+        StreamingSTFT(1024, 256).process(np.zeros(300), identity)
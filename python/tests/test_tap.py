@@ -0,0 +1,51 @@
+import contextlib
+import io
+
+import numpy as np
+
+from audio.backends import VirtualBackend
+from audio.processor import AudioProcessor
+from audio.tap import INPUT, OUTPUT, TapRecorder
+from audio.wavio import WavReader
+
+def run_recording(directory, backend, channels: int, sample_rate: int = 16000, chunk_size: int = 320):
+    """Stream the backend's recording through a processor while recording the tap, returning the stats"""
+    processor = AudioProcessor(sample_rate=sample_rate, channels=channels, chunk_size=chunk_size,
+                               input_device=VirtualBackend.INPUT_NAME, output_device=VirtualBackend.OUTPUT_NAME,
+                               stream_mode='callback', noise_cache=None, stream_backend=backend)
+    processor.filter_enabled = False  # Plays the input through, so the output is not silent while learning
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor.start_recording(str(directory))
+        processor.start_stream()
+        assert backend.wait(10)
+        processor.stream_thread.join(10)
+        processor.stop_processing()
+        return processor, processor.stop_recording()
+
+def test_mono_input_with_stereo_output(tmp_path):
+    audio = (0.1 * np.sin(np.arange(16000) / 10)).astype(np.float32)[:, np.newaxis]
+    backend = VirtualBackend(audio, realtime=False, output_channels=2)
+    processor, stats = run_recording(tmp_path, backend, channels=2)
+
+    assert processor.channels == 1
+    assert processor.output_channels == 2
+    for point, channels in (('input', 1), ('output', 2)):
+        assert stats[point]['dropped_blocks'] == 0
+        assert stats[point]['seconds'] > 0.9
+        with WavReader(stats[point]['files'][0]) as reader:
+            assert reader.channels == channels
+    # The mono output is played on both channels
+    with WavReader(stats['output']['files'][0]) as reader:
+        output = reader.read(0, reader.frames)
+        np.testing.assert_array_equal(output[:, 0], output[:, 1])
+        assert np.abs(output).max() > 0
+
+def test_separate_channel_counts(tmp_path):
+    tap = TapRecorder(str(tmp_path), 16000, 160, (1, 2), flush_interval=0.01)
+    tap.record(INPUT, np.zeros((160, 1), dtype=np.float32))
+    tap.record(OUTPUT, np.zeros((160, 2), dtype=np.float32))
+    tap = tap.reopen(8000, 80, (2, 2))
+    assert tap.channels == (2, 2)
+    tap.record(INPUT, np.zeros((80, 2), dtype=np.float32))
+    tap.close()
+    assert tap.stats()['input']['dropped_blocks'] == 0